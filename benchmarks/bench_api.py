@@ -0,0 +1,261 @@
+"""End-to-end benchmark of the loans API through the Django test client
+
+Drives create, retrieve, update, destroy and filter for loan terms from 1 to 50 years on
+portfolios of increasing size, recording latency percentiles, query counts and peak memory
+per endpoint, then compares them against a stored baseline. A throwaway test database is
+created, so any configured database works, SQLite being the usual stand-in.
+
+Run from the repository root:
+    python benchmarks/bench_api.py                       # compare against benchmarks/baseline.json
+    python benchmarks/bench_api.py --write-baseline      # record a new baseline
+    python benchmarks/bench_api.py --portfolio-sizes 1000 10000 100000 --fail-on-regression
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment
+from django.urls import reverse
+from django.utils.http import urlencode
+from rest_framework.test import APIClient
+from loans.helper_functions import FILTER_DEFAULTS
+from loans.models import Loan, Repayment
+from loans.schedule import schedule_for_loan
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+LOAN_TERMS = (1, 10, 25, 50)
+# Filters run against the whole portfolio, a narrow range and the full range
+FILTER_QUERIES = {
+    'narrow': {'loan_amount_lower': 10000, 'loan_amount_upper': 20000, 'loan_term_lower': 1, 'loan_term_upper': 2},
+    'all': {},
+}
+
+
+def seed(no_of_loans):
+    """Add a background portfolio of one year loans and their repayments"""
+
+    random.seed(0)
+    for start in range(0, no_of_loans, 10000):
+        batch_size = min(10000, no_of_loans - start)
+        Loan.objects.bulk_create(
+            Loan(
+                loan_amount=Decimal(random.randrange(1000, 1000000)),
+                loan_term=1,
+                interest_rate=Decimal(random.randrange(100, 3600)) / 100,
+                loan_year=random.randint(2017, 2050),
+                loan_month=str(random.randint(1, 12)),
+            )
+            for x in range(batch_size)
+        )
+        repayment_list = []
+        for loan in Loan.objects.order_by('-id')[:batch_size]:
+            repayment_list.extend(schedule_for_loan(loan).to_repayments(loan))
+        Repayment.objects.bulk_create(repayment_list, batch_size=5000)
+
+
+
+def percentile(values, fraction):
+    """Value below which the given fraction of values fall, by nearest rank"""
+
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+
+def measure(send_requests):
+    """Send requests, returning latency percentiles, median query count and peak request memory
+
+    send_requests is called with a function that sends one request and must be given a callable
+    sending it. Latency and queries are taken from every request, peak memory from a final
+    request sent with allocation tracing on, as tracing slows requests down.
+    """
+
+    latencies = []
+    query_counts = []
+
+    def timed(request):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request()
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            latencies.append((time.perf_counter() - start) * 1000)
+        query_counts.append(len(queries.captured_queries))
+        if response.status_code >= 400:
+            raise Exception(f'Request failed with status {response.status_code}: {response.content[:200]}')
+        return response
+
+    def traced(request):
+        tracemalloc.start()
+        try:
+            request()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    peak_memory = send_requests(timed, traced)
+    return {
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p90_ms': round(percentile(latencies, 0.9), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'queries': statistics.median(query_counts),
+        'peak_kib': round(peak_memory / 1024, 1),
+    }
+
+
+
+def run_terms(client, loan_term, repeat):
+    """Measure create, retrieve, update and destroy of loans with the given term"""
+
+    loan_data = {'loan_amount': 5000000, 'loan_term': loan_term, 'interest_rate': 12, 'loan_year': 2023, 'loan_month': '06'}
+    pks = []
+    results = {}
+
+    def create(timed, traced):
+        for x in range(repeat):
+            pks.append(timed(lambda: client.post(reverse('loans-list'), loan_data)).data['pk'])
+        pks.append(None)
+        return traced(lambda: pks.__setitem__(-1, client.post(reverse('loans-list'), loan_data).data['pk']))
+
+    def retrieve(timed, traced):
+        for pk in pks[:-1]:
+            timed(lambda: client.get(reverse('loans-detail', kwargs={'pk': pk})))
+        return traced(lambda: client.get(reverse('loans-detail', kwargs={'pk': pks[-1]})))
+
+    def update(timed, traced):
+        for x, pk in enumerate(pks[:-1]):
+            timed(lambda: client.put(reverse('loans-detail', kwargs={'pk': pk}), {**loan_data, 'loan_amount': 5000000 + x + 1}))
+        return traced(lambda: client.put(reverse('loans-detail', kwargs={'pk': pks[-1]}), {**loan_data, 'loan_amount': 4000000}))
+
+    def destroy(timed, traced):
+        for pk in pks[:-1]:
+            timed(lambda: client.delete(reverse('loans-detail', kwargs={'pk': pk})))
+        return traced(lambda: client.delete(reverse('loans-detail', kwargs={'pk': pks[-1]})))
+
+    for name, send_requests in (('create', create), ('retrieve', retrieve), ('update', update), ('destroy', destroy)):
+        results[name] = measure(send_requests)
+    return results
+
+
+
+def run_filters(client, repeat):
+    """Measure filter requests with the result cache turned off"""
+
+    results = {}
+    for name, query in FILTER_QUERIES.items():
+        url = f"{reverse('loans-filter')}?{urlencode({**{field: 'null' for field in FILTER_DEFAULTS}, **query})}"
+
+        def send_requests(timed, traced):
+            for x in range(repeat):
+                timed(lambda: client.get(url))
+            return traced(lambda: client.get(url))
+
+        results[f'filter_{name}'] = measure(send_requests)
+    return results
+
+
+
+def run_suite(portfolio_sizes, repeat):
+    """Run every benchmark for each portfolio size, returning results keyed by endpoint and size"""
+
+    results = {}
+    client = APIClient()
+    seeded = 0
+    with override_settings(LOAN_FILTER_CACHE_TIMEOUT=0):
+        for portfolio_size in sorted(portfolio_sizes):
+            # Grow the portfolio to the next size instead of seeding from scratch
+            seed(portfolio_size - seeded)
+            seeded = portfolio_size
+            cache.clear()
+
+            for loan_term in LOAN_TERMS:
+                for name, result in run_terms(client, loan_term, repeat).items():
+                    results[f'{name} term={loan_term} portfolio={portfolio_size}'] = result
+                    print_result(f'{name} term={loan_term} portfolio={portfolio_size}', result)
+            for name, result in run_filters(client, repeat).items():
+                results[f'{name} portfolio={portfolio_size}'] = result
+                print_result(f'{name} portfolio={portfolio_size}', result)
+    return results
+
+
+
+def print_result(key, result):
+    print(f'{key:<40} p50 {result["p50_ms"]:>9.2f} ms  p90 {result["p90_ms"]:>9.2f} ms  p99 {result["p99_ms"]:>9.2f} ms  queries {result["queries"]:>5}  peak {result["peak_kib"]:>9.1f} KiB')
+
+
+
+def compare(results, baseline, tolerance):
+    """Return a line for every benchmark slower, issuing more queries or using more memory than its baseline"""
+
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        expected = baseline[key]
+        if result['p50_ms'] > expected['p50_ms'] * tolerance:
+            regressions.append(f'{key}: p50 {expected["p50_ms"]} -> {result["p50_ms"]} ms')
+        if result['queries'] > expected['queries']:
+            regressions.append(f'{key}: queries {expected["queries"]} -> {result["queries"]}')
+        if result['peak_kib'] > expected['peak_kib'] * tolerance:
+            regressions.append(f'{key}: peak memory {expected["peak_kib"]} -> {result["peak_kib"]} KiB')
+    return regressions
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--portfolio-sizes', type=int, nargs='+', default=[1000, 10000], help='Up to 100000 loans')
+    parser.add_argument('--repeat', type=int, default=20, help='Requests per endpoint and term')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--write-baseline', action='store_true', help='Save the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='Allowed ratio of p50 latency and peak memory to the baseline')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 if anything regressed')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        print(f'Benchmarking on {connection.vendor}, {args.repeat} requests per endpoint')
+        results = run_suite(args.portfolio_sizes, args.repeat)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    if args.write_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --write-baseline to record one')
+        return
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file), args.tolerance)
+    if regressions:
+        print('Regressions against baseline:')
+        for regression in regressions:
+            print(f'  {regression}')
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
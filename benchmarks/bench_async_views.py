@@ -0,0 +1,112 @@
+"""Compare concurrent request throughput of the sync and async loan read endpoints
+
+Sync requests go through the WSGI handler on a thread pool, async requests through the
+ASGI handler on one event loop. A throwaway test database is created and seeded first.
+
+Run from the repository root:
+    python benchmarks/bench_async_views.py [--loans 200] [--requests 400] [--concurrency 16]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from loans.models import Loan, Repayment
+from loans.schedule import schedule_for_loan
+
+# Endpoint pairs compared, as (name, sync url name, async url name, needs a loan id)
+ENDPOINTS = (
+    ('retrieve', 'loans-detail', 'loans-async-detail', True),
+    ('edit', 'loans-edit', 'loans-async-edit', True),
+    ('list', 'loans-list', 'loans-async-list', False),
+)
+
+
+def seed(no_of_loans):
+    """Add loans and their repayments to the test database, returning the loan ids"""
+
+    Loan.objects.bulk_create(
+        Loan(loan_amount=10000 * (x + 1), loan_term=5, interest_rate=10, loan_year=2022, loan_month=1)
+        for x in range(no_of_loans)
+    )
+    loans = list(Loan.objects.all())
+    repayment_list = []
+    for loan in loans:
+        repayment_list.extend(schedule_for_loan(loan).to_repayments(loan))
+    Repayment.objects.bulk_create(repayment_list, batch_size=1000)
+    return [loan.id for loan in loans]
+
+
+
+def sync_throughput(urls, concurrency):
+    """Requests per second for the sync endpoint served by a thread pool"""
+
+    def fetch(url):
+        return Client().get(url).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(fetch, urls))
+    return len(urls) / (time.perf_counter() - start)
+
+
+
+def async_throughput(urls, concurrency):
+    """Requests per second for the async endpoint served on one event loop"""
+
+    async def run():
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                return (await client.get(url)).status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch(url) for url in urls))
+        return len(urls) / (time.perf_counter() - start)
+
+    return asyncio.run(run())
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loans', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=16)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        loan_ids = seed(args.loans)
+        print(f'{args.requests} requests, concurrency {args.concurrency}, {connection.vendor}')
+        print(f'{"endpoint":>9} {"sync req/s":>11} {"async req/s":>12} {"ratio":>7}')
+        for name, sync_name, async_name, needs_id in ENDPOINTS:
+            ids = [loan_ids[x % len(loan_ids)] for x in range(args.requests)] if needs_id else [None] * min(args.requests, 50)
+            sync_urls = [reverse(sync_name, kwargs={'pk': pk}) if needs_id else reverse(sync_name) for pk in ids]
+            async_urls = [reverse(async_name, kwargs={'pk': pk}) if needs_id else reverse(async_name) for pk in ids]
+
+            sync_rate = sync_throughput(sync_urls, args.concurrency)
+            async_rate = async_throughput(async_urls, args.concurrency)
+            print(f'{name:>9} {sync_rate:>11.1f} {async_rate:>12.1f} {async_rate / sync_rate:>6.2f}x')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Time the portfolio cash flow projection on a large seeded portfolio
+
+Seeds loans, and their repayments for the 'rows' method only, as the closed form never reads
+them, then times the first month (time to first byte of the streamed response) and the whole
+projection, and the peak memory allocated while projecting. A throwaway test database is
+created first.
+
+Run from the repository root:
+    python benchmarks/bench_cash_flow.py [--loans 300000] [--months 600] [--method closed_form]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from loans.helper_functions import calculate_pmt
+from loans.models import Loan, Repayment
+from loans.portfolio import PORTFOLIO_METHODS, portfolio_cash_flow
+from loans.schedule import calculate_schedule
+
+FIRST_DATE = date(2023, 1, 1)
+
+
+def seed(no_of_loans, with_repayments):
+    """Add random loans with their PMT, and optionally their repayments, to the test database"""
+
+    random.seed(0)
+    for start in range(0, no_of_loans, 10000):
+        loans = []
+        for x in range(min(10000, no_of_loans - start)):
+            loan_amount = Decimal(random.randrange(1000, 100000000))
+            interest_rate = Decimal(random.randrange(100, 3600)) / 100
+            loan_term = random.randint(1, 50)
+            loans.append(Loan(
+                loan_amount=loan_amount,
+                loan_term=loan_term,
+                interest_rate=interest_rate,
+                loan_year=random.randint(2017, 2050),
+                loan_month=str(random.randint(1, 12)),
+                pmt=calculate_pmt(loan_amount, interest_rate / 100, loan_term),
+            ))
+        Loan.objects.bulk_create(loans)
+
+        if with_repayments:
+            repayments = []
+            for loan in loans:
+                repayments.extend(calculate_schedule(loan.loan_amount, loan.interest_rate, loan.loan_term, loan.loan_month, loan.loan_year).to_repayments(loan))
+            Repayment.objects.bulk_create(repayments, batch_size=10000)
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loans', type=int, default=300000)
+    parser.add_argument('--months', type=int, default=600)
+    parser.add_argument('--method', choices=PORTFOLIO_METHODS, default='closed_form')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        seed(args.loans, args.method == 'rows')
+
+        start = time.perf_counter()
+        months = portfolio_cash_flow(FIRST_DATE, args.months, args.method)
+        first_month = next(months)
+        first_month_time = time.perf_counter() - start
+        total = first_month['payment'] + sum(month['payment'] for month in months)
+        total_time = time.perf_counter() - start
+
+        # Measured on a second run, as tracing allocations slows everything down
+        tracemalloc.start()
+        for month in portfolio_cash_flow(FIRST_DATE, args.months, args.method):
+            pass
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f'{args.loans} loans x {args.months} months on {connection.vendor} with {args.method}')
+        print(f'first month {first_month_time * 1000:.0f} ms, all months {total_time * 1000:.0f} ms, peak memory {peak / 2 ** 20:.1f} MiB')
+        print(f'total payments {total}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
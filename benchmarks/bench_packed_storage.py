@@ -0,0 +1,69 @@
+"""Compare retrieve latency and stored size of the rows, packed and computed schedule storage modes
+
+A throwaway test database is created.
+
+Run from the repository root:
+    python benchmarks/bench_packed_storage.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment
+from django.urls import reverse
+from rest_framework.test import APIClient
+from loans.models import Loan
+
+LOAN_TERMS = (1, 10, 25, 50)
+STORAGE_MODES = ('rows', 'packed', 'computed')
+
+
+def best_time(function, repeat=5, number=20):
+    """Best average time of one call in milliseconds"""
+
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1000
+
+
+def stored_bytes(loan_id):
+    """Bytes of repayment rows and packed schedule stored for a loan, rows counted by their column values"""
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(SUM(LENGTH(id) + LENGTH(payment_no) + LENGTH(date) + LENGTH(payment_amount) + LENGTH(principal)'
+            ' + LENGTH(interest) + LENGTH(balance) + LENGTH(created_at) + LENGTH(updated_at) + LENGTH(loan_id)), 0)'
+            ' FROM repayments WHERE loan_id = %s',
+            [loan_id],
+        )
+        row_bytes = cursor.fetchone()[0]
+    blob = Loan.objects.defer(None).get(id=loan_id).schedule_blob
+    return row_bytes + (len(blob) if blob is not None else 0)
+
+
+def main():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    client = APIClient()
+    try:
+        print(f'{"term":>5} {"storage":>9} {"retrieve ms":>12} {"stored bytes":>13}')
+        for loan_term in LOAN_TERMS:
+            for storage in STORAGE_MODES:
+                with override_settings(LOAN_SCHEDULE_STORAGE=storage):
+                    loan_data = {'loan_amount': 5000000, 'loan_term': loan_term, 'interest_rate': 12, 'loan_year': 2023, 'loan_month': '06'}
+                    pk = client.post(reverse('loans-list'), loan_data).data['pk']
+                    url = reverse('loans-detail', kwargs={'pk': pk})
+                    retrieve_time = best_time(lambda: client.get(url))
+                print(f'{loan_term:>5} {storage:>9} {retrieve_time:>12.2f} {stored_bytes(pk):>13}')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Time the portfolio outstanding balance methods on a large seeded portfolio
+
+Compares the NumPy closed form over loan fields, the indexed lookup of one stored repayment
+per loan and, as a baseline, a scan that finds each loan's latest repayment by date.
+A throwaway test database is created and seeded first.
+
+Run from the repository root:
+    python benchmarks/bench_portfolio_balance.py [--loans 100000] [--max-term 2]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.test.utils import setup_test_environment
+from loans.models import Loan, Repayment
+from loans.portfolio import portfolio_balance
+from loans.schedule import schedule_for_loan
+
+AS_OF = date(2023, 6, 15)
+
+
+def seed(no_of_loans, max_term):
+    """Add random loans and their repayments to the test database"""
+
+    random.seed(0)
+    for start in range(0, no_of_loans, 10000):
+        loans = Loan.objects.bulk_create(
+            Loan(
+                loan_amount=Decimal(random.randrange(1000, 1000000)),
+                loan_term=random.randint(1, max_term),
+                interest_rate=Decimal(random.randrange(100, 3600)) / 100,
+                loan_year=random.randint(2020, 2024),
+                loan_month=str(random.randint(1, 12)),
+            )
+            for x in range(min(10000, no_of_loans - start))
+        )
+        loans = Loan.objects.order_by('-id')[:len(loans)]
+        repayment_list = []
+        for loan in loans:
+            repayment_list.extend(schedule_for_loan(loan).to_repayments(loan))
+        Repayment.objects.bulk_create(repayment_list, batch_size=5000)
+
+
+
+def scan_balance(as_of):
+    """Baseline: sum the balance of each loan's latest repayment on or before the date, found by date"""
+
+    latest = Repayment.objects.filter(loan_id=OuterRef('loan_id'), date__lte=as_of).values('loan_id').annotate(latest=Max('payment_no')).values('latest')
+    return Repayment.objects.filter(date__lte=as_of, payment_no=Subquery(latest)).aggregate(balance=Sum('balance'))['balance']
+
+
+
+def timed(function, *args):
+    """Run a function once, returning its result and time taken in milliseconds"""
+
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--max-term', type=int, default=2)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        start = time.perf_counter()
+        seed(args.loans, args.max_term)
+        print(f'Seeded {Loan.objects.count()} loans, {Repayment.objects.count()} repayments on {connection.vendor} in {time.perf_counter() - start:.1f}s')
+
+        print(f'{"method":>12} {"ms":>10} {"balance":>20}')
+        for method in ('closed_form', 'rows'):
+            (balance, loans), elapsed = timed(portfolio_balance, AS_OF, method)
+            print(f'{method:>12} {elapsed:>10.1f} {balance:>20}')
+        balance, elapsed = timed(scan_balance, AS_OF)
+        print(f'{"scan":>12} {elapsed:>10.1f} {balance:>20}  (excludes loans with no installment yet)')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
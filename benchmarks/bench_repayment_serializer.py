@@ -0,0 +1,64 @@
+"""Compare RepaymentSerializer with the values_list based serialize_repayments
+
+Times reading and rendering the repayment list of one loan, from a stored queryset and
+from in-memory Repayment instances as create and update do, and checks the JSON is identical.
+A throwaway test database is created.
+
+Run from the repository root:
+    python benchmarks/bench_repayment_serializer.py
+"""
+
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from rest_framework.renderers import JSONRenderer
+from loans.models import Loan, Repayment
+from loans.schedule import schedule_for_loan
+from loans.serializers import RepaymentSerializer, serialize_repayments
+
+LOAN_TERMS = (1, 10, 25, 50)
+
+
+def best_time(function, repeat=5, number=20):
+    """Best average time of one call in milliseconds"""
+
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1000
+
+
+def main():
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    renderer = JSONRenderer()
+    try:
+        print(f'{"term":>5} {"rows":>5} {"source":>10} {"drf ms":>8} {"fast ms":>8} {"speedup":>8}')
+        for loan_term in LOAN_TERMS:
+            loan = Loan.objects.create(loan_amount=Decimal(5000000), loan_term=loan_term, interest_rate=Decimal(12), loan_year=2023, loan_month='06')
+            Repayment.objects.bulk_create(schedule_for_loan(loan).to_repayments(loan))
+            queryset = Repayment.objects.filter(loan_id=loan.id).order_by('payment_no')
+            instances = list(queryset)
+
+            for source, repayments in (('queryset', queryset), ('instances', instances)):
+                drf = lambda: renderer.render(RepaymentSerializer(repayments.all() if source == 'queryset' else repayments, many=True).data)
+                fast = lambda: renderer.render(serialize_repayments(repayments.all() if source == 'queryset' else repayments))
+                if drf() != fast():
+                    raise Exception(f'Output differs for a {loan_term} year loan from {source}')
+
+                drf_time = best_time(drf)
+                fast_time = best_time(fast)
+                print(f'{loan_term:>5} {len(instances):>5} {source:>10} {drf_time:>8.2f} {fast_time:>8.2f} {drf_time / fast_time:>7.2f}x')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
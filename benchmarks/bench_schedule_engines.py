@@ -0,0 +1,67 @@
+"""Compare the Decimal and fixed-point schedule engines on the packed storage write path
+
+The Decimal engine's values are converted to micro-units to be packed, the fixed-point
+engine's integer columns are packed as they are.
+
+Run from the repository root:
+    python benchmarks/bench_schedule_engines.py
+"""
+
+import os
+import sys
+import timeit
+from array import array
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_app.settings')
+
+import django
+django.setup()
+
+from loans.fixed_point import fixed_point_schedule, to_micros
+from loans.packed import PACKED_COLUMNS, PACKED_HEADER, PACKED_VERSION, packed_schedule
+from loans.schedule import calculate_schedule
+
+LOANS = (
+    (Decimal('10000'), Decimal('10'), 1),
+    (Decimal('5000000'), Decimal('20'), 12),
+    (Decimal('100000000'), Decimal('36'), 50),
+)
+
+
+def best_time(function, repeat=5, number=50):
+    """Best average time of one call in milliseconds"""
+
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1000
+
+
+def decimal_packed_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year):
+    """Pack and summarise a schedule from the Decimal engine"""
+
+    schedule = calculate_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year)
+    values = array('q')
+    for column in PACKED_COLUMNS:
+        values.extend(map(to_micros, getattr(schedule, column)))
+    blob = PACKED_HEADER.pack(PACKED_VERSION, loan_year, int(loan_month), len(schedule), to_micros(schedule.payment_amount[0])) + values.tobytes()
+    return blob, schedule.summary()
+
+
+def main():
+    print(f'{"term":>5} {"decimal ms":>11} {"fixed ms":>9} {"speedup":>8} {"fixed core ms":>14}')
+    for loan_amount, interest_rate, loan_term in LOANS:
+        # Both paths must store the same blob and summary
+        assert decimal_packed_schedule(loan_amount, interest_rate, loan_term, '01', 2030) == packed_schedule(loan_amount, interest_rate, loan_term, '01', 2030)
+
+        decimal_time = best_time(lambda: decimal_packed_schedule(loan_amount, interest_rate, loan_term, '01', 2030))
+        fixed_time = best_time(lambda: packed_schedule(loan_amount, interest_rate, loan_term, '01', 2030))
+        # Integer columns only, without packing
+        core_time = best_time(lambda: fixed_point_schedule(loan_amount, interest_rate, loan_term))
+        print(
+            f'{loan_term:>5} {decimal_time:>11.3f} {fixed_time:>9.3f} {decimal_time / fixed_time:>7.2f}x'
+            f' {core_time:>14.3f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
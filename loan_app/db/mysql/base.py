@@ -0,0 +1,9 @@
+from django.db.backends.mysql import base
+from loan_app.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """MySQL backend with per-process connection pooling"""
+
+    def ping_connection(self, connection):
+        connection.ping()
@@ -0,0 +1,194 @@
+import os
+import time
+from threading import Lock
+
+# Connection pools of this process by database alias
+POOLS = {}
+POOLS_LOCK = Lock()
+
+
+class ConnectionPool:
+    """Thread-safe pool of idle raw database connections for one database alias
+
+    Holds at most max_size idle connections. Connections older than max_age seconds
+    are closed instead of being reused, and when a health check is given each idle
+    connection must pass it before it is handed out again.
+    """
+
+    def __init__(self, max_size, max_age=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.idle = []
+        self.created_at = {}
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.overflow = 0
+
+
+    def is_expired(self, connection):
+        """Check if a connection has outlived the pool max age"""
+
+        return self.max_age is not None and time.monotonic() - self.created_at.get(id(connection), 0) >= self.max_age
+
+
+    def acquire(self, create, check=None):
+        """Return an idle connection that is still usable, or a new one from create()"""
+
+        while True:
+            with self.lock:
+                if not self.idle:
+                    self.misses += 1
+                    break
+                connection = self.idle.pop()
+
+            if self.is_expired(connection):
+                self.discard(connection)
+                continue
+            if check is not None:
+                try:
+                    check(connection)
+                except Exception:
+                    self.discard(connection)
+                    continue
+
+            with self.lock:
+                self.hits += 1
+            return connection
+
+        connection = create()
+        with self.lock:
+            self.created_at[id(connection)] = time.monotonic()
+        return connection
+
+
+    def release(self, connection):
+        """Return a connection to the pool, closing it if the pool is full or it has expired"""
+
+        try:
+            # Never hand out a connection with a transaction still open
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+
+        if self.is_expired(connection):
+            self.discard(connection)
+            return
+
+        with self.lock:
+            if len(self.idle) < self.max_size:
+                self.idle.append(connection)
+                return
+            self.overflow += 1
+        self.close(connection)
+
+
+    def discard(self, connection):
+        """Close a connection that is not fit for reuse"""
+
+        with self.lock:
+            self.discarded += 1
+        self.close(connection)
+
+
+    def close(self, connection):
+        """Close a connection and forget it"""
+
+        with self.lock:
+            self.created_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+    def clear(self):
+        """Close every idle connection"""
+
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            self.close(connection)
+
+
+    def stats(self):
+        """Return hit, miss, discard and overflow counts with the current and maximum pool size"""
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'discarded': self.discarded,
+                'overflow': self.overflow,
+                'size': len(self.idle),
+                'max_size': self.max_size,
+            }
+
+
+
+def get_pool(alias, settings_dict):
+    """Return the pool of this process for a database alias, or None when pooling is off"""
+
+    max_size = int(settings_dict.get('POOL_SIZE') or 0)
+    if max_size <= 0:
+        return None
+
+    # Connections cannot be shared with a parent process, e.g. after a server forks its workers
+    key = (alias, os.getpid())
+    with POOLS_LOCK:
+        pool = POOLS.get(key)
+        if pool is None:
+            pool = POOLS[key] = ConnectionPool(max_size, settings_dict.get('POOL_MAX_AGE'))
+        return pool
+
+
+
+def pool_stats():
+    """Return the stats of every connection pool of this process by database alias"""
+
+    pid = os.getpid()
+    with POOLS_LOCK:
+        pools = {alias: pool for (alias, pool_pid), pool in POOLS.items() if pool_pid == pid}
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+
+class PooledDatabaseWrapperMixin:
+    """Database wrapper mixin that takes connections from a ConnectionPool and returns them on close
+
+    Pooling is on when the database settings have a POOL_SIZE above 0, otherwise
+    the backend behaves exactly like the one it extends.
+    """
+
+    def get_pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+
+    def ping_connection(self, connection):
+        """Raise an error if a pooled connection can no longer be used"""
+
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool()
+        if pool is None:
+            return super().get_new_connection(conn_params)
+
+        check = self.ping_connection if self.settings_dict['CONN_HEALTH_CHECKS'] else None
+        return pool.acquire(lambda: super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params), check)
+
+
+    def _close(self):
+        pool = self.get_pool()
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        with self.wrap_database_errors:
+            pool.release(self.connection)
@@ -0,0 +1,6 @@
+from django.db.backends.sqlite3 import base
+from loan_app.db.pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """SQLite backend with per-process connection pooling, a stand-in for the pooled MySQL backend"""
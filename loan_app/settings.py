@@ -22,6 +22,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loans.middleware.MetricsMiddleware',
+    'loans.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,12 +56,20 @@ WSGI_APPLICATION = 'loan_app.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': os.environ.get("DATABASE_ENGINE", 'loan_app.db.mysql'),
         'NAME': os.environ.get("DATABASE_NAME"),
         'HOST': os.environ.get("DATABASE_HOST"),
         'PORT': os.environ.get("DATABASE_PORT"),
         'USER': os.environ.get("DATABASE_USER"),
         'PASSWORD': os.environ.get("DATABASE_PASSWORD"),
+        # Seconds a connection is kept open across requests in the same thread, 0 closes it after each request
+        'CONN_MAX_AGE': int(os.environ.get("DATABASE_CONN_MAX_AGE", 0)),
+        # Check a kept or pooled connection still works before reusing it
+        'CONN_HEALTH_CHECKS': os.environ.get("DATABASE_CONN_HEALTH_CHECKS", 'True').lower() == 'true',
+        # Idle connections kept per worker process by the loan_app.db backends, 0 turns pooling off
+        'POOL_SIZE': int(os.environ.get("DATABASE_POOL_SIZE", 0)),
+        # Seconds before a pooled connection is closed instead of reused
+        'POOL_MAX_AGE': int(os.environ.get("DATABASE_POOL_MAX_AGE", 300)),
         'TEST': {
             'NAME': 'test_my-db'
         },
@@ -92,4 +102,48 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'COERCE_DECIMAL_TO_STRING': False,
-}
\ No newline at end of file
+}
+
+# Where repayment schedules live: 'rows' stores them in the repayments table,
+# 'computed' recalculates them from the loan fields whenever they are read and
+# 'packed' keeps each one as a single blob of fixed-width integers on its loan row
+LOAN_SCHEDULE_STORAGE = os.environ.get('LOAN_SCHEDULE_STORAGE', 'rows')
+
+# Number of repayment schedules kept in the per-process LRU cache, 0 disables it
+LOAN_SCHEDULE_CACHE_SIZE = int(os.environ.get('LOAN_SCHEDULE_CACHE_SIZE', 256))
+
+# Default number of rows per insert statement for bulk loan creation
+LOAN_BULK_BATCH_SIZE = int(os.environ.get('LOAN_BULK_BATCH_SIZE', 1000))
+
+# Stream repayment lists in retrieve, create and update responses instead of rendering them in one piece
+LOAN_STREAMING_RESPONSES = os.environ.get('LOAN_STREAMING_RESPONSES', 'False').lower() == 'true'
+
+# Number of loans per page in list and filter responses, 0 leaves them unpaginated unless ?page_size= is given
+LOAN_PAGE_SIZE = int(os.environ.get('LOAN_PAGE_SIZE', 0))
+
+# Cache used for loan filter results, locmem by default, e.g. django.core.cache.backends.filebased.FileBasedCache to share it between processes
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'loan-app'),
+    }
+}
+
+# Seconds a loan filter result is cached for, 0 disables the cache. Writes to loans retire cached results straight away,
+# but only for processes sharing the cache, so it is off by default with the per-process locmem backend
+LOAN_FILTER_CACHE_TIMEOUT = int(os.environ.get('LOAN_FILTER_CACHE_TIMEOUT', 0 if CACHES['default']['BACKEND'].endswith('.LocMemCache') else 300))
+
+# Body of a successful destroy response: 'list' returns every remaining loan, 'id' only the deleted loan id and 'empty' a 204 with no content
+LOAN_DESTROY_RESPONSE = os.environ.get('LOAN_DESTROY_RESPONSE', 'list')
+
+# Record per view action latency, query count and database time, exposed in Prometheus text format at /metrics
+LOAN_METRICS = os.environ.get('LOAN_METRICS', 'True').lower() == 'true'
+
+# Profile requests sent with an X-Loan-Profile header equal to this token, empty turns the header off
+LOAN_PROFILE_TOKEN = os.environ.get('LOAN_PROFILE_TOKEN', '')
+
+# Fraction of requests profiled at random, 0 turns sampling off. With no token either, profiling costs nothing
+LOAN_PROFILE_SAMPLE_RATE = float(os.environ.get('LOAN_PROFILE_SAMPLE_RATE', 0))
+
+# Directory cProfile traces are written to, named after the view action and time of the request
+LOAN_PROFILE_DIR = os.environ.get('LOAN_PROFILE_DIR', str(BASE_DIR / 'profiles'))
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.urls import path, include
+from loans.metrics import metrics_view
 
 from drf_spectacular.views import (
     SpectacularAPIView,
@@ -11,4 +12,5 @@ urlpatterns = [
     path('api/schema/', SpectacularAPIView.as_view(), name='api-schema'),
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='api-schema'), name='api-docs'),
     path('loans/', include("loans.urls")),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class LoansConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'loans'
+
+    def ready(self):
+        if settings.LOAN_METRICS:
+            from .middleware import install_query_counter
+
+            # Count queries of every connection, including ones opened in sync_to_async threads
+            connection_created.connect(install_query_counter, dispatch_uid='loans_query_counter')
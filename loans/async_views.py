@@ -0,0 +1,118 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from .models import Repayment, Loan
+from .serializers import REPAYMENT_COLUMNS, LoanSerializer, serialize_repayment_rows, serialize_repayments
+from .packed import packed_repayments
+from .schedule import computed_repayments, stores_packed_schedules, stores_repayment_rows
+from .filter_cache import acached_filter_results
+from .helper_functions import filter_loans
+from .pagination import LoanCursorPagination
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    """Render data to the same JSON bytes as a DRF Response"""
+
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+
+async def paginated_loans(request, queryset):
+    """Return a page of loans with next/previous cursors, or None when no page size is given"""
+
+    paginator = LoanCursorPagination()
+    # Cursor pagination is sync only, run it off the event loop
+    page = await sync_to_async(paginator.paginate_queryset)(queryset, Request(request))
+    if page is None:
+        return None
+    return paginator.get_paginated_response(LoanSerializer(page, many=True).data).data
+
+
+
+class LoanListAsyncView(View):
+    """Async version of the loan list endpoint"""
+
+    async def get(self, request, *args, **kwargs):
+        """Retrieve all loans from db"""
+
+        try:
+            loan_list = await paginated_loans(request, Loan.objects.all())
+            if loan_list is None:
+                loan_list = LoanSerializer([loan async for loan in Loan.objects.all()], many=True).data
+            return json_response(loan_list)
+
+        except Exception as err:
+            print(str(err))
+            return json_response(str(err), status.HTTP_404_NOT_FOUND)
+
+
+
+class LoanDetailAsyncView(View):
+    """Async version of the loan retrieve endpoint, always rendered in one piece"""
+
+    async def get(self, request, *args, **kwargs):
+        """Retrieve loan and repayment details from db"""
+
+        try:
+            pk = kwargs['pk']
+            if stores_packed_schedules():
+                loan_details = await Loan.objects.defer(None).aget(id=pk)
+            else:
+                loan_details = await Loan.objects.aget(id=pk)
+            loan_serializer = LoanSerializer(loan_details).data
+
+            if stores_repayment_rows():
+                repayment_rows = Repayment.objects.filter(loan_id__id = pk).order_by('payment_no').values_list(*REPAYMENT_COLUMNS)
+                repayments_serializer = serialize_repayment_rows([row async for row in repayment_rows])
+            elif stores_packed_schedules():
+                repayments_serializer = serialize_repayments(packed_repayments(loan_details))
+            else:
+                repayments_serializer = serialize_repayments(computed_repayments(loan_details))
+
+            obj = {
+            'loan': loan_serializer,
+            'repayment list': repayments_serializer
+            }
+
+            return json_response(obj)
+
+        except Exception as err:
+            print(str(err))
+            return json_response(str(err), status.HTTP_404_NOT_FOUND)
+
+
+
+class LoanEditAsyncView(View):
+    """Async version of the loan edit endpoint"""
+
+    async def get(self, request, *args, **kwargs):
+        """Retrieve loan data to fill form for loan editing"""
+
+        try:
+            loan_details = await Loan.objects.aget(id=kwargs['pk'])
+            return json_response(LoanSerializer(loan_details).data)
+
+        except Exception as err:
+            print(str(err))
+            return json_response(str(err), status.HTTP_404_NOT_FOUND)
+
+
+
+class LoanFilterAsyncView(View):
+    """Async version of the loan filter endpoint"""
+
+    async def get(self, request, *args, **kwargs):
+        """Filter loans"""
+
+        try:
+            filtered_list = await paginated_loans(request, filter_loans(request.GET))
+            if filtered_list is None:
+                filtered_list = await acached_filter_results(request.GET)
+            return json_response(filtered_list)
+
+        except Exception as err:
+            print(str(err))
+            return json_response(str(err), status.HTTP_404_NOT_FOUND)
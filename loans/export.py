@@ -0,0 +1,109 @@
+import csv
+from django.db.models import Q
+from rest_framework.utils.encoders import JSONEncoder
+from .models import Repayment
+from .packed import stored_schedule
+from .schedule import schedule_for_loan, stores_packed_schedules, stores_repayment_rows
+
+EXPORT_COLUMNS = (
+    'loan_id',
+    'loan_amount',
+    'loan_term',
+    'interest_rate',
+    'loan_month',
+    'loan_year',
+    'payment_no',
+    'date',
+    'payment_amount',
+    'principal',
+    'interest',
+    'balance',
+)
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Number of rows fetched from db and written out per chunk
+EXPORT_CHUNK_SIZE = 2000
+
+
+def keyset_batches(rows, after):
+    """Yield the rows of an ordered queryset, fetching EXPORT_CHUNK_SIZE rows per query
+
+    Each query starts after the last row of the one before, selected with after(row), as
+    MySQL drivers buffer the whole result of a single query in memory.
+    """
+
+    batch = list(rows[:EXPORT_CHUNK_SIZE])
+    while batch:
+        yield from batch
+        if len(batch) < EXPORT_CHUNK_SIZE:
+            break
+        batch = list(rows.filter(after(batch[-1]))[:EXPORT_CHUNK_SIZE])
+
+
+
+def export_rows(loans):
+    """Yield one row per repayment of the given loans, ordered by (loan_id, payment_no)"""
+
+    if stores_repayment_rows():
+        repayment_rows = Repayment.objects.filter(loan__in=loans).order_by('loan_id', 'payment_no').values_list(
+            'loan_id',
+            'loan__loan_amount',
+            'loan__loan_term',
+            'loan__interest_rate',
+            'loan__loan_month',
+            'loan__loan_year',
+            'payment_no',
+            'date',
+            'payment_amount',
+            'principal',
+            'interest',
+            'balance',
+        )
+        # Rows are read in (loan_id, payment_no) order, the order of the repayments unique index
+        yield from keyset_batches(repayment_rows, lambda row: Q(loan_id__gt=row[0]) | Q(loan_id=row[0], payment_no__gt=row[6]))
+    elif stores_packed_schedules():
+        # Packed schedules are read along with their loans
+        for loan in keyset_batches(loans.defer(None).order_by('id'), lambda loan: Q(id__gt=loan.id)):
+            loan_row = (loan.id, loan.loan_amount, loan.loan_term, loan.interest_rate, loan.loan_month, loan.loan_year)
+            for repayment_row in stored_schedule(loan).rows():
+                yield loan_row + repayment_row
+    else:
+        # Schedules are not stored, so calculate them loan by loan
+        for loan in keyset_batches(loans.order_by('id'), lambda loan: Q(id__gt=loan.id)):
+            loan_row = (loan.id, loan.loan_amount, loan.loan_term, loan.interest_rate, loan.loan_month, loan.loan_year)
+            for repayment_row in schedule_for_loan(loan).rows():
+                yield loan_row + repayment_row
+
+
+
+class Echo:
+    """File-like object that returns what is written to it, for use with csv.writer"""
+
+    def write(self, value):
+        return value
+
+
+
+def render_export(rows, export_format):
+    """Render export rows as CSV or NDJSON text, one chunk of rows at a time"""
+
+    if export_format == 'csv':
+        writer = csv.writer(Echo())
+        render_row = writer.writerow
+        yield writer.writerow(EXPORT_COLUMNS)
+    else:
+        encoder = JSONEncoder(separators=(',', ':'))
+        render_row = lambda row: encoder.encode(dict(zip(EXPORT_COLUMNS, row))) + '\n'
+
+    chunk = []
+    for row in rows:
+        chunk.append(render_row(row))
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
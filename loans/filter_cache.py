@@ -0,0 +1,92 @@
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .helper_functions import filter_loans, get_filter_bounds, get_filter_ordering
+from .serializers import LoanSerializer
+
+# Bumped whenever loans change, which retires every cached filter result at once
+FILTER_GENERATION_KEY = 'loans:filter:generation'
+
+
+def get_filter_generation():
+    """Return the current filter cache generation, starting a new counter if there is none"""
+
+    generation = cache.get(FILTER_GENERATION_KEY)
+    if generation is None:
+        cache.add(FILTER_GENERATION_KEY, 0, timeout=None)
+        generation = cache.get(FILTER_GENERATION_KEY, 0)
+    return generation
+
+
+
+def bump_filter_generation():
+    """Move to a new filter cache generation so results cached before it are no longer used"""
+
+    try:
+        cache.incr(FILTER_GENERATION_KEY)
+    except ValueError:
+        # Counter was never set or has been evicted
+        cache.set(FILTER_GENERATION_KEY, 1, timeout=None)
+
+
+
+def invalidate_filter_cache():
+    """Bump the filter cache generation once the current transaction commits"""
+
+    transaction.on_commit(bump_filter_generation)
+
+
+
+def filter_cache_key(bounds, ordering, generation):
+    """Build a cache key from normalized filter bounds and ordering, so e.g. 'null', 1 and 1.0 share an entry"""
+
+    normalized_bounds = [
+        'null' if value is None else value.isoformat() if isinstance(value, date) else str(Decimal(str(value)).normalize())
+        for value in bounds.values()
+    ]
+    return f'loans:filter:{generation}:' + ':'.join(normalized_bounds) + f':{ordering}'
+
+
+
+def cached_filter_results(params):
+    """Return serialized loans matching the loan filter query string fields, from cache when possible"""
+
+    timeout = settings.LOAN_FILTER_CACHE_TIMEOUT
+    if timeout <= 0:
+        return LoanSerializer(filter_loans(params), many=True).data
+
+    key = filter_cache_key(get_filter_bounds(params), get_filter_ordering(params), get_filter_generation())
+    results = cache.get(key)
+    if results is None:
+        results = list(LoanSerializer(filter_loans(params), many=True).data)
+        cache.set(key, results, timeout=timeout)
+    return results
+
+
+
+async def aget_filter_generation():
+    """Async version of get_filter_generation"""
+
+    generation = await cache.aget(FILTER_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(FILTER_GENERATION_KEY, 0, timeout=None)
+        generation = await cache.aget(FILTER_GENERATION_KEY, 0)
+    return generation
+
+
+
+async def acached_filter_results(params):
+    """Async version of cached_filter_results, reading loans through the async ORM"""
+
+    timeout = settings.LOAN_FILTER_CACHE_TIMEOUT
+    if timeout <= 0:
+        return LoanSerializer([loan async for loan in filter_loans(params)], many=True).data
+
+    key = filter_cache_key(get_filter_bounds(params), get_filter_ordering(params), await aget_filter_generation())
+    results = await cache.aget(key)
+    if results is None:
+        results = list(LoanSerializer([loan async for loan in filter_loans(params)], many=True).data)
+        await cache.aset(key, results, timeout=timeout)
+    return results
@@ -0,0 +1,107 @@
+from decimal import Decimal
+from .helper_functions import calculate_pmt
+
+# Values are held as integer numbers of micro-units (1e-6), the 6 decimal places used in db
+# Significant digits kept by the default decimal context, which rounds every product
+DECIMAL_PRECISION = 28
+POWERS_OF_TEN = [10 ** exponent for exponent in range(80)]
+
+
+def to_micros(value):
+    """Convert a Decimal with at most 6 decimal places to an integer number of micro-units"""
+
+    return int(value.scaleb(6))
+
+
+
+def from_micros(micros):
+    """Convert an integer number of micro-units to a Decimal with 6 decimal places"""
+
+    return Decimal(micros).scaleb(-6)
+
+
+
+def divide_half_even(numerator, denominator):
+    """Divide a non-negative integer by a positive one, rounding half to even like Decimal does"""
+
+    quotient, remainder = divmod(numerator, denominator)
+    if remainder * 2 > denominator or (remainder * 2 == denominator and quotient & 1):
+        quotient += 1
+    return quotient
+
+
+
+def multiply_micros(rate_coefficient, rate_exponent, micros):
+    """Exactly reproduce round(rate * value, 6) under the default decimal context
+
+    The rate is given as rate_coefficient * 10^-rate_exponent. The product is first rounded
+    to 28 significant digits, as Decimal multiplication does, then to 6 decimal places.
+    """
+
+    product = rate_coefficient * micros
+    sign = -1 if product < 0 else 1
+    product = abs(product)
+
+    scale = rate_exponent
+    excess_digits = len(str(product)) - DECIMAL_PRECISION if product else 0
+    if excess_digits > 0:
+        product = divide_half_even(product, POWERS_OF_TEN[excess_digits])
+        scale -= excess_digits
+
+    if scale > 0:
+        return sign * divide_half_even(product, POWERS_OF_TEN[scale])
+    return sign * product * POWERS_OF_TEN[-scale]
+
+
+
+def fixed_point_schedule(loan_amount, interest_rate, loan_term):
+    """Calculate PMT and the principal, interest and balance of every installment in micro-units
+
+    Gives exactly the values of calculate_schedule. PMT and the monthly rate are worked out
+    once with Decimal, then the monthly rounding recurrence runs on plain integers.
+    """
+
+    interest_rate = interest_rate / 100
+    pmt = to_micros(calculate_pmt(loan_amount, interest_rate, loan_term))
+    sign, digits, exponent = (interest_rate / 12).as_tuple()
+    rate_coefficient = int(''.join(map(str, digits)))
+    rate_exponent = -exponent
+    no_of_months = loan_term * 12
+
+    # Products far enough from a rounding midpoint round the same whether or not they were
+    # first cut to 28 digits, so only those near it need the exact two step rounding.
+    # Balances only shrink, so the first product is the largest.
+    balance = to_micros(loan_amount)
+    midpoint = POWERS_OF_TEN[rate_exponent] // 2
+    guard = POWERS_OF_TEN[max(0, len(str(rate_coefficient * balance)) - DECIMAL_PRECISION)] if balance else 1
+
+    principal_list = []
+    interest_list = []
+    balance_list = []
+    add_principal = principal_list.append
+    add_interest = interest_list.append
+    add_balance = balance_list.append
+    unit = POWERS_OF_TEN[rate_exponent]
+
+    for _ in range(no_of_months):
+        product = rate_coefficient * balance
+        if product >= 0 and rate_exponent > 0:
+            monthly_interest, remainder = divmod(product, unit)
+            distance = remainder - midpoint
+            if -guard <= distance <= guard:
+                monthly_interest = multiply_micros(rate_coefficient, rate_exponent, balance)
+            elif distance > 0:
+                monthly_interest += 1
+        else:
+            monthly_interest = multiply_micros(rate_coefficient, rate_exponent, balance)
+
+        principal = pmt - monthly_interest
+        balance -= principal
+        add_interest(monthly_interest)
+        add_principal(principal)
+        add_balance(balance)
+
+    # Final installment clears any remaining balance
+    balance_list[-1] = 0
+
+    return pmt, principal_list, interest_list, balance_list
@@ -1,6 +1,9 @@
 from rest_framework.response import Response
-from datetime import datetime
+from datetime import date, datetime
 from dateutil import relativedelta
+from decimal import Decimal
+from .models import Loan
+from .serializers import LoanSerializer
 
 def calculate_pmt(loan_amount, interest_rate, loan_term):
     """Calculate PMT amount"""
@@ -30,4 +33,118 @@ def calculate_repayment(interest_rate, pmt, loan, loan_month, loan_year, month,
         'interest': monthly_interest,
         'balance': dict['balance']
     }
-    return repayment
\ No newline at end of file
+    return repayment
+
+
+
+def validate_loan_fields(data):
+    """Convert and validate loan fields from request data, raising an exception with the error message if invalid"""
+
+    if 'loan_amount' in data and 'loan_term' in data and 'interest_rate' in data and 'loan_month' in data and 'loan_year' in data:
+        loan_fields = {
+            'loan_amount': Decimal(data['loan_amount']),
+            'loan_term': int(data['loan_term']),
+            'interest_rate': Decimal(data['interest_rate']),
+            'loan_year': int(data['loan_year']),
+            'loan_month': data['loan_month'],
+        }
+
+        serializer = LoanSerializer(data = loan_fields)
+        if serializer.is_valid():
+            return loan_fields
+        else:
+            raise Exception(serializer.errors['non_field_errors'][0])
+    else:
+        raise Exception('Missing field')
+
+
+
+# Query string fields of the loan filter and the bound used when a field is 'null'
+FILTER_DEFAULTS = {
+    'loan_amount_lower': 1000,
+    'loan_amount_upper': 100000000,
+    'loan_term_lower': 1,
+    'loan_term_upper': 50,
+    'interest_rate_lower': 1.0,
+    'interest_rate_upper': 36.0,
+}
+
+# Optional query string fields of the loan filter on loan summary fields, with the field and lookup they bound
+SUMMARY_FILTERS = {
+    'pmt_lower': ('pmt', 'gte'),
+    'pmt_upper': ('pmt', 'lte'),
+    'total_interest_lower': ('total_interest', 'gte'),
+    'total_interest_upper': ('total_interest', 'lte'),
+    'total_payment_lower': ('total_payment', 'gte'),
+    'total_payment_upper': ('total_payment', 'lte'),
+    'maturity_date_lower': ('maturity_date', 'gte'),
+    'maturity_date_upper': ('maturity_date', 'lte'),
+}
+
+# Fields the loan filter can be sorted by, given in the ordering field with a leading '-' for descending
+ORDERING_FIELDS = ('loan_amount', 'loan_term', 'interest_rate', 'pmt', 'total_interest', 'total_payment', 'maturity_date', 'created_at')
+
+
+def get_filter_bounds(params):
+    """Convert loan filter query string fields to bounds, substituting defaults for 'null' fields"""
+
+    if all(field in params for field in FILTER_DEFAULTS):
+        bounds = {}
+        for field, default in FILTER_DEFAULTS.items():
+            if params[field] == 'null':
+                bounds[field] = default
+            elif field.startswith('interest_rate'):
+                bounds[field] = Decimal(params[field])
+            else:
+                bounds[field] = int(params[field])
+
+        # Summary bounds may be left out, a missing or 'null' one is not applied
+        for field, (summary_field, lookup) in SUMMARY_FILTERS.items():
+            value = params.get(field, 'null')
+            if value == 'null':
+                bounds[field] = None
+            elif summary_field == 'maturity_date':
+                bounds[field] = date.fromisoformat(value)
+            else:
+                bounds[field] = Decimal(value)
+        return bounds
+    else:
+        raise Exception('Missing field')
+
+
+
+def get_filter_ordering(params):
+    """Return the sort field of the loan filter, or None when results keep their default order"""
+
+    ordering = params.get('ordering', 'null')
+    if ordering == 'null':
+        return None
+    if ordering.lstrip('-') not in ORDERING_FIELDS:
+        raise Exception('Invalid ordering field')
+    return ordering
+
+
+
+def filter_loans(params):
+    """Return loans within the bounds given by the loan filter query string fields"""
+
+    bounds = get_filter_bounds(params)
+    loans = Loan.objects.filter(
+        loan_amount__gte=bounds['loan_amount_lower'],
+        loan_amount__lte=bounds['loan_amount_upper'],
+        loan_term__gte=bounds['loan_term_lower'],
+        loan_term__lte=bounds['loan_term_upper'],
+        interest_rate__gte=bounds['interest_rate_lower'],
+        interest_rate__lte=bounds['interest_rate_upper'],
+        **{
+            f'{summary_field}__{lookup}': bounds[field]
+            for field, (summary_field, lookup) in SUMMARY_FILTERS.items()
+            if bounds[field] is not None
+        },
+        )
+
+    ordering = get_filter_ordering(params)
+    if ordering is not None:
+        # Loan id breaks ties so equal values always come back in the same order
+        loans = loans.order_by(ordering, 'id')
+    return loans
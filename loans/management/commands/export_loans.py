@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from loans.export import EXPORT_FORMATS, export_rows, render_export
+from loans.helper_functions import FILTER_DEFAULTS, SUMMARY_FILTERS, filter_loans
+
+
+class Command(BaseCommand):
+    """Write every loan and repayment to a CSV or NDJSON file"""
+
+    help = 'Export loans and their repayment schedules ordered by loan id and payment number'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv', help='Output format')
+        parser.add_argument('--output', default='-', help='File to write to, - for stdout')
+        # Same bounds as the loan filter endpoint, e.g. --loan-amount-lower 5000
+        for field in (*FILTER_DEFAULTS, *SUMMARY_FILTERS):
+            parser.add_argument(f'--{field.replace("_", "-")}', dest=field, default='null')
+
+
+    def handle(self, *args, **options):
+        try:
+            loans = filter_loans({field: options[field] for field in (*FILTER_DEFAULTS, *SUMMARY_FILTERS)})
+            chunks = render_export(export_rows(loans), options['format'])
+
+            if options['output'] == '-':
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending='')
+            else:
+                with open(options['output'], 'w', newline='') as output_file:
+                    for chunk in chunks:
+                        output_file.write(chunk)
+
+        except Exception as err:
+            raise CommandError(str(err))
@@ -0,0 +1,97 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from loans.models import Loan, Repayment
+from loans.packed import packed_schedule, unpack_schedule
+from loans.schedule import schedule_for_loan
+
+
+class Command(BaseCommand):
+    """Move existing repayment schedules between the 'rows', 'computed' and 'packed' storage modes"""
+
+    help = 'Convert stored repayment schedules to match the LOAN_SCHEDULE_STORAGE mode'
+
+
+    def add_arguments(self, parser):
+        parser.add_argument('storage', choices=['rows', 'computed', 'packed'], help='Storage mode to migrate existing loans to')
+        parser.add_argument('--batch-size', type=int, default=500, help='Number of loans handled per transaction')
+        parser.add_argument('--verify', action='store_true', help='Check stored rows match the calculated schedule before removing them')
+
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('Batch size must be at least 1.')
+
+        if options['storage'] == 'rows':
+            count = self.store_rows(batch_size)
+            self.clear_packed()
+            self.stdout.write(self.style.SUCCESS(f'Stored repayment rows for {count} loan(s).'))
+        elif options['storage'] == 'packed':
+            count = self.pack_schedules(batch_size)
+            # Stored rows are checked against the packed schedules that replace them
+            self.remove_rows(batch_size, options['verify'], lambda loan: unpack_schedule(loan.schedule_blob))
+            self.stdout.write(self.style.SUCCESS(f'Packed repayment schedules for {count} loan(s).'))
+        else:
+            count = self.remove_rows(batch_size, options['verify'], schedule_for_loan)
+            self.clear_packed()
+            self.stdout.write(self.style.SUCCESS(f'Removed stored repayment rows for {count} loan(s).'))
+
+
+    def store_rows(self, batch_size):
+        """Calculate and store repayment rows for every loan that has none"""
+
+        loan_ids = list(
+            Loan.objects.exclude(id__in=Repayment.objects.values('loan_id')).order_by('id').values_list('id', flat=True)
+        )
+
+        for start in range(0, len(loan_ids), batch_size):
+            with transaction.atomic():
+                repayment_list = []
+                for loan in Loan.objects.filter(id__in=loan_ids[start:start + batch_size]):
+                    repayment_list.extend(schedule_for_loan(loan).to_repayments(loan))
+                Repayment.objects.bulk_create(repayment_list, batch_size=1000)
+
+        return len(loan_ids)
+
+
+    def pack_schedules(self, batch_size):
+        """Calculate and pack the repayment schedule of every loan that has none packed"""
+
+        loan_ids = list(Loan.objects.filter(schedule_blob__isnull=True).order_by('id').values_list('id', flat=True))
+
+        for start in range(0, len(loan_ids), batch_size):
+            with transaction.atomic():
+                loans = list(Loan.objects.filter(id__in=loan_ids[start:start + batch_size]))
+                for loan in loans:
+                    loan.schedule_blob, summary = packed_schedule(loan.loan_amount, loan.interest_rate, loan.loan_term, loan.loan_month, loan.loan_year)
+                Loan.objects.bulk_update(loans, ['schedule_blob'])
+
+        return len(loan_ids)
+
+
+    def clear_packed(self):
+        """Remove packed schedules, which are no longer kept up to date outside the 'packed' mode"""
+
+        Loan.objects.filter(schedule_blob__isnull=False).update(schedule_blob=None)
+
+
+    def remove_rows(self, batch_size, verify, expected_schedule):
+        """Delete stored repayment rows, optionally checking them against the expected schedule of each loan first"""
+
+        loan_ids = list(Repayment.objects.order_by('loan_id').values_list('loan_id', flat=True).distinct())
+
+        for start in range(0, len(loan_ids), batch_size):
+            batch_ids = loan_ids[start:start + batch_size]
+            with transaction.atomic():
+                if verify:
+                    for loan in Loan.objects.defer(None).filter(id__in=batch_ids):
+                        stored_rows = list(
+                            Repayment.objects.filter(loan_id=loan.id).order_by('payment_no').values_list(
+                                'payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance'
+                            )
+                        )
+                        if stored_rows != list(expected_schedule(loan).rows()):
+                            raise CommandError(f'Stored repayments for loan {loan.id} do not match the expected schedule.')
+                Repayment.objects.filter(loan_id__in=batch_ids).delete()
+
+        return len(loan_ids)
@@ -0,0 +1,122 @@
+from bisect import bisect_left
+from threading import Lock
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from loan_app.db.pool import pool_stats
+from .schedule import get_schedule_cache
+
+# Upper bounds in seconds of the request latency histogram buckets, the Prometheus client defaults
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class ViewMetrics:
+    """Latency histogram, response status counts and database use of one view action"""
+
+    __slots__ = ('bucket_counts', 'count', 'latency_sum', 'queries', 'db_time', 'statuses')
+
+    def __init__(self):
+        # One count per bucket plus one for requests slower than the last bound
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.latency_sum = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.statuses = {}
+
+
+
+class MetricsRegistry:
+    """Thread-safe store of request metrics for this process, keyed by view and action"""
+
+    def __init__(self):
+        self.views = {}
+        self.lock = Lock()
+
+
+    def record(self, view, action, status_code, latency, queries, db_time):
+        """Add one request to the metrics of its view action"""
+
+        with self.lock:
+            metrics = self.views.get((view, action))
+            if metrics is None:
+                metrics = self.views[(view, action)] = ViewMetrics()
+            metrics.bucket_counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            metrics.count += 1
+            metrics.latency_sum += latency
+            metrics.queries += queries
+            metrics.db_time += db_time
+            metrics.statuses[status_code] = metrics.statuses.get(status_code, 0) + 1
+
+
+    def clear(self):
+        with self.lock:
+            self.views = {}
+
+
+    def render(self):
+        """Return all request, schedule cache and connection pool metrics in Prometheus text format"""
+
+        with self.lock:
+            views = sorted(
+                ((view, action, list(metrics.bucket_counts), metrics.count, metrics.latency_sum,
+                  metrics.queries, metrics.db_time, dict(metrics.statuses)) for (view, action), metrics in self.views.items())
+            )
+
+        lines = [
+            '# HELP loan_request_duration_seconds Request latency by view action',
+            '# TYPE loan_request_duration_seconds histogram',
+        ]
+        for view, action, bucket_counts, count, latency_sum, *rest in views:
+            labels = f'view="{view}",action="{action}"'
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f'loan_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'loan_request_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'loan_request_duration_seconds_sum{{{labels}}} {latency_sum!r}')
+            lines.append(f'loan_request_duration_seconds_count{{{labels}}} {count}')
+
+        lines += ['# HELP loan_responses_total Responses by view action and status code', '# TYPE loan_responses_total counter']
+        for view, action, *rest, statuses in views:
+            for status_code, status_count in sorted(statuses.items()):
+                lines.append(f'loan_responses_total{{view="{view}",action="{action}",status="{status_code}"}} {status_count}')
+
+        lines += ['# HELP loan_db_queries_total Database queries by view action', '# TYPE loan_db_queries_total counter']
+        for view, action, bucket_counts, count, latency_sum, queries, db_time, statuses in views:
+            lines.append(f'loan_db_queries_total{{view="{view}",action="{action}"}} {queries}')
+
+        lines += ['# HELP loan_db_duration_seconds_total Time spent running database queries by view action', '# TYPE loan_db_duration_seconds_total counter']
+        for view, action, bucket_counts, count, latency_sum, queries, db_time, statuses in views:
+            lines.append(f'loan_db_duration_seconds_total{{view="{view}",action="{action}"}} {db_time!r}')
+
+        lines += render_stats('loan_schedule_cache', 'Repayment schedule cache', {'': get_schedule_cache().stats()}, ('hits', 'misses', 'evictions'))
+        lines += render_stats('loan_db_pool', 'Database connection pool', pool_stats(), ('hits', 'misses', 'discarded', 'overflow'))
+        return '\n'.join(lines) + '\n'
+
+
+
+def render_stats(prefix, description, stats_by_alias, counters):
+    """Render stats dicts as Prometheus counters and gauges, labelled with their database alias if there is one"""
+
+    lines = []
+    for name in next(iter(stats_by_alias.values()), {}):
+        kind = 'counter' if name in counters else 'gauge'
+        metric = f'{prefix}_{name}_total' if kind == 'counter' else f'{prefix}_{name}'
+        lines += [f'# HELP {metric} {description} {name.replace("_", " ")}', f'# TYPE {metric} {kind}']
+        for alias, stats in sorted(stats_by_alias.items()):
+            labels = f'{{alias="{alias}"}}' if alias else ''
+            lines.append(f'{metric}{labels} {stats[name]}')
+    return lines
+
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """Expose the metrics of this process for Prometheus to scrape"""
+
+    if not settings.LOAN_METRICS:
+        raise Http404('Metrics are turned off.')
+    return HttpResponse(registry.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,216 @@
+import cProfile
+import hmac
+import os
+import random
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from threading import Lock
+from time import perf_counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from .metrics import registry
+
+
+class QueryCounter:
+    """Number of database queries of a request and the time spent running them"""
+
+    __slots__ = ('queries', 'db_time')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+
+# Counter of the request being handled. Context variables are copied into sync_to_async
+# threads, so queries of async views count towards the request that made them
+current_counter = ContextVar('loan_query_counter', default=None)
+
+
+def count_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query to the counter of the current request, if any"""
+
+    counter = current_counter.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        counter.db_time += perf_counter() - start
+        counter.queries += 1
+
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """Add count_query to a database connection as it is opened, in whichever thread opens it"""
+
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+
+def view_labels(request):
+    """Return the view and action names of a resolved request, e.g. ('LoanViewSet', 'retrieve')"""
+
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unresolved', request.method.lower()
+
+    view_func = resolver_match.func
+    # Viewsets map each http method to an action, other class based views are labelled by method
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    actions = getattr(view_func, 'actions', None) or {}
+    if view_class is None:
+        return view_func.__name__, request.method.lower()
+    return view_class.__name__, actions.get(request.method.lower(), request.method.lower())
+
+
+
+class MetricsMiddleware:
+    """Record latency, response status, query count and database time of each request by view action
+
+    Works in both sync and async middleware chains, so async views keep running without a thread.
+    Metrics are exposed at /metrics. Time spent sending a streamed response body is not included.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.LOAN_METRICS:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        self.record(request, response, perf_counter() - start, counter)
+        return response
+
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = current_counter.set(counter)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_counter.reset(token)
+        self.record(request, response, perf_counter() - start, counter)
+        return response
+
+
+    def record(self, request, response, latency, counter):
+        view, action = view_labels(request)
+        registry.record(view, action, response.status_code, latency, counter.queries, counter.db_time)
+
+
+
+class ProfilingMiddleware:
+    """Write a cProfile trace of selected requests to LOAN_PROFILE_DIR
+
+    A request is profiled when its X-Loan-Profile header matches LOAN_PROFILE_TOKEN, or at random
+    with probability LOAN_PROFILE_SAMPLE_RATE. Traces are named after the view action and time,
+    e.g. LoanViewSet.update.20221001T120000.000000Z.prof, and can be read with pstats or snakeviz.
+
+    cProfile records the thread it is started in. Under WSGI that thread runs the whole request.
+    Under ASGI it is the event loop: the trace holds the async view and middleware code, along with
+    any other request running on the loop at the time, but not ORM calls made through sync_to_async.
+    Profile those views through their sync equivalents instead.
+    """
+
+    sync_capable = True
+    async_capable = True
+    header = 'HTTP_X_LOAN_PROFILE'
+
+    def __init__(self, get_response):
+        self.token = settings.LOAN_PROFILE_TOKEN
+        self.sample_rate = settings.LOAN_PROFILE_SAMPLE_RATE
+        if not self.token and self.sample_rate <= 0:
+            raise MiddlewareNotUsed()
+        self.directory = settings.LOAN_PROFILE_DIR
+        os.makedirs(self.directory, exist_ok=True)
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Only one request is profiled at a time, others go through unprofiled
+        self.lock = Lock()
+
+
+    def requested(self, request):
+        """Return whether the request asked to be profiled with the right token"""
+
+        token = request.META.get(self.header)
+        return bool(self.token and token and hmac.compare_digest(token.encode(), self.token.encode()))
+
+
+    def selected(self, requested):
+        """Return whether to profile the request, taking the profiling lock if so"""
+
+        return (requested or random.random() < self.sample_rate) and self.lock.acquire(blocking=False)
+
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        requested = self.requested(request)
+        if not self.selected(requested):
+            return self.get_response(request)
+
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+            return self.save(request, response, profile, requested)
+        finally:
+            self.lock.release()
+
+
+    async def __acall__(self, request):
+        requested = self.requested(request)
+        if not self.selected(requested):
+            return await self.get_response(request)
+
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = await self.get_response(request)
+            finally:
+                profile.disable()
+            return self.save(request, response, profile, requested)
+        finally:
+            self.lock.release()
+
+
+    def save(self, request, response, profile, requested):
+        """Write the trace of a profiled request, naming the file in the response if it was asked for"""
+
+        view, action = view_labels(request)
+        timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ')
+        file_name = f'{view}.{action}.{timestamp}.prof'
+        profile.dump_stats(os.path.join(self.directory, file_name))
+
+        if requested:
+            response['X-Loan-Profile-File'] = file_name
+        return response
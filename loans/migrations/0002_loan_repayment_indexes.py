@@ -0,0 +1,35 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='repayment',
+            constraint=models.UniqueConstraint(fields=('loan', 'payment_no'), name='repayments_loan_payment_no_uniq'),
+        ),
+        migrations.AlterField(
+            model_name='repayment',
+            name='loan',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='loans.loan'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['loan_amount'], name='loans_loan_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['loan_term'], name='loans_loan_term_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['interest_rate'], name='loans_interest_rate_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_loan_repayment_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['created_at', 'id'], name='loans_created_at_id_idx'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:12
+
+from datetime import date
+from decimal import Decimal
+from django.db import migrations, models
+
+# Number of loans updated per statement by the backfill
+BACKFILL_BATCH_SIZE = 500
+SUMMARY_FIELDS = ('pmt', 'total_interest', 'total_payment', 'maturity_date')
+SIX_PLACES = Decimal('0.000001')
+CENTS = Decimal('0.01')
+
+
+def calculate_summary(loan_amount, interest_rate, loan_term, loan_month, loan_year):
+    """Calculate the summary fields of a loan
+
+    A copy of the schedule calculation at the time of this migration, so later changes to
+    loans.schedule cannot change what the backfill stores.
+    """
+
+    interest_rate = interest_rate / 100
+    pmt = round(loan_amount * (interest_rate/12) / (1 - ((1 + (interest_rate/12)) ** (-12 * loan_term))), 6)
+    monthly_rate = interest_rate / 12
+    no_of_months = loan_term * 12
+
+    total_interest = Decimal(0)
+    balance = loan_amount
+    for _ in range(no_of_months):
+        monthly_interest = (monthly_rate * balance).quantize(SIX_PLACES)
+        balance = (balance - (pmt - monthly_interest).quantize(SIX_PLACES)).quantize(SIX_PLACES)
+        total_interest += monthly_interest
+
+    month_index = int(loan_month) - 1 + no_of_months
+    return {
+        'pmt': pmt,
+        'total_interest': total_interest.quantize(CENTS),
+        'total_payment': sum([pmt] * no_of_months, Decimal(0)).quantize(CENTS),
+        'maturity_date': date(int(loan_year) + month_index // 12, month_index % 12 + 1, 1),
+    }
+
+
+def backfill_loan_summary(apps, schema_editor):
+    """Calculate the summary fields of existing loans from their repayment schedules"""
+
+    Loan = apps.get_model('loans', 'Loan')
+    loan_ids = list(Loan.objects.filter(pmt__isnull=True).order_by('id').values_list('id', flat=True))
+
+    for start in range(0, len(loan_ids), BACKFILL_BATCH_SIZE):
+        loans = list(Loan.objects.filter(id__in=loan_ids[start:start + BACKFILL_BATCH_SIZE]))
+        for loan in loans:
+            summary = calculate_summary(loan.loan_amount, loan.interest_rate, loan.loan_term, loan.loan_month, loan.loan_year)
+            for field, value in summary.items():
+                setattr(loan, field, value)
+        Loan.objects.bulk_update(loans, SUMMARY_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_loan_created_at_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='maturity_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='pmt',
+            field=models.DecimalField(decimal_places=6, max_digits=21, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='total_interest',
+            field=models.DecimalField(decimal_places=2, max_digits=21, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='total_payment',
+            field=models.DecimalField(decimal_places=2, max_digits=21, null=True),
+        ),
+        migrations.RunPython(backfill_loan_summary, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['pmt'], name='loans_pmt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['total_interest'], name='loans_total_interest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['total_payment'], name='loans_total_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['maturity_date'], name='loans_maturity_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.1 on 2026-10-17 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_loan_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='schedule_blob',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.1 on 2026-10-17 21:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_loan_schedule_blob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='repayment',
+            index=models.Index(fields=['date', 'principal', 'interest'], name='repayments_date_amounts_idx'),
+        ),
+    ]
@@ -1,22 +1,54 @@
 from django.db import models
 
+
+class LoanManager(models.Manager):
+    """Leave the packed repayment schedule out of loan queries unless it is asked for with defer(None)"""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('schedule_blob')
+
+
+
 class Loan(models.Model):
     """Database model for individual loans"""
 
     # Customize database table name
     class Meta:
       db_table = 'loans'
+      # Support range filtering on loan details
+      indexes = [
+        models.Index(fields=['loan_amount'], name='loans_loan_amount_idx'),
+        models.Index(fields=['loan_term'], name='loans_loan_term_idx'),
+        models.Index(fields=['interest_rate'], name='loans_interest_rate_idx'),
+        # Keyset pagination order
+        models.Index(fields=['created_at', 'id'], name='loans_created_at_id_idx'),
+        # Range filtering and sorting on loan summary
+        models.Index(fields=['pmt'], name='loans_pmt_idx'),
+        models.Index(fields=['total_interest'], name='loans_total_interest_idx'),
+        models.Index(fields=['total_payment'], name='loans_total_payment_idx'),
+        models.Index(fields=['maturity_date'], name='loans_maturity_date_idx'),
+      ]
 
     loan_amount = models.DecimalField(max_digits=21, decimal_places=6)
     loan_term = models.IntegerField()
     interest_rate = models.DecimalField(max_digits=21, decimal_places=6)
     loan_month = models.CharField(max_length=2)
     loan_year = models.IntegerField()
+    # Summary of the repayment schedule, kept in step with the loan details above. Totals are
+    # rounded to the cent, which keeps them exact when rendered as JSON numbers
+    pmt = models.DecimalField(max_digits=21, decimal_places=6, null=True)
+    total_interest = models.DecimalField(max_digits=21, decimal_places=2, null=True)
+    total_payment = models.DecimalField(max_digits=21, decimal_places=2, null=True)
+    maturity_date = models.DateField(null=True)
+    # Whole repayment schedule in one blob when LOAN_SCHEDULE_STORAGE is 'packed', see loans.packed
+    schedule_blob = models.BinaryField(null=True)
     # Automatically set the field to now when the object is first created.
     created_at = models.DateTimeField(auto_now_add=True)
     # Automatically set the field to now every time the object is saved.
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = LoanManager()
+
     
   
 class Repayment(models.Model):
@@ -25,8 +57,16 @@ class Repayment(models.Model):
     # Customize database table name
     class Meta:
       db_table = 'repayments'
+      # Also serves lookups by loan in payment order, so the foreign key needs no index of its own
+      constraints = [
+        models.UniqueConstraint(fields=['loan', 'payment_no'], name='repayments_loan_payment_no_uniq'),
+      ]
+      # Portfolio cash flow totals by installment date, read from the index alone
+      indexes = [
+        models.Index(fields=['date', 'principal', 'interest'], name='repayments_date_amounts_idx'),
+      ]
 
-    loan = models.ForeignKey(Loan, on_delete=models.CASCADE)
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, db_index=False)
     payment_no = models.IntegerField()
     date = models.DateField()
     payment_amount = models.DecimalField(max_digits=21, decimal_places=6)
@@ -0,0 +1,118 @@
+import struct
+import sys
+from array import array
+from .fixed_point import fixed_point_schedule, from_micros
+from .schedule import CENTS, Schedule, check_month, installment_date, installment_dates, schedule_for_loan
+
+# Format version, start year, start month, number of installments and PMT in micro-units,
+# padded so the PMT and the columns that follow start on an 8 byte boundary
+PACKED_HEADER = struct.Struct('<BHBH2xq')
+PACKED_VERSION = 2
+# Columns stored after the header, each as one run of little-endian int64 micro-units (1e-6).
+# Every installment pays the PMT, so the payment amount column is rebuilt from the header
+PACKED_COLUMNS = ('principal', 'interest', 'balance')
+# Header of version 1 schedules, whose columns start with the payment amount of every installment
+PACKED_HEADER_V1 = struct.Struct('<BHBH2x')
+
+
+def packed_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year):
+    """Calculate the packed repayment schedule and summary fields of a loan
+
+    The integer micro-unit columns of the fixed-point engine are stored as they are,
+    without building Decimal values for every installment.
+    """
+
+    pmt, principal_list, interest_list, balance_list = fixed_point_schedule(loan_amount, interest_rate, loan_term)
+    no_of_months = loan_term * 12
+
+    values = array('q', principal_list)
+    values.extend(interest_list)
+    values.extend(balance_list)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    blob = PACKED_HEADER.pack(PACKED_VERSION, int(loan_year), check_month(loan_month), no_of_months, pmt) + values.tobytes()
+
+    summary = {
+        'pmt': from_micros(pmt),
+        'total_interest': from_micros(sum(interest_list)).quantize(CENTS),
+        'total_payment': from_micros(pmt * no_of_months).quantize(CENTS),
+        'maturity_date': installment_date(loan_month, loan_year, no_of_months),
+    }
+    return blob, summary
+
+
+
+def packed_columns(blob):
+    """Return the start year, start month, number of installments and PMT of a packed schedule,
+    with its principal, interest and balance as a flat sequence of integer micro-units, column
+    after column
+
+    On little-endian machines the amounts are a memoryview over the blob itself, so
+    nothing is copied until values are read from it.
+    """
+
+    version = blob[0]
+    if version == PACKED_VERSION:
+        version, loan_year, loan_month, no_of_months, pmt = PACKED_HEADER.unpack_from(blob)
+        header_size, no_of_columns = PACKED_HEADER.size, len(PACKED_COLUMNS)
+    elif version == 1:
+        version, loan_year, loan_month, no_of_months = PACKED_HEADER_V1.unpack_from(blob)
+        header_size, no_of_columns = PACKED_HEADER_V1.size, len(PACKED_COLUMNS) + 1
+    else:
+        raise Exception(f'Unsupported packed schedule version {version}.')
+
+    columns = memoryview(blob)[header_size:]
+    if len(columns) != no_of_months * no_of_columns * 8:
+        raise Exception('Packed schedule is truncated.')
+
+    if sys.byteorder == 'little':
+        values = columns.cast('q')
+    else:
+        values = array('q', columns.tobytes())
+        values.byteswap()
+
+    if version == 1:
+        pmt = values[0]
+        values = values[no_of_months:]
+    return loan_year, loan_month, no_of_months, pmt, values
+
+
+
+def unpack_schedule(blob):
+    """Rebuild the repayment schedule stored in a packed blob"""
+
+    loan_year, loan_month, no_of_months, pmt, values = packed_columns(blob)
+    principal, interest, balance = (
+        list(map(from_micros, values[index * no_of_months:(index + 1) * no_of_months]))
+        for index in range(len(PACKED_COLUMNS))
+    )
+
+    return Schedule(
+        payment_no = range(1, no_of_months + 1),
+        date = installment_dates(loan_month, loan_year, no_of_months),
+        payment_amount = [from_micros(pmt)] * no_of_months,
+        principal = principal,
+        interest = interest,
+        balance = balance,
+    )
+
+
+
+def stored_schedule(loan):
+    """Unpack the repayment schedule of a loan, calculating it for loans saved before schedules were
+    packed and not yet moved over with migrate_schedule_storage"""
+
+    if loan.schedule_blob is None:
+        return schedule_for_loan(loan)
+    return unpack_schedule(loan.schedule_blob)
+
+
+
+def packed_repayments(loan):
+    """Build the repayment list of a loan from its packed schedule, the same as computed_repayments gives
+
+    Like computed repayments, and unlike stored repayment rows, they have no id and carry the
+    created_at and updated_at of the loan.
+    """
+
+    return stored_schedule(loan).to_repayments(loan, created_at=loan.created_at, updated_at=loan.updated_at)
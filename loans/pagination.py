@@ -0,0 +1,161 @@
+from base64 import b64decode, b64encode
+from collections import namedtuple
+from urllib import parse
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Sort value and id of the loan a page starts after, and whether the page is read backwards from there
+KeysetCursor = namedtuple('KeysetCursor', ['value', 'id', 'reverse'])
+
+
+class LoanCursorPagination(CursorPagination):
+    """Keyset pagination of loans in creation order, or the order they are sorted by, with an
+    opaque next/previous cursor
+
+    Loans are paged in (sort value, id) order and the cursor holds both values of the row a
+    page starts after, so each page is fetched with a WHERE on that pair instead of an OFFSET.
+    Deep pages cost the same as the first however many loans share a sort value. Responses are
+    only paginated when a page size is given by the LOAN_PAGE_SIZE setting or the page_size
+    query string field.
+    """
+
+    ordering = ('created_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.sort_field = queryset.model._meta.get_field(self.ordering[0].lstrip('-'))
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        queryset = queryset.order_by(*self.keyset_ordering(reverse))
+        if self.cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(self.cursor))
+
+        # One extra row tells whether there is a page beyond this one
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+
+    def get_ordering(self, request, queryset, view):
+        """Page in the order of a sorted queryset, e.g. (ordering, 'id') from the loan filter, otherwise in creation order"""
+
+        if queryset.query.order_by:
+            return tuple(queryset.query.order_by)
+        return super().get_ordering(request, queryset, view)
+
+
+    def keyset_ordering(self, reverse):
+        """Order by the sort field, then id, both turned around when reading backwards"""
+
+        descending = self.ordering[0].startswith('-') != reverse
+        value = F(self.sort_field.name)
+        if self.sort_field.null:
+            # Loans without a value sort first, on every backend, so the cursor can step over them
+            value = value.desc(nulls_last=True) if descending else value.asc(nulls_first=True)
+        else:
+            value = value.desc() if descending else value.asc()
+        return value, '-id' if reverse else 'id'
+
+
+    def keyset_filter(self, cursor):
+        """Select rows after the cursor in the order given by keyset_ordering
+
+        Written as value >= v AND (value > v OR id > i) rather than an OR alone, so the
+        database can start a range scan of the (sort value, id) index at v.
+        """
+
+        descending = self.ordering[0].startswith('-') != cursor.reverse
+        value_lookup = 'lt' if descending else 'gt'
+        id_lookup = 'lt' if cursor.reverse else 'gt'
+        name = self.sort_field.name
+
+        if cursor.value is None:
+            # Loans without a value come before every other loan in ascending order
+            after = Q(**{f'{name}__isnull': True, f'id__{id_lookup}': cursor.id})
+            return after if descending else after | Q(**{f'{name}__isnull': False})
+
+        after = Q(**{f'{name}__{value_lookup}e': cursor.value}) & (
+            Q(**{f'{name}__{value_lookup}': cursor.value}) | Q(**{f'id__{id_lookup}': cursor.id})
+        )
+        if self.sort_field.null and descending:
+            after |= Q(**{f'{name}__isnull': True})
+        return after
+
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            # Read backwards past the first loan, so the next page is the first one
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(KeysetCursor(self.position(self.page[-1]), self.page[-1].id, False))
+
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(KeysetCursor(self.position(self.page[0]), self.page[0].id, True))
+
+
+    def position(self, loan):
+        """Sort value of a loan as text for the cursor, or None for a loan without one"""
+
+        if self.sort_field.value_from_object(loan) is None:
+            return None
+        return self.sort_field.value_to_string(loan)
+
+
+    def decode_cursor(self, request):
+        """Read the keyset cursor of a request, or None on the first page"""
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = parse.parse_qs(b64decode(encoded.encode('ascii')).decode('ascii'), keep_blank_values=True)
+            value = self.sort_field.to_python(tokens['p'][0]) if 'p' in tokens else None
+            loan_id = int(tokens['i'][0])
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        return KeysetCursor(value, loan_id, reverse)
+
+
+    def encode_cursor(self, cursor):
+        """Build the url of the page after a keyset cursor"""
+
+        tokens = {'i': cursor.id} if cursor.value is None else {'p': cursor.value, 'i': cursor.id}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+    def get_page_size(self, request):
+        """Use the page_size query string field if given, otherwise the LOAN_PAGE_SIZE setting"""
+
+        page_size = super().get_page_size(request)
+        if page_size is None:
+            page_size = settings.LOAN_PAGE_SIZE or None
+        return page_size
@@ -0,0 +1,231 @@
+from datetime import date
+from decimal import Decimal
+import numpy as np
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce
+from .models import Loan, Repayment
+from .schedule import CENTS
+
+PORTFOLIO_METHODS = ('closed_form', 'rows')
+# Longest cash flow projection, the longest loan term
+MAX_PROJECTION_MONTHS = 600
+
+
+def month_index(year, month):
+    """Number of months since year 0, so month differences are plain subtraction"""
+
+    return year * 12 + month
+
+
+
+def month_date(index):
+    """First day of the month with the given month index"""
+
+    year, month = divmod(index - 1, 12)
+    return date(year, month + 1, 1)
+
+
+
+def loan_arrays():
+    """Fetch the fields used by the closed forms as NumPy arrays with one element per loan
+
+    Amounts and rates are cast to floating point by the database, so no Decimal is built for them.
+    Returns the loan amounts, monthly rates, PMTs, number of installments and start month indexes.
+    """
+
+    loan_rows = list(Loan.objects.values_list(
+        Cast('loan_amount', FloatField()),
+        Cast('interest_rate', FloatField()),
+        Cast('pmt', FloatField()),
+        F('loan_term') * 12,
+        F('loan_year') * 12 + Cast('loan_month', IntegerField()),
+    ))
+    loan_table = np.array(loan_rows, dtype=np.float64).reshape(len(loan_rows), 5)
+
+    loan_amount = loan_table[:, 0]
+    monthly_rate = loan_table[:, 1] / 1200
+    no_of_months = loan_table[:, 3].astype(np.int64)
+
+    # Schedules use the stored PMT, rounded to 6 places, calculate it for loans saved without one
+    pmt = loan_table[:, 2]
+    missing = np.isnan(pmt)
+    pmt[missing] = np.round(
+        loan_amount[missing] * monthly_rate[missing] / (1 - (1 + monthly_rate[missing]) ** -no_of_months[missing]), 6
+    )
+
+    return loan_amount, monthly_rate, pmt, no_of_months, loan_table[:, 4].astype(np.int64)
+
+
+
+def annuity_balance(loan_amount, monthly_rate, pmt, payments_made):
+    """Closed-form balance after a number of installments, B(k) = P(1 + r)^k - PMT((1 + r)^k - 1) / r
+
+    Evaluated as (P - PMT / r)(1 + r)^k + PMT / r, which keeps the large terms from cancelling.
+    """
+
+    payoff = pmt / monthly_rate
+    return (loan_amount - payoff) * (1 + monthly_rate) ** payments_made + payoff
+
+
+
+def closed_form_balance(as_of):
+    """Total outstanding balance and number of outstanding loans on a date, from loan fields alone
+
+    Runs the closed-form annuity balance over every loan at once as NumPy arrays. Reads one row
+    per loan and no repayments. Floating point and the monthly rounding of stored schedules make
+    it differ from the stored balances by fractions of a cent per loan.
+    """
+
+    loan_amount, monthly_rate, pmt, no_of_months, start = loan_arrays()
+
+    # Installments paid by the date, loans start paying the month after they start
+    elapsed = month_index(as_of.year, as_of.month) - start
+    payments_made = np.clip(elapsed, 0, no_of_months)
+    outstanding = (elapsed >= 0) & (payments_made < no_of_months)
+
+    balance = annuity_balance(loan_amount, monthly_rate, pmt, payments_made)
+
+    return to_cents(float(balance[outstanding].sum())), int(outstanding.sum())
+
+
+
+def stored_rows_balance(as_of):
+    """Total outstanding balance and number of outstanding loans on a date, from stored repayments
+
+    Each loan's latest installment on or before the date has a payment number worked out from the
+    loan start, so its balance is read through the unique (loan, payment_no) index with a single
+    aggregated query that touches one repayment per loan instead of scanning every repayment.
+    Loans starting in the month of the date have paid nothing yet and count with their full amount.
+    """
+
+    as_of_index = Value(month_index(as_of.year, as_of.month))
+    payments_made = as_of_index - F('loan_year') * 12 - Cast('loan_month', IntegerField())
+    balance = Repayment.objects.filter(
+        loan_id=OuterRef('id'),
+        payment_no=as_of_index - OuterRef('loan_year') * 12 - Cast(OuterRef('loan_month'), IntegerField()),
+    ).values('balance')[:1]
+
+    totals = Loan.objects.alias(payments_made=payments_made).filter(
+        payments_made__gte=0,
+        payments_made__lt=F('loan_term') * 12,
+    ).annotate(
+        outstanding=Coalesce(Subquery(balance), F('loan_amount')),
+    ).aggregate(
+        balance=Sum('outstanding'),
+        loans=Count('id'),
+    )
+
+    return to_cents(totals['balance'] or 0), totals['loans']
+
+
+
+def portfolio_balance(as_of, method):
+    """Total outstanding balance of every loan on a date and the number of loans still outstanding"""
+
+    if method not in PORTFOLIO_METHODS:
+        raise Exception('Method must be closed_form or rows.')
+
+    if method == 'rows':
+        return stored_rows_balance(as_of)
+    return closed_form_balance(as_of)
+
+
+
+def closed_form_cash_flow(first_month, no_of_months):
+    """Yield (principal, interest, installments) totals for consecutive months, from loan fields alone
+
+    Balances come from the closed form in annuity_balance, with (1 + r)^k carried forward one
+    month at a time rather than the balance itself, so float errors are not compounded month on
+    month. Memory stays at a few arrays of one element per loan whatever the number of months.
+    Like closed_form_balance the totals are not rounded monthly.
+    """
+
+    loan_amount, monthly_rate, pmt, no_of_months_per_loan, start = loan_arrays()
+    payoff = pmt / monthly_rate
+    excess = loan_amount - payoff
+
+    # Number of the installment due in the first month, 0 or less for loans not started yet
+    installment = first_month - start
+    growth = (1 + monthly_rate) ** np.clip(installment - 1, 0, no_of_months_per_loan)
+
+    for month in range(no_of_months):
+        due = ((installment >= 1) & (installment <= no_of_months_per_loan)).astype(np.float64)
+        interest = monthly_rate * (excess * growth + payoff) * due
+        principal = pmt * due - interest
+        yield float(principal.sum()), float(interest.sum()), int(due.sum())
+
+        # Only loans that paid this month move on to their next balance
+        growth *= 1 + monthly_rate * due
+        installment += 1
+
+
+
+def stored_rows_cash_flow(first_month, no_of_months):
+    """Yield (principal, interest, installments) totals for consecutive months, from stored repayments
+
+    Sums repayments with one GROUP BY on the installment date, which returns a row per month.
+    The (date, principal, interest) index covers the query, so the repayments table is not read.
+    """
+
+    monthly_totals = Repayment.objects.filter(
+        date__gte=month_date(first_month),
+        date__lt=month_date(first_month + no_of_months),
+    ).values('date').annotate(
+        principal=Sum('principal'),
+        interest=Sum('interest'),
+        installments=Count('id'),
+    ).order_by('date')
+    totals_by_date = {row['date']: row for row in monthly_totals}
+
+    for month in range(first_month, first_month + no_of_months):
+        row = totals_by_date.get(month_date(month))
+        if row is None:
+            yield 0, 0, 0
+        else:
+            yield row['principal'], row['interest'], row['installments']
+
+
+
+def portfolio_cash_flow(first_date, no_of_months, method):
+    """Return a generator of the expected principal, interest and total payment of every loan per month
+
+    Arguments are checked straight away, the months are then calculated one at a time as they are read.
+    """
+
+    if method not in PORTFOLIO_METHODS:
+        raise Exception('Method must be closed_form or rows.')
+    if no_of_months < 1 or no_of_months > MAX_PROJECTION_MONTHS:
+        raise Exception(f'Months must be within 1 - {MAX_PROJECTION_MONTHS}.')
+
+    first_month = month_index(first_date.year, first_date.month)
+    if method == 'rows':
+        monthly_totals = stored_rows_cash_flow(first_month, no_of_months)
+    else:
+        monthly_totals = closed_form_cash_flow(first_month, no_of_months)
+
+    return cash_flow_months(first_month, monthly_totals)
+
+
+
+def cash_flow_months(first_month, monthly_totals):
+    """Yield a dictionary of rounded totals for each month of a cash flow projection"""
+
+    for month, (principal, interest, installments) in enumerate(monthly_totals, first_month):
+        principal = to_cents(principal)
+        interest = to_cents(interest)
+        yield {
+            'date': month_date(month),
+            'principal': principal,
+            'interest': interest,
+            'payment': principal + interest,
+            'installments': installments,
+        }
+
+
+
+def to_cents(value):
+    """Round a float or Decimal total to a Decimal with 2 decimal places"""
+
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value).quantize(CENTS)
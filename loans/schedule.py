@@ -0,0 +1,428 @@
+from collections import OrderedDict
+from decimal import Decimal
+from datetime import date
+from threading import Lock
+from django.conf import settings
+from django.db.models import DateField, F, Func, Value
+from django.utils import timezone
+from .models import Repayment
+from .helper_functions import calculate_pmt, calculate_repayment
+
+# Quantum used for the 6 decimal place rounding applied at every step of the schedule
+SIX_PLACES = Decimal('0.000001')
+ZERO = Decimal('0.000000')
+# Quantum of the loan summary totals
+CENTS = Decimal('0.01')
+# Repayment fields that hold calculated schedule values
+SCHEDULE_FIELDS = ('date', 'payment_amount', 'principal', 'interest', 'balance')
+# Loan fields that summarize the repayment schedule
+SUMMARY_FIELDS = ('pmt', 'total_interest', 'total_payment', 'maturity_date')
+
+
+class Schedule:
+    """Repayment schedule for a single loan, held as one list per column"""
+
+    __slots__ = ('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance')
+
+    def __init__(self, payment_no, date, payment_amount, principal, interest, balance):
+        self.payment_no = payment_no
+        self.date = date
+        self.payment_amount = payment_amount
+        self.principal = principal
+        self.interest = interest
+        self.balance = balance
+
+
+    def __len__(self):
+        return len(self.payment_no)
+
+
+    def rows(self):
+        """Iterate over (payment_no, date, payment_amount, principal, interest, balance) tuples"""
+
+        return zip(self.payment_no, self.date, self.payment_amount, self.principal, self.interest, self.balance)
+
+
+    def to_repayments(self, loan, **fields):
+        """Build unsaved Repayment instances for the given loan, with any extra field values applied to every row"""
+
+        return [
+            Repayment(
+                loan = loan,
+                payment_no = payment_no,
+                date = date,
+                payment_amount = payment_amount,
+                principal = principal,
+                interest = interest,
+                balance = balance,
+                **fields,
+            )
+            for payment_no, date, payment_amount, principal, interest, balance in self.rows()
+        ]
+
+
+    def summary(self):
+        """Return the values of the loan summary fields for this schedule"""
+
+        return {
+            'pmt': self.payment_amount[0],
+            'total_interest': sum(self.interest, ZERO).quantize(CENTS),
+            'total_payment': sum(self.payment_amount, ZERO).quantize(CENTS),
+            'maturity_date': self.date[-1],
+        }
+
+
+
+# First day of every month an installment can fall on, from the earliest loan start year
+# accepted by LoanSerializer to the end of a 50 year loan starting in the latest one
+FIRST_TABLE_YEAR = 2017
+LAST_TABLE_YEAR = 2050 + 50
+MONTH_TABLE = tuple(date(year, month, 1) for year in range(FIRST_TABLE_YEAR, LAST_TABLE_YEAR + 1) for month in range(1, 13))
+
+
+def check_month(loan_month):
+    """Convert a loan start month to an integer, raising the same error as datetime for invalid months"""
+
+    loan_month = int(loan_month)
+    if loan_month < 1 or loan_month > 12:
+        raise ValueError('month must be in 1..12')
+    return loan_month
+
+
+
+def installment_dates(loan_month, loan_year, no_of_months):
+    """Return the date of every installment as a slice of the precomputed month table"""
+
+    loan_month = check_month(loan_month)
+
+    # Index of the month after the loan starts, when the first installment is due
+    start = (int(loan_year) - FIRST_TABLE_YEAR) * 12 + loan_month
+    if start >= 0 and start + no_of_months <= len(MONTH_TABLE):
+        return MONTH_TABLE[start:start + no_of_months]
+
+    # Dates outside the table are only reached by loans outside the validated range
+    return [installment_date(loan_month, loan_year, payment_no) for payment_no in range(1, no_of_months + 1)]
+
+
+
+def installment_date(loan_month, loan_year, payment_no):
+    """Return the date of a single installment"""
+
+    loan_month = check_month(loan_month)
+
+    index = (int(loan_year) - FIRST_TABLE_YEAR) * 12 + loan_month - 1 + payment_no
+    if 0 <= index < len(MONTH_TABLE):
+        return MONTH_TABLE[index]
+
+    month_index = loan_month - 1 + payment_no
+    return date(int(loan_year) + month_index // 12, month_index % 12 + 1, 1)
+
+
+
+def installment_for_date(loan_month, loan_year, loan_term, on_date):
+    """Find the number of the latest installment due on or before a date"""
+
+    payment_no = (on_date.year * 12 + on_date.month) - (int(loan_year) * 12 + int(loan_month))
+    if payment_no < 1:
+        raise Exception('Date is before the first installment.')
+
+    # Loans are fully repaid after the last installment
+    return min(payment_no, loan_term * 12)
+
+
+
+def calculate_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year):
+    """Calculate the full repayment schedule for a loan
+
+    Gives the same values as calling calculate_repayment once per month. The balance
+    of each month depends on the rounded balance of the previous one, so the rounding
+    recurrence runs as a single loop with everything else hoisted out of it.
+    """
+
+    interest_rate = interest_rate / 100
+    pmt = calculate_pmt(loan_amount, interest_rate, loan_term)
+    monthly_rate = interest_rate / 12
+    no_of_months = loan_term * 12
+
+    principal_list = []
+    interest_list = []
+    balance_list = []
+    add_principal = principal_list.append
+    add_interest = interest_list.append
+    add_balance = balance_list.append
+
+    balance = loan_amount
+    for _ in range(no_of_months):
+        monthly_interest = (monthly_rate * balance).quantize(SIX_PLACES)
+        principal = (pmt - monthly_interest).quantize(SIX_PLACES)
+        balance = (balance - principal).quantize(SIX_PLACES)
+        add_interest(monthly_interest)
+        add_principal(principal)
+        add_balance(balance)
+
+    # Final installment clears any remaining balance
+    balance_list[-1] = ZERO
+
+    return Schedule(
+        payment_no = range(1, no_of_months + 1),
+        date = installment_dates(loan_month, loan_year, no_of_months),
+        payment_amount = [pmt] * no_of_months,
+        principal = principal_list,
+        interest = interest_list,
+        balance = balance_list,
+    )
+
+
+
+def calculate_installment(loan_amount, interest_rate, loan_term, loan_month, loan_year, payment_no):
+    """Calculate a single installment without calculating the installments before it
+
+    Uses the closed-form annuity balance, B(k) = P(1 + r)^k - PMT((1 + r)^k - 1) / r, for
+    the balance before the installment. The schedule rounds its balance every month, so
+    values may differ from calculate_repayment in the last decimal places.
+    """
+
+    no_of_months = loan_term * 12
+    if payment_no < 1 or payment_no > no_of_months:
+        raise Exception('Installment is not within the loan term.')
+
+    interest_rate = interest_rate / 100
+    pmt = calculate_pmt(loan_amount, interest_rate, loan_term)
+    monthly_rate = interest_rate / 12
+
+    growth = (1 + monthly_rate) ** (payment_no - 1)
+    previous_balance = (loan_amount * growth - pmt * (growth - 1) / monthly_rate).quantize(SIX_PLACES)
+    monthly_interest = (monthly_rate * previous_balance).quantize(SIX_PLACES)
+    principal = (pmt - monthly_interest).quantize(SIX_PLACES)
+    if payment_no != no_of_months:
+        balance = (previous_balance - principal).quantize(SIX_PLACES)
+    else:
+        balance = ZERO
+
+    return {
+        'payment_no': payment_no,
+        'date': installment_date(loan_month, loan_year, payment_no),
+        'payment_amount': pmt,
+        'principal': principal,
+        'interest': monthly_interest,
+        'balance': balance,
+    }
+
+
+
+def calculate_installment_row_by_row(loan_amount, interest_rate, loan_term, loan_month, loan_year, payment_no):
+    """Calculate a single installment by running calculate_repayment up to it"""
+
+    interest_rate = interest_rate / 100
+    pmt = calculate_pmt(loan_amount, interest_rate, loan_term)
+    no_of_months = loan_term * 12
+    dict = {
+        'balance': loan_amount,
+    }
+
+    for month in range(1, payment_no + 1):
+        monthly_repayment = calculate_repayment(interest_rate, pmt, None, loan_month, loan_year, month, dict, no_of_months)
+
+    return {
+        'payment_no': monthly_repayment['payment_no'],
+        'date': monthly_repayment['date'].date(),
+        'payment_amount': monthly_repayment['payment_amount'],
+        'principal': monthly_repayment['principal'],
+        'interest': monthly_repayment['interest'],
+        'balance': Decimal(monthly_repayment['balance']).quantize(SIX_PLACES),
+    }
+
+
+
+class ScheduleCache:
+    """Process-local LRU cache of repayment schedules keyed by loan parameters
+
+    Cached schedules are shared between loans with the same parameters, so their
+    columns must not be modified. Use Schedule.to_repayments to bind one to a loan.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+    def get(self, loan_amount, interest_rate, loan_term, loan_month, loan_year):
+        """Return the cached schedule for the loan parameters, calculating it on a miss"""
+
+        # Decimal hashing is by value, so 1000 and 1000.000000 share an entry
+        key = (Decimal(loan_amount), Decimal(interest_rate), int(loan_term), int(loan_month), int(loan_year))
+
+        with self.lock:
+            schedule = self.entries.get(key)
+            if schedule is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return schedule
+            self.misses += 1
+
+        schedule = calculate_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year)
+
+        with self.lock:
+            self.entries[key] = schedule
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+        return schedule
+
+
+    def stats(self):
+        """Return hit, miss and eviction counters and the current number of entries"""
+
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self.entries),
+                'max_size': self.max_size,
+            }
+
+
+    def clear(self):
+        """Remove all entries and reset counters"""
+
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+
+_schedule_cache = None
+
+
+def get_schedule_cache():
+    """Return the schedule cache, recreating it if LOAN_SCHEDULE_CACHE_SIZE has changed"""
+
+    global _schedule_cache
+    if _schedule_cache is None or _schedule_cache.max_size != settings.LOAN_SCHEDULE_CACHE_SIZE:
+        _schedule_cache = ScheduleCache(settings.LOAN_SCHEDULE_CACHE_SIZE)
+    return _schedule_cache
+
+
+
+def cached_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year):
+    """Calculate the repayment schedule for a loan, reusing schedules of loans with the same parameters"""
+
+    if settings.LOAN_SCHEDULE_CACHE_SIZE <= 0:
+        return calculate_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year)
+    return get_schedule_cache().get(loan_amount, interest_rate, loan_term, loan_month, loan_year)
+
+
+
+def schedule_for_loan(loan):
+    """Calculate the repayment schedule from the fields of a saved loan"""
+
+    return cached_schedule(loan.loan_amount, loan.interest_rate, loan.loan_term, loan.loan_month, loan.loan_year)
+
+
+
+def computed_repayments(loan):
+    """Build the repayment list of a loan whose schedule is not stored in db"""
+
+    # Rows share the timestamps of the loan they were calculated from
+    return schedule_for_loan(loan).to_repayments(loan, created_at=loan.created_at, updated_at=loan.updated_at)
+
+
+
+class AddMonths(Func):
+    """Date a number of months after a date, calculated by the database
+
+    Only used on the first day of a month, so there is no month end to clamp to.
+    """
+
+    arity = 2
+    output_field = DateField()
+
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template='DATE_ADD(%(expressions)s MONTH)', arg_joiner=', INTERVAL ', **extra_context)
+
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="date(%(expressions)s || ' months')", arg_joiner=", '+' || ", **extra_context)
+
+
+
+def update_repayments(loan, schedule):
+    """Bring the stored repayments of a loan in line with a new schedule
+
+    Repayments whose values are unchanged are left alone, changed ones are written
+    with one set-based bulk update, and only the rows beyond the old or new term are
+    inserted or deleted. A change of start date alone is a single UPDATE of the date column.
+    Returns the loan's repayments in payment order as they are now stored.
+    """
+
+    existing_repayments = {repayment.payment_no: repayment for repayment in Repayment.objects.filter(loan_id=loan.id)}
+    now = timezone.now()
+
+    repayment_list = []
+    changed_fields = set()
+    changed_repayments = []
+    new_repayments = []
+    for payment_no, *values in schedule.rows():
+        repayment = existing_repayments.pop(payment_no, None)
+        if repayment is None:
+            repayment = Repayment(loan=loan, payment_no=payment_no, **dict(zip(SCHEDULE_FIELDS, values)))
+            new_repayments.append(repayment)
+        else:
+            fields = [field for field, value in zip(SCHEDULE_FIELDS, values) if getattr(repayment, field) != value]
+            if fields:
+                for field, value in zip(SCHEDULE_FIELDS, values):
+                    setattr(repayment, field, value)
+                repayment.updated_at = now
+                changed_fields.update(fields)
+                changed_repayments.append(repayment)
+        repayment_list.append(repayment)
+
+    # Rows left over belong to installments beyond the new loan term
+    if existing_repayments:
+        Repayment.objects.filter(loan_id=loan.id, payment_no__gt=len(schedule)).delete()
+    if changed_fields == {'date'}:
+        # Every installment moves by the same number of months, so one UPDATE works the dates out in db
+        start = Value(date(int(loan.loan_year), check_month(loan.loan_month), 1), output_field=DateField())
+        Repayment.objects.filter(loan_id=loan.id, payment_no__lte=len(schedule)).update(date=AddMonths(start, F('payment_no')), updated_at=now)
+    elif changed_repayments:
+        update_fields = [field for field in SCHEDULE_FIELDS if field in changed_fields] + ['updated_at']
+        Repayment.objects.bulk_update(changed_repayments, update_fields)
+    if new_repayments:
+        Repayment.objects.bulk_create(new_repayments)
+
+    return repayment_list
+
+
+
+def saved_repayments(repayment_list, loan_id):
+    """Return repayments just written to db for serializing, reading them back only if their ids are unknown
+
+    Backends such as MySQL do not return ids from a bulk insert.
+    """
+
+    if all(repayment.id is not None for repayment in repayment_list):
+        return repayment_list
+    return Repayment.objects.filter(loan_id=loan_id).order_by('payment_no')
+
+
+
+def stores_repayment_rows():
+    """Check if this deployment keeps the repayment schedule in the repayments table"""
+
+    return settings.LOAN_SCHEDULE_STORAGE == 'rows'
+
+
+
+def stores_packed_schedules():
+    """Check if this deployment keeps each repayment schedule packed into its loan row"""
+
+    return settings.LOAN_SCHEDULE_STORAGE == 'packed'
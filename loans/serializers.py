@@ -1,12 +1,24 @@
-from rest_framework import serializers
+import datetime
+import decimal
+from operator import attrgetter
+from django.db.models import QuerySet
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Loan, Repayment
 
+# Output fields of RepaymentSerializer in order, and the columns they are read from
+REPAYMENT_FIELDS = ('id', 'payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance', 'created_at', 'updated_at', 'loan')
+REPAYMENT_COLUMNS = ('id', 'payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance', 'created_at', 'updated_at', 'loan_id')
+
 class LoanSerializer(serializers.ModelSerializer):
     """Convert data between queryset and python dictionary data type for loan list data"""
 
     class Meta:
         model = Loan
-        fields = '__all__'
+        # The packed schedule is returned as a repayment list instead
+        exclude = ('schedule_blob',)
+        # Calculated from the repayment schedule
+        read_only_fields = ('pmt', 'total_interest', 'total_payment', 'maturity_date')
 
     def validate(self, data):
         """Validate fields before adding or modifying loans"""
@@ -43,4 +55,85 @@ class RepaymentSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Repayment
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+
+def repayment_values(repayments, chunk_size=None):
+    """Iterate over REPAYMENT_COLUMNS tuples of a repayment queryset or list of Repayment instances
+
+    Querysets are read with values_list, skipping model instances altogether. A chunk size
+    reads them through a cursor instead of caching every row.
+    """
+
+    if isinstance(repayments, QuerySet):
+        rows = repayments.values_list(*REPAYMENT_COLUMNS)
+        return rows.iterator(chunk_size=chunk_size) if chunk_size else iter(rows)
+    return map(attrgetter(*REPAYMENT_COLUMNS), repayments)
+
+
+
+def serialize_repayment_rows(rows):
+    """Build the same data as RepaymentSerializer(many=True) from REPAYMENT_COLUMNS tuples
+
+    Renders to identical JSON while skipping DRF's per field machinery. Decimals are quantized
+    exactly like serializers.DecimalField, and the output formats and time zone of the DRF date
+    and datetime fields are looked up once instead of once per value.
+    """
+
+    decimal_field = Repayment._meta.get_field('payment_amount')
+    places = decimal.Decimal('.1') ** decimal_field.decimal_places
+    context = decimal.getcontext().copy()
+    context.prec = decimal_field.max_digits
+
+    date_field = serializers.DateField()
+    if is_iso_8601(getattr(date_field, 'format', api_settings.DATE_FORMAT)):
+        date_to_representation = datetime.date.isoformat
+    else:
+        date_to_representation = date_field.to_representation
+
+    datetime_field = serializers.DateTimeField()
+    datetime_iso_8601 = is_iso_8601(getattr(datetime_field, 'format', api_settings.DATETIME_FORMAT))
+    field_timezone = datetime_field.default_timezone()
+    datetimes = {}
+
+    def datetime_to_representation(value):
+        if datetime_iso_8601 and field_timezone is not None and isinstance(value, datetime.datetime) and value.utcoffset() is not None:
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return datetime_field.to_representation(value)
+
+    data = []
+    for repayment_id, payment_no, date, payment_amount, principal, interest, balance, created_at, updated_at, loan_id in rows:
+        # Rows calculated on read share one timestamp, so each distinct one is converted once
+        if created_at not in datetimes:
+            datetimes[created_at] = datetime_to_representation(created_at)
+        if updated_at not in datetimes:
+            datetimes[updated_at] = datetime_to_representation(updated_at)
+        data.append({
+            'id': repayment_id,
+            'payment_no': payment_no,
+            'date': date_to_representation(date),
+            'payment_amount': payment_amount.quantize(places, context=context),
+            'principal': principal.quantize(places, context=context),
+            'interest': interest.quantize(places, context=context),
+            'balance': balance.quantize(places, context=context),
+            'created_at': datetimes[created_at],
+            'updated_at': datetimes[updated_at],
+            'loan': loan_id,
+        })
+    return data
+
+
+
+def is_iso_8601(output_format):
+    """Check if a DRF date or datetime output format setting asks for ISO 8601, which it matches case-insensitively"""
+
+    return isinstance(output_format, str) and output_format.lower() == ISO_8601
+
+
+
+def serialize_repayments(repayments):
+    """Serialize a repayment queryset or list of Repayment instances like RepaymentSerializer(many=True)"""
+
+    return serialize_repayment_rows(repayment_values(repayments))
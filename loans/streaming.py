@@ -0,0 +1,75 @@
+import json
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from .serializers import repayment_values, serialize_repayment_rows
+
+# Number of repayments rendered per chunk of the streamed response
+STREAM_CHUNK_SIZE = 100
+
+
+def stream_schedule_response(data, repayments):
+    """Stream loan data followed by its repayment list as JSON without building the full list in memory
+
+    Produces the same bytes as rendering {**data, 'repayment list': [...]} with a DRF Response.
+    """
+
+    return StreamingHttpResponse(render_schedule(data, repayments), content_type='application/json')
+
+
+
+def render_schedule(data, repayments):
+    """Render loan data and its repayment list as JSON, one chunk of repayments at a time"""
+
+    renderer = JSONRenderer()
+
+    # Reopen the rendered loan data to append the repayment list to it
+    head = renderer.render(data)[:-1]
+    if data:
+        head += b','
+    yield head + json.dumps('repayment list').encode() + b':['
+
+    if isinstance(repayments, QuerySet):
+        repayments = repayments.order_by('payment_no')
+    # Querysets are read through a cursor instead of caching every row
+    rows = repayment_values(repayments, chunk_size=STREAM_CHUNK_SIZE)
+
+    chunk = []
+    separator = b''
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == STREAM_CHUNK_SIZE:
+            # Render the chunk as a JSON array and drop its brackets
+            yield separator + renderer.render(serialize_repayment_rows(chunk))[1:-1]
+            separator = b','
+            chunk = []
+    if chunk:
+        yield separator + renderer.render(serialize_repayment_rows(chunk))[1:-1]
+
+    yield b']}'
+
+
+
+def stream_cash_flow_response(data, months):
+    """Stream projection details followed by its months as JSON, sending each month as soon as it is calculated"""
+
+    return StreamingHttpResponse(render_cash_flow(data, months), content_type='application/json')
+
+
+
+def render_cash_flow(data, months):
+    """Render projection details and its list of months as JSON, one month at a time"""
+
+    renderer = JSONRenderer()
+
+    head = renderer.render(data)[:-1]
+    if data:
+        head += b','
+    yield head + json.dumps('cash flow').encode() + b':['
+
+    separator = b''
+    for month in months:
+        yield separator + renderer.render(month)
+        separator = b','
+
+    yield b']}'
@@ -1,8 +1,11 @@
 from django.test import TestCase 
 from loans.helper_functions import calculate_pmt, calculate_repayment
+from loans.schedule import calculate_schedule, installment_date, installment_dates, ScheduleCache
+from dateutil import relativedelta
 from loans.serializers import LoanSerializer
 from loans.models import Loan
-from datetime import datetime
+from datetime import datetime, date
+from decimal import Decimal
 
 
 class CalculationTests(TestCase):
@@ -126,3 +129,96 @@ class CalculationTests(TestCase):
                 # Check if error is raised as expected
                 with self.assertRaises(Exception):
                     calculate_repayment(test_case['interest_rate'], test_case['pmt'], test_case['serialized_loan'], test_case['loan_month'], test_case['loan_year'], test_case['month'], test_case['dict'], test_case['no_of_months'])
+
+
+    def test_calculate_schedule(self):
+        """Test that the batch schedule matches the month by month repayment calculation"""
+
+        test_cases = (
+            {'loan_amount': Decimal(10000), 'interest_rate': Decimal(10), 'loan_term': 1, 'loan_month': '01', 'loan_year': 2022},
+            {'loan_amount': Decimal(100000000), 'interest_rate': Decimal(36), 'loan_term': 50, 'loan_month': '12', 'loan_year': 2040},
+            {'loan_amount': Decimal('25000000.5'), 'interest_rate': Decimal('29.125'), 'loan_term': 20, 'loan_month': '2', 'loan_year': 2023},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                schedule = calculate_schedule(test_case['loan_amount'], test_case['interest_rate'], test_case['loan_term'], test_case['loan_month'], test_case['loan_year'])
+
+                # Calculate expected schedule one month at a time
+                interest_rate = test_case['interest_rate'] / 100
+                pmt = calculate_pmt(test_case['loan_amount'], interest_rate, test_case['loan_term'])
+                no_of_months = test_case['loan_term'] * 12
+                dict = {'balance': test_case['loan_amount']}
+                expected_rows = []
+                for month in range(1, no_of_months + 1):
+                    repayment = calculate_repayment(interest_rate, pmt, None, test_case['loan_month'], test_case['loan_year'], month, dict, no_of_months)
+                    expected_rows.append((
+                        repayment['payment_no'],
+                        repayment['date'].date(),
+                        repayment['payment_amount'],
+                        repayment['principal'],
+                        repayment['interest'],
+                        repayment['balance'],
+                    ))
+
+                # Check if schedule length and values are as expected
+                self.assertEqual(len(schedule), no_of_months)
+                self.assertEqual(list(schedule.rows()), expected_rows)
+                # Check if dates are plain date objects
+                self.assertEqual(type(schedule.date[0]), date)
+
+
+    def test_schedule_cache(self):
+        """Test that schedules are reused for loans with the same parameters and evicted least recently used first"""
+
+        cache = ScheduleCache(max_size=2)
+        loan_a = (Decimal(10000), Decimal(10), 1, '01', 2022)
+        loan_b = (Decimal(50000), Decimal(20), 4, '07', 2024)
+        loan_c = (Decimal(400000), Decimal(10), 2, '1', 2020)
+
+        schedule_a = cache.get(*loan_a)
+        # Same parameters written differently share an entry
+        self.assertIs(cache.get(Decimal('10000.000000'), Decimal('10.000000'), 1, '1', 2022), schedule_a)
+        self.assertEqual(list(schedule_a.rows()), list(calculate_schedule(*loan_a).rows()))
+
+        cache.get(*loan_b)
+        # Use loan a so loan b becomes least recently used
+        cache.get(*loan_a)
+        cache.get(*loan_c)
+
+        # Check if counters are as expected
+        self.assertEqual(cache.stats(), {'hits': 2, 'misses': 3, 'evictions': 1, 'size': 2, 'max_size': 2})
+        # Check if loan b was evicted and loan a kept
+        self.assertIs(cache.get(*loan_a), schedule_a)
+        cache.get(*loan_b)
+        self.assertEqual(cache.stats()['misses'], 4)
+
+        # Check if cached schedule can be bound to different loans
+        first_loan = Loan(id=1)
+        second_loan = Loan(id=2)
+        self.assertEqual(schedule_a.to_repayments(first_loan)[0].loan_id, 1)
+        self.assertEqual(schedule_a.to_repayments(second_loan)[0].loan_id, 2)
+
+
+    def test_installment_dates(self):
+        """Test that installment dates from the month table match datetime and relativedelta"""
+
+        test_cases = [(str(loan_month), loan_year) for loan_year in range(2017, 2051) for loan_month in range(1, 13)]
+        # Start dates outside the month table
+        test_cases.extend((('01', 2016), ('12', 2051), ('06', 2100)))
+
+        for loan_month, loan_year in test_cases:
+            with self.subTest(loan_month=loan_month, loan_year=loan_year):
+                expected_dates = [
+                    (datetime(loan_year, int(loan_month), 1) + relativedelta.relativedelta(months=month)).date()
+                    for month in range(1, 601)
+                ]
+
+                # Check if every date is as expected
+                self.assertEqual(list(installment_dates(loan_month, loan_year, 600)), expected_dates)
+                self.assertEqual(installment_date(loan_month, loan_year, 1), expected_dates[0])
+                self.assertEqual(installment_date(loan_month, loan_year, 600), expected_dates[-1])
+
+        # Check if invalid months are rejected
+        with self.assertRaises(ValueError):
+            installment_dates('13', 2022, 12)
@@ -0,0 +1,146 @@
+from django.test import TestCase
+from django.core.management import call_command
+from io import StringIO
+import csv
+import json
+from unittest.mock import patch
+from rest_framework.test import APIClient
+from django.urls import reverse
+from loans.models import Loan, Repayment
+from loans.schedule import schedule_for_loan
+
+
+class CommandTests(TestCase):
+    """Tests for loan management commands"""
+
+    test_loans = (
+        {'loan_amount': 100000, 'loan_term': 2, 'interest_rate': 12, 'loan_year': 2022, 'loan_month': '05',},
+        {'loan_amount': 25000000, 'loan_term': 20, 'interest_rate': 29, 'loan_year': 2023, 'loan_month': '2',},
+    )
+
+
+    def test_migrate_schedule_storage(self):
+        """Test moving repayment schedules between stored rows and on-read calculation"""
+
+        # Make post requests to add test data to db
+        client = APIClient()
+        url = reverse('loans-list')
+        for loan in self.test_loans:
+            client.post(url, loan)
+
+        self.assertEqual(Repayment.objects.count(), 264)
+        expected_rows = {
+            loan.id: list(Repayment.objects.filter(loan=loan).order_by('payment_no').values_list('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance'))
+            for loan in Loan.objects.all()
+        }
+
+        # Remove stored rows
+        out = StringIO()
+        call_command('migrate_schedule_storage', 'computed', '--verify', '--batch-size', '1', stdout=out)
+
+        # Check if stored rows are removed and still match the calculated schedule
+        self.assertEqual(Repayment.objects.count(), 0)
+        self.assertIn('2 loan(s)', out.getvalue())
+        for loan in Loan.objects.all():
+            self.assertEqual(list(schedule_for_loan(loan).rows()), expected_rows[loan.id])
+
+        # Store rows again
+        out = StringIO()
+        call_command('migrate_schedule_storage', 'rows', stdout=out)
+
+        # Check if stored rows are the same as before
+        self.assertEqual(Repayment.objects.count(), 264)
+        self.assertIn('2 loan(s)', out.getvalue())
+        for loan in Loan.objects.all():
+            stored_rows = list(Repayment.objects.filter(loan=loan).order_by('payment_no').values_list('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance'))
+            self.assertEqual(stored_rows, expected_rows[loan.id])
+
+
+    def test_migrate_schedule_storage_packed(self):
+        """Test moving repayment schedules from stored rows into packed loan rows and back"""
+
+        # Make post requests to add test data to db
+        client = APIClient()
+        url = reverse('loans-list')
+        for loan in self.test_loans:
+            client.post(url, loan)
+
+        responses = {loan.id: client.get(reverse('loans-detail', kwargs={'pk': loan.id})).data for loan in Loan.objects.all()}
+
+        # Pack schedules and remove stored rows
+        out = StringIO()
+        call_command('migrate_schedule_storage', 'packed', '--verify', '--batch-size', '1', stdout=out)
+
+        # Check if stored rows are removed and packed schedules read back the same repayments
+        self.assertEqual(Repayment.objects.count(), 0)
+        self.assertIn('Packed repayment schedules for 2 loan(s).', out.getvalue())
+        with self.settings(LOAN_SCHEDULE_STORAGE='packed'):
+            for pk, expected_response in responses.items():
+                response = client.get(reverse('loans-detail', kwargs={'pk': pk})).data
+                self.assertEqual(response['loan'], expected_response['loan'])
+                repayment_fields = ('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance')
+                self.assertEqual(
+                    [[repayment[field] for field in repayment_fields] for repayment in response['repayment list']],
+                    [[repayment[field] for field in repayment_fields] for repayment in expected_response['repayment list']],
+                )
+
+        # Store rows again
+        out = StringIO()
+        call_command('migrate_schedule_storage', 'rows', stdout=out)
+
+        # Check if rows are back and packed schedules are removed
+        self.assertEqual(Repayment.objects.count(), 264)
+        self.assertFalse(Loan.objects.filter(schedule_blob__isnull=False).exists())
+
+
+    def test_export_loans(self):
+        """Test exporting loans and repayments as CSV and NDJSON"""
+
+        # Make post requests to add test data to db
+        client = APIClient()
+        url = reverse('loans-list')
+        for loan in self.test_loans:
+            client.post(url, loan)
+
+        # Export every loan as CSV
+        out = StringIO()
+        call_command('export_loans', stdout=out)
+        csv_rows = list(csv.reader(StringIO(out.getvalue())))
+
+        # Check if every repayment is exported in (loan_id, payment_no) order
+        self.assertEqual(csv_rows[0][:3], ['loan_id', 'loan_amount', 'loan_term'])
+        self.assertEqual(len(csv_rows), 265)
+        keys = [(int(row[0]), int(row[6])) for row in csv_rows[1:]]
+        self.assertEqual(keys, sorted(keys))
+        first_repayment = Repayment.objects.order_by('loan_id', 'payment_no').first()
+        self.assertEqual(csv_rows[1][6:], ['1', str(first_repayment.date), str(first_repayment.payment_amount), str(first_repayment.principal), str(first_repayment.interest), str(first_repayment.balance)])
+
+        # Check if reading in keyset batches gives the same rows, one query per batch
+        test_cases = (
+            {'storage': 'rows', 'chunk_size': 50, 'expected_query_count': 6},
+            {'storage': 'computed', 'chunk_size': 1, 'expected_query_count': 3},
+        )
+        for test_case in test_cases:
+            with self.subTest(storage=test_case['storage']):
+                out = StringIO()
+                with self.settings(LOAN_SCHEDULE_STORAGE=test_case['storage']), patch('loans.export.EXPORT_CHUNK_SIZE', test_case['chunk_size']):
+                    with self.assertNumQueries(test_case['expected_query_count']):
+                        call_command('export_loans', stdout=out)
+                self.assertEqual(list(csv.reader(StringIO(out.getvalue()))), csv_rows)
+
+        # Export filtered loans as NDJSON
+        out = StringIO()
+        call_command('export_loans', '--format', 'ndjson', '--loan-term-lower', '10', stdout=out)
+        ndjson_rows = [json.loads(line) for line in out.getvalue().splitlines()]
+
+        # Check if only repayments of the filtered loan are exported
+        self.assertEqual(len(ndjson_rows), 240)
+        self.assertEqual({row['loan_term'] for row in ndjson_rows}, {20})
+        self.assertEqual(ndjson_rows[-1]['balance'], 0)
+
+        # Check if summary field bounds are applied as well
+        out = StringIO()
+        call_command('export_loans', '--format', 'ndjson', '--maturity-date-upper', '2024-12-31', stdout=out)
+        ndjson_rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(ndjson_rows), 24)
+        self.assertEqual({row['loan_term'] for row in ndjson_rows}, {2})
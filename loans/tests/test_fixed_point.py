@@ -0,0 +1,64 @@
+from django.test import SimpleTestCase
+from decimal import Decimal
+import random
+from loans.fixed_point import fixed_point_schedule, from_micros, multiply_micros, to_micros
+from loans.schedule import calculate_schedule
+
+
+class FixedPointTests(SimpleTestCase):
+    """Differential tests of the fixed-point engine against the Decimal engine"""
+
+
+    def test_multiply_micros(self):
+        """Test that rounding of rate x balance matches Decimal, including ties and negative balances"""
+
+        generator = random.Random(10)
+        test_cases = [
+            # Exact ties round half to even
+            (Decimal('0.5'), 1), (Decimal('0.5'), 3), (Decimal('0.5'), -1), (Decimal('0.25'), 2), (Decimal('0.25'), 6),
+            # Rates with 28 significant digits
+            (Decimal('0.36') / 12, 100000000000000), (Decimal('0.1') / 12, 10000000000), (Decimal('0.29125') / 12, -3),
+        ]
+        for _ in range(2000):
+            rate = Decimal(generator.randint(10000, 3600000000)) / 10 ** 8 / 12
+            test_cases.append((rate, generator.randint(-10 ** 6, 10 ** 14)))
+
+        for rate, micros in test_cases:
+            with self.subTest(rate=rate, micros=micros):
+                sign, digits, exponent = rate.as_tuple()
+                coefficient = int(''.join(map(str, digits)))
+                expected = round(rate * from_micros(micros), 6)
+
+                # Check if fixed-point product is the same as the Decimal one
+                self.assertEqual(multiply_micros(coefficient, -exponent, micros), to_micros(expected))
+
+
+    def test_fixed_point_schedule(self):
+        """Test that the fixed-point engine gives the Decimal engine's schedule across the validated input range"""
+
+        # Corners of the range accepted by LoanSerializer.validate
+        test_cases = [
+            (Decimal(loan_amount), Decimal(interest_rate), loan_term)
+            for loan_amount in ('1000', '100000000')
+            for interest_rate in ('1', '36')
+            for loan_term in (1, 50)
+        ]
+        # Random loans with up to 6 decimal places
+        generator = random.Random(20)
+        for _ in range(150):
+            test_cases.append((
+                Decimal(generator.randint(1000 * 10 ** 6, 100000000 * 10 ** 6)) / 10 ** 6,
+                Decimal(generator.randint(1 * 10 ** 6, 36 * 10 ** 6)) / 10 ** 6,
+                generator.randint(1, 50),
+            ))
+
+        for loan_amount, interest_rate, loan_term in test_cases:
+            with self.subTest(loan_amount=loan_amount, interest_rate=interest_rate, loan_term=loan_term):
+                expected_schedule = calculate_schedule(loan_amount, interest_rate, loan_term, '06', 2030)
+                pmt, principal_list, interest_list, balance_list = fixed_point_schedule(loan_amount, interest_rate, loan_term)
+
+                # Check if integer columns are the scaled Decimal values
+                self.assertEqual(pmt, to_micros(expected_schedule.payment_amount[0]))
+                self.assertEqual(principal_list, [to_micros(principal) for principal in expected_schedule.principal])
+                self.assertEqual(interest_list, [to_micros(interest) for interest in expected_schedule.interest])
+                self.assertEqual(balance_list, [to_micros(balance) for balance in expected_schedule.balance])
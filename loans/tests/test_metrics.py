@@ -0,0 +1,106 @@
+import asyncio
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from loans.async_views import LoanEditAsyncView, json_response
+from loans.metrics import registry
+from loans.models import Loan
+
+
+class MetricsTests(TestCase):
+    """Test for request metrics middleware and endpoint"""
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+
+    def metrics(self, response):
+        """Return scraped metrics as a dict of sample name and labels to value"""
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+
+    def test_metrics(self):
+        """Test latency, status, query count and db time are recorded per view action"""
+
+        client = APIClient()
+        loan_data = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}
+        pk = client.post(reverse('loans-list'), loan_data).data['pk']
+        client.get(reverse('loans-detail', kwargs={'pk': pk}))
+        client.get(reverse('loans-detail', kwargs={'pk': pk}))
+        client.get(reverse('loans-detail', kwargs={'pk': 0}))
+        client.get(reverse('loans-async-list'))
+        samples = self.metrics(client.get(reverse('metrics')))
+
+        test_cases = (
+            {'view': 'LoanViewSet', 'action': 'create', 'expected_count': 1, 'expected_statuses': {'200': 1}},
+            {'view': 'LoanViewSet', 'action': 'retrieve', 'expected_count': 3, 'expected_statuses': {'200': 2, '404': 1}},
+            {'view': 'LoanListAsyncView', 'action': 'get', 'expected_count': 1, 'expected_statuses': {'200': 1}},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                labels = f'view="{test_case["view"]}",action="{test_case["action"]}"'
+                self.assertEqual(samples[f'loan_request_duration_seconds_count{{{labels}}}'], test_case['expected_count'])
+                self.assertEqual(samples[f'loan_request_duration_seconds_bucket{{{labels},le="+Inf"}}'], test_case['expected_count'])
+                self.assertGreater(samples[f'loan_request_duration_seconds_sum{{{labels}}}'], 0)
+                self.assertGreater(samples[f'loan_db_queries_total{{{labels}}}'], 0)
+                self.assertGreater(samples[f'loan_db_duration_seconds_total{{{labels}}}'], 0)
+                for status_code, expected_count in test_case['expected_statuses'].items():
+                    self.assertEqual(samples[f'loan_responses_total{{{labels},status="{status_code}"}}'], expected_count)
+
+        # Each retrieve reads the loan and its repayments, the missing loan only the loan
+        self.assertEqual(samples['loan_db_queries_total{view="LoanViewSet",action="retrieve"}'], 5)
+        self.assertIn('loan_schedule_cache_hits_total', samples)
+
+
+    async def test_metrics_async_concurrency(self):
+        """Test async views behind the middleware still run concurrently and their queries are counted"""
+
+        no_of_requests = 16
+        running = {'now': 0, 'peak': 0}
+
+        async def slow_get(view, request, *args, **kwargs):
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            await asyncio.sleep(0.1)
+            count = await Loan.objects.acount()
+            running['now'] -= 1
+            return json_response(count)
+
+        with mock.patch.object(LoanEditAsyncView, 'get', slow_get):
+            responses = await asyncio.gather(*(
+                self.async_client.get(reverse('loans-async-edit', kwargs={'pk': pk})) for pk in range(no_of_requests)
+            ))
+
+        # Check if every request was waiting at the same time instead of holding a thread each
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_200_OK})
+        self.assertEqual(running['peak'], no_of_requests)
+
+        labels = 'view="LoanEditAsyncView",action="get"'
+        samples = self.metrics(await self.async_client.get(reverse('metrics')))
+        self.assertEqual(samples[f'loan_request_duration_seconds_count{{{labels}}}'], no_of_requests)
+        self.assertEqual(samples[f'loan_db_queries_total{{{labels}}}'], no_of_requests)
+
+
+    def test_metrics_disabled(self):
+        """Test requests are not recorded and the endpoint is not found when metrics are off"""
+
+        with override_settings(LOAN_METRICS=False):
+            client = APIClient()
+            client.get(reverse('loans-list'))
+            response = client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(registry.views, {})
@@ -1,5 +1,11 @@
 from django.test import TestCase 
+from django.db import IntegrityError, connection, transaction
+from django.apps import apps
+from importlib import import_module
+from unittest import skipUnless
+from loans.helper_functions import filter_loans
 from loans.models import Loan, Repayment
+from loans.schedule import calculate_schedule, schedule_for_loan
 from loans.serializers import LoanSerializer, RepaymentSerializer
 from decimal import Decimal
 
@@ -81,4 +87,66 @@ class ModelTests(TestCase):
                 self.assertEqual(repayment_serializer['payment_amount'], test_case['payment_amount'])
                 self.assertEqual(repayment_serializer['principal'], test_case['principal'])
                 self.assertEqual(repayment_serializer['interest'], test_case['interest'])
-                self.assertEqual(repayment_serializer['balance'], test_case['balance'])
\ No newline at end of file
+                self.assertEqual(repayment_serializer['balance'], test_case['balance'])
+
+
+
+class QueryPlanTests(TestCase):
+    """Test indexes used by loan and repayment queries"""
+
+
+    def setUp(self):
+        self.loan = Loan.objects.create(loan_amount=10000, loan_term=1, interest_rate=10, loan_year=2022, loan_month=1)
+
+
+    def test_unique_payment_no(self):
+        """Test a loan cannot have two repayments with the same payment number"""
+
+        Repayment.objects.create(loan=self.loan, payment_no=1, date='2022-01-01', payment_amount=1, principal=1, interest=0, balance=0)
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Repayment.objects.create(loan=self.loan, payment_no=1, date='2022-01-01', payment_amount=1, principal=1, interest=0, balance=0)
+
+
+    @skipUnless(connection.vendor == 'sqlite', 'Query plan format is specific to SQLite')
+    def test_query_plans(self):
+        """Test schedule reads and loan filters search an index instead of scanning the table"""
+
+        test_cases = (
+            Repayment.objects.filter(loan_id=self.loan.id).order_by('payment_no'),
+            filter_loans({'loan_amount_lower': 5000, 'loan_amount_upper': 20000, 'loan_term_lower': 'null', 'loan_term_upper': 'null', 'interest_rate_lower': 'null', 'interest_rate_upper': 'null',}),
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                plan = test_case.explain()
+
+                self.assertIn('USING INDEX', plan)
+                self.assertNotIn('SCAN', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+
+    def test_backfill_loan_summary(self):
+        """Test the summary migration fills in loans saved without a summary"""
+
+        migration = import_module('loans.migrations.0004_loan_summary')
+        migration.backfill_loan_summary(apps, None)
+
+        self.loan.refresh_from_db()
+        schedule = schedule_for_loan(self.loan)
+        self.assertEqual(self.loan.pmt, schedule.payment_amount[0])
+        self.assertEqual(self.loan.total_interest, sum(schedule.interest).quantize(Decimal('0.01')))
+        self.assertEqual(self.loan.total_payment, sum(schedule.payment_amount).quantize(Decimal('0.01')))
+        self.assertEqual(self.loan.maturity_date, schedule.date[-1])
+
+        # Check if the frozen calculation in the migration agrees with the current one
+        test_cases = (
+            (Decimal('1000'), Decimal('1'), 1, '01', 2017),
+            (Decimal('1234.56'), Decimal('7.77'), 3, '12', 2022),
+            (Decimal('100000000'), Decimal('36'), 50, '2', 2050),
+        )
+        for loan_amount, interest_rate, loan_term, loan_month, loan_year in test_cases:
+            with self.subTest(loan_amount=loan_amount, loan_term=loan_term):
+                expected_summary = calculate_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year).summary()
+                self.assertEqual(migration.calculate_summary(loan_amount, interest_rate, loan_term, loan_month, loan_year), expected_summary)
@@ -0,0 +1,68 @@
+from django.test import SimpleTestCase
+from decimal import Decimal
+from array import array
+from loans.fixed_point import to_micros
+from loans.packed import PACKED_COLUMNS, PACKED_HEADER, PACKED_HEADER_V1, packed_columns, packed_schedule, unpack_schedule
+from loans.schedule import calculate_schedule
+
+
+class PackedTests(SimpleTestCase):
+    """Test for packed repayment schedule storage"""
+
+
+    def test_packed_schedule(self):
+        """Test that a packed schedule decodes to the same rows and summary, read in place from the blob"""
+
+        test_cases = (
+            (Decimal('1000'), Decimal('1'), 1, '01', 2017),
+            (Decimal('1234.56'), Decimal('7.77'), 3, '12', 2022),
+            (Decimal('25000000'), Decimal('29'), 20, '2', 2023),
+            (Decimal('100000000'), Decimal('36'), 50, '12', 2050),
+        )
+
+        for loan_amount, interest_rate, loan_term, loan_month, loan_year in test_cases:
+            with self.subTest(loan_amount=loan_amount, loan_term=loan_term):
+                schedule = calculate_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year)
+                blob, summary = packed_schedule(loan_amount, interest_rate, loan_term, loan_month, loan_year)
+
+                # Check if the summary fields are the ones of the Decimal schedule
+                self.assertEqual(summary, schedule.summary())
+
+                # Check if the blob holds a header with the PMT and fixed-width columns only
+                self.assertEqual(len(blob), PACKED_HEADER.size + loan_term * 12 * len(PACKED_COLUMNS) * 8)
+
+                # Check if the columns are a view over the blob rather than a copy
+                year, month, no_of_months, pmt, values = packed_columns(blob)
+                self.assertEqual((year, month, no_of_months), (loan_year, int(loan_month), loan_term * 12))
+                self.assertEqual(pmt, to_micros(schedule.payment_amount[0]))
+                self.assertIsInstance(values, memoryview)
+                self.assertIs(values.obj, blob)
+
+                # Check if every row and its 6 decimal place formatting is the same
+                unpacked_rows = list(unpack_schedule(blob).rows())
+                expected_rows = list(schedule.rows())
+                self.assertEqual(unpacked_rows, expected_rows)
+                self.assertEqual(
+                    [[str(value) for value in row[2:]] for row in unpacked_rows],
+                    [[str(value.quantize(Decimal('0.000001'))) for value in row[2:]] for row in expected_rows],
+                )
+
+                # Check if version 1 blobs, with a payment amount column, still decode to the same rows
+                columns = array('q', [pmt] * no_of_months) + array('q', values)
+                version_1_blob = PACKED_HEADER_V1.pack(1, loan_year, int(loan_month), no_of_months) + columns.tobytes()
+                self.assertEqual(list(unpack_schedule(version_1_blob).rows()), expected_rows)
+
+
+    def test_packed_schedule_error(self):
+        """Test that blobs of an unknown version or cut short are rejected"""
+
+        blob, summary = packed_schedule(Decimal('10000'), Decimal('10'), 1, '01', 2022)
+        test_cases = (
+            {'blob': b'\x03' + blob[1:], 'expected_error': 'Unsupported packed schedule version 3.'},
+            {'blob': blob[:-8], 'expected_error': 'Packed schedule is truncated.'},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                with self.assertRaisesMessage(Exception, test_case['expected_error']):
+                    unpack_schedule(test_case['blob'])
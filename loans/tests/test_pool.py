@@ -0,0 +1,87 @@
+import os
+import tempfile
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase
+from loan_app.db.pool import POOLS, ConnectionPool, pool_stats
+
+
+class FakeConnection:
+    """Raw connection stand-in that records whether it was closed"""
+
+    def __init__(self):
+        self.closed = False
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class PoolTests(SimpleTestCase):
+    """Test for database connection pooling"""
+
+
+    def test_connection_pool(self):
+        """Test reuse, size cap, max age and health checks of pooled connections"""
+
+        def failing_check(connection):
+            raise Exception('Connection lost')
+
+        test_cases = (
+            {'max_size': 1, 'max_age': None, 'check': None, 'released': 1, 'expected_reused': True, 'expected_closed': 0, 'expected_stats': {'hits': 1, 'misses': 1, 'discarded': 0, 'overflow': 0}},
+            {'max_size': 1, 'max_age': None, 'check': None, 'released': 2, 'expected_reused': True, 'expected_closed': 1, 'expected_stats': {'hits': 1, 'misses': 2, 'discarded': 0, 'overflow': 1}},
+            {'max_size': 1, 'max_age': 0, 'check': None, 'released': 1, 'expected_reused': False, 'expected_closed': 1, 'expected_stats': {'hits': 0, 'misses': 2, 'discarded': 1, 'overflow': 0}},
+            {'max_size': 1, 'max_age': None, 'check': failing_check, 'released': 1, 'expected_reused': False, 'expected_closed': 1, 'expected_stats': {'hits': 0, 'misses': 2, 'discarded': 1, 'overflow': 0}},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                pool = ConnectionPool(test_case['max_size'], test_case['max_age'])
+
+                # Open and release connections, then ask for one again
+                connections = [pool.acquire(FakeConnection) for x in range(test_case['released'])]
+                for connection in connections:
+                    pool.release(connection)
+                connection = pool.acquire(FakeConnection, test_case['check'])
+
+                self.assertEqual(connection is connections[0], test_case['expected_reused'])
+                self.assertFalse(connection.closed)
+                stats = pool.stats()
+                self.assertEqual({key: stats[key] for key in test_case['expected_stats']}, test_case['expected_stats'])
+                # Check if connections that were not kept are closed
+                self.assertEqual(sum(other.closed for other in connections), test_case['expected_closed'])
+
+
+    def test_pooled_backend(self):
+        """Test the pooled SQLite backend reuses a connection after Django closes it"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            handler = ConnectionHandler({
+                'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'},
+                'pooled': {
+                    'ENGINE': 'loan_app.db.sqlite3',
+                    'NAME': os.path.join(directory, 'pool.sqlite3'),
+                    'CONN_HEALTH_CHECKS': True,
+                    'POOL_SIZE': 2,
+                    'POOL_MAX_AGE': 300,
+                },
+            })
+            wrapper = handler['pooled']
+            try:
+                raw_connections = []
+                for x in range(3):
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                        self.assertEqual(cursor.fetchone(), (1,))
+                    raw_connections.append(wrapper.connection)
+                    wrapper.close()
+
+                self.assertIsNone(wrapper.connection)
+                self.assertTrue(raw_connections[0] is raw_connections[1] is raw_connections[2])
+                self.assertEqual(pool_stats()['pooled'], {'hits': 2, 'misses': 1, 'discarded': 0, 'overflow': 0, 'size': 1, 'max_size': 2})
+            finally:
+                for (alias, pid), pool in list(POOLS.items()):
+                    if alias == 'pooled':
+                        pool.clear()
+                        del POOLS[(alias, pid)]
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import pstats
+import tempfile
+from unittest import mock
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from loans.async_views import LoanEditAsyncView, json_response
+from loans.middleware import ProfilingMiddleware
+
+
+class ProfilingTests(TestCase):
+    """Test for the per request profiling middleware"""
+
+    def test_profiling(self):
+        """Test traces are written for requests with the token or picked by sampling only"""
+
+        loan_data = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}
+        test_cases = (
+            {'token': 'secret', 'sample_rate': 0, 'header': 'secret', 'expected_profiled': True, 'expected_header': True},
+            {'token': 'secret', 'sample_rate': 0, 'header': 'wrong', 'expected_profiled': False, 'expected_header': False},
+            {'token': 'secret', 'sample_rate': 0, 'header': None, 'expected_profiled': False, 'expected_header': False},
+            {'token': '', 'sample_rate': 1, 'header': None, 'expected_profiled': True, 'expected_header': False},
+        )
+
+        for test_case in test_cases:
+            with self.subTest(), tempfile.TemporaryDirectory() as directory:
+                with override_settings(
+                    LOAN_PROFILE_TOKEN=test_case['token'], LOAN_PROFILE_SAMPLE_RATE=test_case['sample_rate'], LOAN_PROFILE_DIR=directory
+                ):
+                    client = APIClient()
+                    pk = client.post(reverse('loans-list'), loan_data).data['pk']
+                    headers = {} if test_case['header'] is None else {'HTTP_X_LOAN_PROFILE': test_case['header']}
+                    response = client.put(reverse('loans-detail', kwargs={'pk': pk}), {**loan_data, 'loan_term': 2}, **headers)
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual('X-Loan-Profile-File' in response, test_case['expected_header'])
+                update_traces = [name for name in os.listdir(directory) if name.startswith('LoanViewSet.update.')]
+                self.assertEqual(len(update_traces), 1 if test_case['expected_profiled'] else 0)
+
+                if test_case['expected_profiled']:
+                    self.assertTrue(update_traces[0].endswith('Z.prof'))
+                    stats = pstats.Stats(os.path.join(directory, update_traces[0]))
+                    self.assertTrue(any(function == 'update' for file_name, line, function in stats.stats))
+                if test_case['expected_header']:
+                    self.assertEqual(response['X-Loan-Profile-File'], update_traces[0])
+
+
+    async def test_profiling_async(self):
+        """Test async views keep running concurrently behind the middleware and can be profiled"""
+
+        no_of_requests = 16
+        running = {'now': 0, 'peak': 0}
+
+        async def slow_get(view, request, *args, **kwargs):
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+            await asyncio.sleep(0.1)
+            running['now'] -= 1
+            return json_response(kwargs['pk'])
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(LOAN_PROFILE_TOKEN='secret', LOAN_PROFILE_SAMPLE_RATE=0, LOAN_PROFILE_DIR=directory):
+                with mock.patch.object(LoanEditAsyncView, 'get', slow_get):
+                    # Requests without the token are passed straight through, async client extras are raw header names
+                    responses = await asyncio.gather(*(
+                        self.async_client.get(reverse('loans-async-edit', kwargs={'pk': pk})) for pk in range(no_of_requests)
+                    ))
+                    profiled_response = await self.async_client.get(reverse('loans-async-edit', kwargs={'pk': 1}), **{'x-loan-profile': 'secret'})
+
+            self.assertEqual({response.status_code for response in responses}, {status.HTTP_200_OK})
+            self.assertEqual(running['peak'], no_of_requests)
+
+            # Check if only the request with the token was profiled, including the async view
+            self.assertEqual(os.listdir(directory), [profiled_response['X-Loan-Profile-File']])
+            self.assertTrue(profiled_response['X-Loan-Profile-File'].startswith('LoanEditAsyncView.get.'))
+            stats = pstats.Stats(os.path.join(directory, profiled_response['X-Loan-Profile-File']))
+            self.assertTrue(any(function == 'slow_get' for file_name, line, function in stats.stats))
+
+
+    def test_profiling_disabled(self):
+        """Test the middleware is left out when neither a token nor a sample rate is set"""
+
+        with override_settings(LOAN_PROFILE_TOKEN='', LOAN_PROFILE_SAMPLE_RATE=0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
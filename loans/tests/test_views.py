@@ -1,14 +1,29 @@
-from django.test import TestCase 
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.urls import reverse
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient
 from loans.models import Loan, Repayment
-from loans.serializers import LoanSerializer
+from loans.serializers import LoanSerializer, RepaymentSerializer
+from loans.schedule import computed_repayments, schedule_for_loan, stores_repayment_rows
+from loans.helper_functions import FILTER_DEFAULTS
 from django.utils.http import urlencode
+from django.utils import timezone
+from decimal import Decimal
+from datetime import date
+import json
+from unittest.mock import patch
 
 class ViewTests(TestCase):
     """Test for loan views"""
 
+    def setUp(self):
+        # Cached filter results outlive the rolled back test data
+        cache.clear()
+
     def test_loan_list(self):
         """Test happy cases for loan list retrieval: GET request"""
         
@@ -834,4 +849,1028 @@ class ViewTests(TestCase):
                 # Check if request was resolved as expected    
                 self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
                 # Check if response error message is as expected
-                self.assertEqual(response.data, test_case['expected_response'])
\ No newline at end of file
+                self.assertEqual(response.data, test_case['expected_response'])
+
+
+    @override_settings(LOAN_SCHEDULE_STORAGE='computed')
+    def test_loan_computed_schedule(self):
+        """Test loan creation and retrieval when schedules are calculated on read"""
+
+        test_cases = (
+            {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12', 'repayment_response_count': 600},
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10', 'repayment_response_count': 12},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Send POST request
+                client = APIClient()
+                post_url = reverse('loans-list')
+                post_response = client.post(post_url, test_case)
+                pk = post_response.data['loan']['id']
+
+                # Check if no repayment rows were written to db
+                self.assertEqual(Loan.objects.filter(pk=pk).exists(), True)
+                self.assertEqual(Repayment.objects.filter(loan=pk).count(), 0)
+                self.assertEqual(len(post_response.data['repayment list']), test_case['repayment_response_count'])
+
+                # Send GET request
+                url = reverse('loans-detail', kwargs={'pk': pk})
+                response = client.get(url)
+
+                # Check if calculated schedule is as expected
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(response.data['repayment list']), test_case['repayment_response_count'])
+                self.assertEqual(response.data['repayment list'], post_response.data['repayment list'])
+                self.assertEqual(response.data['repayment list'][-1]['balance'], 0)
+                self.assertEqual(response.data['repayment list'][0]['loan'], pk)
+
+
+    @override_settings(LOAN_SCHEDULE_STORAGE='packed')
+    def test_loan_packed_schedule(self):
+        """Test loan creation, retrieval and update when schedules are packed into the loan row"""
+
+        test_cases = (
+            {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12', 'repayment_response_count': 600},
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10', 'repayment_response_count': 12},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Send POST request
+                client = APIClient()
+                post_response = client.post(reverse('loans-list'), test_case)
+                pk = post_response.data['loan']['id']
+
+                # Check if the schedule was packed instead of written as repayment rows
+                self.assertEqual(Repayment.objects.filter(loan=pk).count(), 0)
+                self.assertIsNotNone(Loan.objects.defer(None).get(id=pk).schedule_blob)
+                self.assertNotIn('schedule_blob', post_response.data['loan'])
+                self.assertEqual(len(post_response.data['repayment list']), test_case['repayment_response_count'])
+
+                # Send GET request, which reads the loan and its schedule in one query
+                url = reverse('loans-detail', kwargs={'pk': pk})
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(url)
+
+                # Check if packed schedule is the one calculated from the loan
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(queries.captured_queries), 1)
+                self.assertEqual(response.data['repayment list'], post_response.data['repayment list'])
+                with self.settings(LOAN_SCHEDULE_STORAGE='computed'):
+                    self.assertEqual(client.get(url).content, response.content)
+
+                # Check if loan lists leave the packed schedule out
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(reverse('loans-list'))
+                self.assertNotIn('schedule_blob', queries.captured_queries[-1]['sql'])
+
+                # Send PUT request and check the packed schedule follows the new loan term
+                put_response = client.put(url, {**test_case, 'loan_term': 2})
+                self.assertEqual(len(put_response.data['repayment list']), 24)
+                self.assertEqual(client.get(url).data['repayment list'], put_response.data['repayment list'])
+
+                # Check if the packed schedule is cleared once loans are updated in another mode
+                with self.settings(LOAN_SCHEDULE_STORAGE='computed'):
+                    client.put(url, test_case)
+                self.assertIsNone(Loan.objects.defer(None).get(id=pk).schedule_blob)
+
+        # Check if bulk created loans are packed too
+        bulk_response = APIClient().post(reverse('loans-bulk'), [{'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'}], format='json')
+        self.assertEqual(Repayment.objects.count(), 0)
+        self.assertIsNotNone(Loan.objects.defer(None).get(id=bulk_response.data[0]['pk']).schedule_blob)
+
+
+    def test_loan_packed_without_migration(self):
+        """Test reading loans saved before schedules were packed, without running migrate_schedule_storage"""
+
+        test_loan = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'}
+        client = APIClient()
+        with self.settings(LOAN_SCHEDULE_STORAGE='computed'):
+            pk = client.post(reverse('loans-list'), test_loan).data['loan']['id']
+            url = reverse('loans-detail', kwargs={'pk': pk})
+            expected_content = client.get(url).content
+            expected_export = b''.join(client.get(reverse('loans-export')).streaming_content)
+
+        with self.settings(LOAN_SCHEDULE_STORAGE='packed'):
+            # Check if the schedule is calculated for a loan with no packed schedule
+            self.assertIsNone(Loan.objects.defer(None).get(id=pk).schedule_blob)
+            self.assertEqual(client.get(url).content, expected_content)
+            self.assertEqual(client.get(reverse('loans-async-detail', kwargs={'pk': pk})).content, expected_content)
+            self.assertEqual(b''.join(client.get(reverse('loans-export')).streaming_content), expected_export)
+
+            # Check if an update packs the schedule
+            put_response = client.put(url, {**test_loan, 'loan_term': 2})
+            self.assertEqual(put_response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(put_response.data['repayment list']), 24)
+            self.assertIsNotNone(Loan.objects.defer(None).get(id=pk).schedule_blob)
+
+
+    def test_loan_installment(self):
+        """Test happy cases for single installment retrieval: GET request"""
+
+        test_cases = (
+            {
+                'test_loan': {
+                'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01',
+                },
+                'query_string': {'n': 2, 'verify': 'true'},
+                'expected_payment_no': 2,
+                'expected_date': '2022-03-01',
+            },
+            {
+                'test_loan': {
+                'loan_amount': 25000000, 'loan_term': 20, 'interest_rate': 29, 'loan_year': 2023, 'loan_month': '2',
+                },
+                'query_string': {'date': '2030-07-15', 'verify': 'true'},
+                'expected_payment_no': 89,
+                'expected_date': '2030-07-01',
+            },
+            {
+                # Date after the last installment
+                'test_loan': {
+                'loan_amount': 400000, 'loan_term': 2, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '1',
+                },
+                'query_string': {'date': '2040-01-01', 'verify': 'true'},
+                'expected_payment_no': 24,
+                'expected_date': '2022-01-01',
+            },
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Make post request to add test data to db
+                client = APIClient()
+                post_url = reverse('loans-list')
+                post_response = client.post(post_url, test_case['test_loan'])
+                pk = post_response.data['loan']['id']
+
+                # Send GET request
+                url = reverse('loans-installment', kwargs={'pk': pk})
+                response = client.get(f'{url}?{urlencode(test_case["query_string"])}')
+
+                # Check if request was resolved successfully
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                # Check if installment is the one expected
+                self.assertEqual(response.data['loan'], pk)
+                self.assertEqual(response.data['payment_no'], test_case['expected_payment_no'])
+                self.assertEqual(str(response.data['date']), test_case['expected_date'])
+                # Check if row by row verification matches the stored repayment schedule
+                stored_repayment = Repayment.objects.get(loan=pk, payment_no=test_case['expected_payment_no'])
+                row_by_row = response.data['verification']['row_by_row']
+                self.assertEqual(row_by_row['payment_amount'], stored_repayment.payment_amount)
+                self.assertEqual(row_by_row['interest'], stored_repayment.interest)
+                self.assertEqual(row_by_row['principal'], stored_repayment.principal)
+                self.assertEqual(row_by_row['balance'], stored_repayment.balance)
+                # Check if closed-form installment is within rounding distance of the stored repayment
+                self.assertEqual(response.data['payment_amount'], stored_repayment.payment_amount)
+                self.assertLess(abs(response.data['balance'] - stored_repayment.balance), Decimal('0.01'))
+                self.assertLess(abs(response.data['verification']['balance_difference']), Decimal('0.01'))
+
+
+    def test_loan_installment_error(self):
+        """Test edge cases for single installment retrieval: GET request"""
+
+        test_cases = (
+            # Missing field
+            {'query_string': {}, 'expected_response': 'Missing field'},
+            # Installment number out of range
+            {'query_string': {'n': 13}, 'expected_response': 'Installment is not within the loan term.'},
+            # Non-numeric installment number
+            {'query_string': {'n': 'two'}, 'expected_response': "invalid literal for int() with base 10: 'two'"},
+            # Date before the first installment
+            {'query_string': {'date': '2022-01-31'}, 'expected_response': 'Date is before the first installment.'},
+        )
+
+        # Make post request to add test data to db
+        client = APIClient()
+        post_url = reverse('loans-list')
+        post_response = client.post(post_url, {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'})
+        pk = post_response.data['loan']['id']
+
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Send GET request
+                url = reverse('loans-installment', kwargs={'pk': pk})
+                response = client.get(f'{url}?{urlencode(test_case["query_string"])}')
+
+                # Check if request was resolved as expected
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                # Check if response error message is as expected
+                self.assertEqual(response.data, test_case['expected_response'])
+
+
+    def test_loan_bulk_create(self):
+        """Test bulk loan creation with a mix of valid and invalid loans: POST request"""
+
+        loan_list = [
+            {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12'},
+            {'loan_amount': 10000000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '01'},
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'},
+            {'loan_amount': 50000, 'loan_term': 4, 'loan_year': 2024, 'loan_month': '07'},
+            {'loan_amount': 40000000, 'loan_term': 4, 'interest_rate': 20, 'loan_year': 2035, 'loan_month': '02'},
+        ]
+
+        # Send POST request
+        client = APIClient()
+        url = reverse('loans-bulk')
+        response = client.post(f'{url}?batch_size=100', loan_list, format='json')
+
+        # Check if request was resolved successfully
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 5)
+        # Check if invalid loans are reported with their error
+        self.assertEqual(response.data[1], {'index': 1, 'error': 'Loan amount is not within the acceptable range of 1000 - 100,000,000 THB.'})
+        self.assertEqual(response.data[3], {'index': 3, 'error': 'Missing field'})
+
+        # Check if valid loans and their repayments are saved in db
+        self.assertEqual(Loan.objects.count(), 3)
+        for index, repayment_count in ((0, 600), (2, 12), (4, 48)):
+            pk = response.data[index]['pk']
+            loan = Loan.objects.get(pk=pk)
+            self.assertEqual(loan.loan_amount, loan_list[index]['loan_amount'])
+            self.assertEqual(Repayment.objects.filter(loan=pk).count(), repayment_count)
+
+            # Check if repayments are the same as a single loan creation
+            post_response = client.post(reverse('loans-list'), loan_list[index])
+            single_rows = Repayment.objects.filter(loan=post_response.data['loan']['id']).order_by('payment_no').values_list('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance')
+            bulk_rows = Repayment.objects.filter(loan=pk).order_by('payment_no').values_list('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance')
+            self.assertEqual(list(bulk_rows), list(single_rows))
+
+
+    def test_loan_bulk_create_without_returned_ids(self):
+        """Test that bulk loan creation costs the same number of queries whatever the number of loans
+        on backends that do not return ids from a bulk insert: POST request"""
+
+        loan = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'}
+        test_cases = (
+            [loan],
+            [{**loan, 'loan_amount': 10000 + index} for index in range(5)],
+        )
+
+        # Existing loans, which must not be mistaken for the new ones
+        client = APIClient()
+        client.post(reverse('loans-list'), loan)
+        client.post(reverse('loans-list'), loan)
+
+        query_counts = set()
+        for loan_list in test_cases:
+            with self.subTest(no_of_loans=len(loan_list)):
+
+                # Send POST request as a backend such as MySQL would
+                with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.post(reverse('loans-bulk'), loan_list, format='json')
+                loan_inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT') and 'loans' in query['sql']]
+                query_counts.add(len(queries.captured_queries))
+
+                # Check if loans are inserted in one query and every loan gets its own id and repayments
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(loan_inserts), 1)
+                for loan_data, result in zip(loan_list, response.data):
+                    self.assertEqual(Loan.objects.get(pk=result['pk']).loan_amount, loan_data['loan_amount'])
+                    self.assertEqual(Repayment.objects.filter(loan=result['pk']).count(), 12)
+                self.assertEqual(len({result['pk'] for result in response.data}), len(loan_list))
+
+        # Check if the query count does not depend on the number of loans
+        self.assertEqual(len(query_counts), 1)
+
+        # Check if a loan another request saves during the bulk insert is not mistaken for a new one
+        real_bulk_create = Loan.objects.bulk_create
+        def bulk_create_after_other_request(loans, **kwargs):
+            Loan.objects.create(**{**loan, 'loan_amount': 99999})
+            return real_bulk_create(loans, **kwargs)
+
+        loan_list = test_cases[1]
+        with patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False), patch.object(Loan.objects, 'bulk_create', bulk_create_after_other_request):
+            response = client.post(reverse('loans-bulk'), loan_list, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([Loan.objects.get(pk=result['pk']).loan_amount for result in response.data], [loan_data['loan_amount'] for loan_data in loan_list])
+
+
+    def test_loan_bulk_create_error(self):
+        """Test edge cases for bulk loan creation: POST request"""
+
+        test_cases = (
+            # Body is not a list
+            {'data': {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'}, 'query_string': '', 'expected_response': 'Expected a list of loans'},
+            # Batch size out of range
+            {'data': [], 'query_string': '?batch_size=0', 'expected_response': 'Batch size must be at least 1.'},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Send POST request
+                client = APIClient()
+                url = reverse('loans-bulk')
+                response = client.post(url + test_case['query_string'], test_case['data'], format='json')
+
+                # Check if request was resolved as expected
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                # Check if response error message is as expected
+                self.assertEqual(response.data, test_case['expected_response'])
+                # Check if nothing was saved in db
+                self.assertEqual(Loan.objects.count(), 0)
+
+
+    def test_loan_streaming_response(self):
+        """Test that streamed responses match the rendered responses: POST, GET and PUT requests"""
+
+        test_cases = (
+            {'storage': 'rows', 'test_loan': {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12'}},
+            {'storage': 'computed', 'test_loan': {'loan_amount': 25000000, 'loan_term': 20, 'interest_rate': 29, 'loan_year': 2023, 'loan_month': '2'}},
+            {'storage': 'packed', 'test_loan': {'loan_amount': 25000000, 'loan_term': 20, 'interest_rate': 29, 'loan_year': 2023, 'loan_month': '2'}},
+        )
+
+        for test_case in test_cases:
+            with self.subTest(), self.settings(LOAN_SCHEDULE_STORAGE=test_case['storage']):
+
+                client = APIClient()
+                with self.settings(LOAN_STREAMING_RESPONSES=True):
+                    post_response = client.post(reverse('loans-list'), test_case['test_loan'])
+                    post_content = b''.join(post_response.streaming_content)
+                    pk = json.loads(post_content)['pk']
+                    url = reverse('loans-detail', kwargs={'pk': pk})
+                    streamed_response = client.get(url)
+                    streamed_content = b''.join(streamed_response.streaming_content)
+
+                # Send GET request without streaming
+                rendered_response = client.get(url)
+
+                # Check if streamed responses are as expected
+                self.assertEqual(post_response.status_code, status.HTTP_200_OK)
+                self.assertEqual(streamed_response.status_code, status.HTTP_200_OK)
+                self.assertEqual(streamed_response['Content-Type'], 'application/json')
+                self.assertEqual(streamed_content, rendered_response.content)
+                self.assertEqual(json.loads(post_content), {'pk': pk, **json.loads(rendered_response.content)})
+
+                # Send PUT request with streaming
+                with self.settings(LOAN_STREAMING_RESPONSES=True):
+                    put_response = client.put(url, {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'})
+                    put_content = b''.join(put_response.streaming_content)
+                rendered_response = client.get(url)
+
+                # Check if streamed update response is as expected
+                self.assertEqual(len(json.loads(put_content)['repayment list']), 12)
+                self.assertEqual(json.loads(put_content), {'pk': pk, **json.loads(rendered_response.content)})
+
+
+    def test_loan_fast_repayment_serializer(self):
+        """Test repayment lists render to the same bytes as RepaymentSerializer: POST, GET and PUT requests"""
+
+        test_cases = (
+            {'storage': 'rows', 'time_zone': 'UTC', 'test_loan': {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12'}},
+            {'storage': 'rows', 'time_zone': 'Asia/Bangkok', 'test_loan': {'loan_amount': 1234.56, 'loan_term': 3, 'interest_rate': 7.77, 'loan_year': 2017, 'loan_month': '1'}},
+            {'storage': 'computed', 'time_zone': 'UTC', 'test_loan': {'loan_amount': 25000000, 'loan_term': 20, 'interest_rate': 29, 'loan_year': 2023, 'loan_month': '2'}},
+            # Packed schedules read back the same as ones calculated on read
+            {'storage': 'packed', 'time_zone': 'Asia/Bangkok', 'test_loan': {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12'}},
+        )
+
+        def expected_content(loan, data):
+            if stores_repayment_rows():
+                repayments = Repayment.objects.filter(loan=loan).order_by('payment_no')
+            else:
+                repayments = computed_repayments(loan)
+            return JSONRenderer().render({**data, 'loan': LoanSerializer(loan).data, 'repayment list': RepaymentSerializer(repayments, many=True).data})
+
+        for test_case in test_cases:
+            with self.subTest(), self.settings(LOAN_SCHEDULE_STORAGE=test_case['storage'], TIME_ZONE=test_case['time_zone']):
+
+                client = APIClient()
+                post_response = client.post(reverse('loans-list'), test_case['test_loan'])
+                pk = post_response.data['pk']
+                url = reverse('loans-detail', kwargs={'pk': pk})
+                self.assertEqual(post_response.content, expected_content(Loan.objects.get(id=pk), {'pk': pk}))
+
+                get_response = client.get(url)
+                self.assertEqual(get_response.content, expected_content(Loan.objects.get(id=pk), {}))
+
+                put_response = client.put(url, {**test_case['test_loan'], 'loan_term': 2})
+                self.assertEqual(put_response.content, expected_content(Loan.objects.get(id=pk), {'pk': pk}))
+
+                async_response = client.get(reverse('loans-async-detail', kwargs={'pk': pk}))
+                self.assertEqual(async_response.content, expected_content(Loan.objects.get(id=pk), {}))
+
+
+    def test_loan_export(self):
+        """Test streaming export of loans and repayments: GET request"""
+
+        loan_list = [
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'},
+            {'loan_amount': 5000000, 'loan_term': 12, 'interest_rate': 20, 'loan_year': 2023, 'loan_month': '02'},
+        ]
+
+        test_cases = (
+            {'storage': 'rows', 'query_string': {'export_format': 'csv'}, 'expected_content_type': 'text/csv', 'expected_line_count': 157},
+            {'storage': 'rows', 'query_string': {'export_format': 'ndjson', 'loan_term_lower': 2}, 'expected_content_type': 'application/x-ndjson', 'expected_line_count': 144},
+            {'storage': 'computed', 'query_string': {'export_format': 'ndjson'}, 'expected_content_type': 'application/x-ndjson', 'expected_line_count': 156},
+            {'storage': 'rows', 'query_string': {'export_format': 'ndjson', 'maturity_date_upper': '2021-12-31'}, 'expected_content_type': 'application/x-ndjson', 'expected_line_count': 12},
+            {'storage': 'packed', 'query_string': {'export_format': 'csv'}, 'expected_content_type': 'text/csv', 'expected_line_count': 157},
+        )
+
+        for test_case in test_cases:
+            with self.subTest(), self.settings(LOAN_SCHEDULE_STORAGE=test_case['storage']):
+
+                # Make post requests to add test data to db
+                client = APIClient()
+                for loan in loan_list:
+                    client.post(reverse('loans-list'), loan)
+
+                # Send GET request
+                url = reverse('loans-export')
+                with patch('loans.export.schedule_for_loan', wraps=schedule_for_loan) as calculate_schedule:
+                    response = client.get(f'{url}?{urlencode(test_case["query_string"])}')
+                    content = b''.join(response.streaming_content).decode()
+
+                # Check if request was resolved successfully
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response['Content-Type'], test_case['expected_content_type'])
+                # Check if every repayment is exported
+                self.assertEqual(len(content.splitlines()), test_case['expected_line_count'])
+                # Check if schedules are only calculated when they are not stored
+                self.assertEqual(calculate_schedule.called, test_case['storage'] == 'computed')
+
+                Loan.objects.all().delete()
+
+        # Check if unknown export format is rejected
+        response = APIClient().get(f'{reverse("loans-export")}?export_format=xml')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data, 'Export format must be csv or ndjson.')
+
+
+    def test_loan_update_incremental(self):
+        """Test that updates only write the repayment entries that changed: PUT request"""
+
+        test_loan = {'loan_amount': 400000, 'loan_term': 2, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '1'}
+        test_cases = (
+            # Same loan details
+            {'test_loan_new': test_loan, 'expected_count': 24, 'kept_ids': 24, 'writes_repayments': False},
+            # Start date change only
+            {'test_loan_new': {**test_loan, 'loan_year': 2021, 'loan_month': '6'}, 'expected_count': 24, 'kept_ids': 24, 'writes_repayments': True},
+            # Shorter loan term
+            {'test_loan_new': {**test_loan, 'loan_term': 1}, 'expected_count': 12, 'kept_ids': 12, 'writes_repayments': True},
+            # Longer loan term
+            {'test_loan_new': {**test_loan, 'loan_term': 3, 'interest_rate': 12}, 'expected_count': 36, 'kept_ids': 24, 'writes_repayments': True},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Make post request to add test data to db
+                client = APIClient()
+                post_response = client.post(reverse('loans-list'), test_loan)
+                pk = post_response.data['loan']['id']
+                old_repayments = {repayment.payment_no: repayment for repayment in Repayment.objects.filter(loan=pk)}
+
+                # Send PUT request
+                url = reverse('loans-detail', kwargs={'pk': pk})
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.put(url, test_case['test_loan_new'])
+                repayment_writes = [
+                    query['sql'] for query in queries.captured_queries
+                    if 'repayments' in query['sql'] and query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+                ]
+
+                # Check if request was resolved successfully
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(len(response.data['repayment list']), test_case['expected_count'])
+                # Check if repayment entries were only written when needed
+                self.assertEqual(bool(repayment_writes), test_case['writes_repayments'])
+
+                # Check if stored repayments match a freshly calculated schedule
+                loan = Loan.objects.get(pk=pk)
+                stored_rows = Repayment.objects.filter(loan=pk).order_by('payment_no').values_list('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance')
+                self.assertEqual(list(stored_rows), list(schedule_for_loan(loan).rows()))
+                # Check if existing repayment entries were kept rather than reinserted
+                new_ids = set(Repayment.objects.filter(loan=pk).values_list('id', flat=True))
+                old_ids = {repayment.id for repayment in old_repayments.values()}
+                self.assertEqual(len(new_ids & old_ids), test_case['kept_ids'])
+
+        # Check if a start date change is one UPDATE of the date column, worked out in db rather than per row
+        for new_start in ({'loan_month': '2'}, {'loan_month': '12', 'loan_year': 2049}):
+            with self.subTest(**new_start):
+                client = APIClient()
+                pk = client.post(reverse('loans-list'), test_loan).data['loan']['id']
+                with CaptureQueriesContext(connection) as queries:
+                    client.put(reverse('loans-detail', kwargs={'pk': pk}), {**test_loan, **new_start})
+                date_update = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE') and 'repayments' in query['sql']]
+                self.assertEqual(len(date_update), 1)
+                self.assertIn(connection.ops.quote_name('date'), date_update[0])
+                self.assertNotIn('CASE', date_update[0])
+                self.assertNotIn(connection.ops.quote_name('balance'), date_update[0])
+
+                stored_rows = Repayment.objects.filter(loan=pk).order_by('payment_no').values_list('payment_no', 'date', 'payment_amount', 'principal', 'interest', 'balance')
+                self.assertEqual(list(stored_rows), list(schedule_for_loan(Loan.objects.get(pk=pk)).rows()))
+
+
+    def test_loan_create_query_count(self):
+        """Test that loan creation costs the same number of queries whatever the loan term: POST request"""
+
+        test_cases = (
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'},
+            {'loan_amount': 5000000, 'loan_term': 12, 'interest_rate': 20, 'loan_year': 2023, 'loan_month': '02'},
+            {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2040, 'loan_month': '12'},
+        )
+
+        other_query_counts = set()
+        for test_case in test_cases:
+            with self.subTest():
+
+                # Send POST request
+                client = APIClient()
+                with CaptureQueriesContext(connection) as queries:
+                    post_response = client.post(reverse('loans-list'), test_case)
+                repayment_inserts = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT') and 'repayments' in query['sql']]
+                repayment_selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT') and 'repayments' in query['sql']]
+
+                # Check if repayments are inserted in as few batches as the backend allows
+                no_of_months = test_case['loan_term'] * 12
+                fields = [field for field in Repayment._meta.concrete_fields if not field.primary_key]
+                batch_size = connection.ops.bulk_batch_size(fields, [None] * no_of_months)
+                self.assertEqual(len(repayment_inserts), -(-no_of_months // batch_size))
+                # Check if repayments are only read back when the backend cannot return their ids
+                self.assertEqual(bool(repayment_selects), not connection.features.can_return_rows_from_bulk_insert)
+                other_query_counts.add(len(queries.captured_queries) - len(repayment_inserts))
+
+                # Check if response is the same as retrieving the loan afterwards
+                pk = post_response.data['pk']
+                response = client.get(reverse('loans-detail', kwargs={'pk': pk}))
+                self.assertEqual(json.loads(post_response.content), {'pk': pk, **json.loads(response.content)})
+
+        # Check if the remaining query count does not depend on the loan term
+        self.assertEqual(len(other_query_counts), 1)
+
+
+    def test_loan_pagination(self):
+        """Test walking loan list and filter pages with the next cursor: GET request"""
+
+        loan_ids = [
+            Loan.objects.create(loan_amount=10000 * (x + 1), loan_term=1, interest_rate=10, loan_year=2022, loan_month=1).id
+            for x in range(7)
+        ]
+
+        test_cases = (
+            {'url': f"{reverse('loans-list')}?page_size=3", 'page_size': 0, 'expected_page_lengths': [3, 3, 1]},
+            {'url': reverse('loans-list'), 'page_size': 4, 'expected_page_lengths': [4, 3]},
+            {'url': f"{reverse('loans-filter')}?{urlencode({field: 'null' for field in FILTER_DEFAULTS})}", 'page_size': 2, 'expected_page_lengths': [2, 2, 2, 1]},
+        )
+
+        client = APIClient()
+        for test_case in test_cases:
+            with self.subTest():
+                with override_settings(LOAN_PAGE_SIZE=test_case['page_size']):
+
+                    # Follow next cursors until the last page
+                    url = test_case['url']
+                    page_lengths = []
+                    response_ids = []
+                    while url:
+                        with CaptureQueriesContext(connection) as queries:
+                            response = client.get(url)
+                        self.assertEqual(response.status_code, status.HTTP_200_OK)
+                        # Check if pages are found by key rather than by skipping earlier rows
+                        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+                        page_lengths.append(len(response.data['results']))
+                        response_ids.extend(loan['id'] for loan in response.data['results'])
+                        url = response.data['next']
+
+                    self.assertEqual(page_lengths, test_case['expected_page_lengths'])
+                    self.assertEqual(response_ids, loan_ids)
+
+        # Check if an unknown cursor is rejected
+        response = client.get(f"{reverse('loans-filter')}?cursor=invalid&page_size=2&{urlencode({field: 'null' for field in FILTER_DEFAULTS})}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+    def test_loan_pagination_ties(self):
+        """Test walking pages of more loans sharing a sort value than DRF's cursor offset allows: GET request"""
+
+        # Loans created in bulk share a creation time
+        Loan.objects.bulk_create([
+            Loan(loan_amount=10000, loan_term=1, interest_rate=10, loan_year=2022, loan_month=1)
+            for x in range(1300)
+        ])
+        Loan.objects.update(created_at=timezone.now())
+        loan_ids = list(Loan.objects.order_by('id').values_list('id', flat=True))
+        # Loans saved without a summary have no PMT, give the rest one of a few shared values
+        for index, loan_id in enumerate(loan_ids[:900]):
+            Loan.objects.filter(id=loan_id).update(pmt=Decimal(100 + index % 3))
+        loans_by_pmt = sorted(Loan.objects.values_list('pmt', 'id'), key=lambda loan: (loan[0] is not None, loan[0] or 0, loan[1]))
+        filter_url = f"{reverse('loans-filter')}?{urlencode({field: 'null' for field in FILTER_DEFAULTS})}&page_size=100"
+
+        test_cases = (
+            {'url': f"{reverse('loans-list')}?page_size=100", 'expected_ids': loan_ids},
+            {'url': f'{filter_url}&ordering=loan_term', 'expected_ids': loan_ids},
+            {'url': f'{filter_url}&ordering=-loan_term', 'expected_ids': loan_ids},
+            {'url': f'{filter_url}&ordering=pmt', 'expected_ids': [loan_id for pmt, loan_id in loans_by_pmt]},
+            {'url': f'{filter_url}&ordering=-pmt', 'expected_ids': [loan_id for pmt, loan_id in sorted(loans_by_pmt, key=lambda loan: (loan[0] is None, -(loan[0] or 0), loan[1]))]},
+        )
+
+        client = APIClient()
+        for test_case in test_cases:
+            with self.subTest(url=test_case['url']):
+
+                # Follow next cursors until the last page
+                url = test_case['url']
+                response_ids = []
+                while url:
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+                    response_ids.extend(loan['id'] for loan in response.data['results'])
+                    previous_url = response.data['previous']
+                    url = response.data['next']
+
+                # Check if every loan comes back exactly once, in order
+                self.assertEqual(response_ids, test_case['expected_ids'])
+
+                # Follow previous cursors back to the first page
+                url = previous_url
+                previous_ids = [loan['id'] for loan in response.data['results']]
+                while url:
+                    response = client.get(url)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    previous_ids[:0] = [loan['id'] for loan in response.data['results']]
+                    url = response.data['previous']
+
+                self.assertEqual(previous_ids, test_case['expected_ids'])
+
+
+    @override_settings(LOAN_FILTER_CACHE_TIMEOUT=300)
+    def test_loan_filter_cache(self):
+        """Test filter results are served from cache until a loan write commits: GET request"""
+
+        loan_data = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}
+        filter_url = f"{reverse('loans-filter')}?{urlencode({field: 'null' for field in FILTER_DEFAULTS})}"
+        client = APIClient()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pk = client.post(reverse('loans-list'), loan_data).data['pk']
+        self.assertEqual(len(client.get(filter_url).data), 1)
+
+        # Check if repeated and equivalent filters are answered without querying db
+        test_cases = (
+            filter_url,
+            f"{reverse('loans-filter')}?{urlencode({**{field: 'null' for field in FILTER_DEFAULTS}, 'interest_rate_lower': '1.0', 'loan_term_upper': 50})}",
+        )
+        for test_case in test_cases:
+            with self.subTest():
+                with self.assertNumQueries(0):
+                    response = client.get(test_case)
+                self.assertEqual(len(response.data), 1)
+
+        # Check if a write that skips the views keeps the cached result
+        Loan.objects.create(loan_amount=20000, loan_term=2, interest_rate=10, loan_year=2022, loan_month=1)
+        self.assertEqual(len(client.get(filter_url).data), 1)
+
+        # Check if each committed write through the views retires cached results
+        writes = (
+            {'request': lambda: client.post(reverse('loans-list'), loan_data), 'expected_loan_amounts': [10000, 10000, 20000]},
+            {'request': lambda: client.put(reverse('loans-detail', kwargs={'pk': pk}), {**loan_data, 'loan_amount': 5000000}), 'expected_loan_amounts': [10000, 20000, 5000000]},
+            {'request': lambda: client.delete(reverse('loans-detail', kwargs={'pk': pk})), 'expected_loan_amounts': [10000, 20000]},
+            {'request': lambda: client.post(reverse('loans-bulk'), [loan_data], format='json'), 'expected_loan_amounts': [10000, 10000, 20000]},
+        )
+        for write in writes:
+            with self.subTest():
+                with self.captureOnCommitCallbacks(execute=True):
+                    write['request']()
+                response = client.get(filter_url)
+                self.assertEqual(sorted(loan['loan_amount'] for loan in response.data), write['expected_loan_amounts'])
+
+
+    def test_loan_destroy_response(self):
+        """Test destroy response modes and that repayments cascade with the loan: DELETE request"""
+
+        test_cases = (
+            {'destroy_response': 'list', 'expected_status': status.HTTP_200_OK},
+            {'destroy_response': 'id', 'expected_status': status.HTTP_200_OK},
+            {'destroy_response': 'empty', 'expected_status': status.HTTP_204_NO_CONTENT},
+        )
+
+        client = APIClient()
+        for test_case in test_cases:
+            with self.subTest():
+                with override_settings(LOAN_DESTROY_RESPONSE=test_case['destroy_response']):
+                    pk = client.post(reverse('loans-list'), {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}).data['pk']
+
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.delete(reverse('loans-detail', kwargs={'pk': pk}))
+                    loan_selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT') and 'loans' in query['sql']]
+
+                    self.assertEqual(response.status_code, test_case['expected_status'])
+                    self.assertFalse(Loan.objects.filter(id=pk).exists())
+                    self.assertFalse(Repayment.objects.filter(loan_id=pk).exists())
+                    if test_case['destroy_response'] == 'list':
+                        self.assertEqual(response.data, LoanSerializer(Loan.objects.all(), many=True).data)
+                    else:
+                        # Check if the remaining loans are not read
+                        self.assertEqual(len(loan_selects), 1)
+                    if test_case['destroy_response'] == 'id':
+                        self.assertEqual(response.data, {'pk': pk})
+                    if test_case['destroy_response'] == 'empty':
+                        self.assertEqual(response.content, b'')
+
+
+    def test_loan_bulk_destroy(self):
+        """Test removing many loans and their repayments in batches: DELETE request"""
+
+        client = APIClient()
+        loan_data = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}
+        pks = [result['pk'] for result in client.post(reverse('loans-bulk'), [loan_data] * 5, format='json').data]
+
+        test_cases = (
+            {'pks': pks[:3] + [pks[0], 999999], 'batch_size': 2, 'expected_deleted': 3, 'expected_query_count': 2 * 3},
+            {'pks': pks[3:], 'batch_size': 1000, 'expected_deleted': 2, 'expected_query_count': 3},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.delete(f"{reverse('loans-bulk')}?batch_size={test_case['batch_size']}", test_case['pks'], format='json')
+                statements = [query['sql'] for query in queries.captured_queries if query['sql'].startswith(('SELECT', 'DELETE'))]
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response.data, {'deleted': test_case['expected_deleted'], 'deleted repayments': test_case['expected_deleted'] * 12})
+                # Check if the statement count depends on the number of batches, not of loans or repayments
+                self.assertEqual(len(statements), test_case['expected_query_count'])
+
+        self.assertEqual(Loan.objects.count(), 0)
+        self.assertEqual(Repayment.objects.count(), 0)
+
+
+    def test_loan_bulk_destroy_error(self):
+        """Test unhappy cases for removing many loans: DELETE request"""
+
+        test_cases = (
+            {'data': {'ids': [1]}, 'query_string': '', 'expected_response': 'Expected a list of loan ids'},
+            {'data': [1, 'two'], 'query_string': '', 'expected_response': 'Expected a list of loan ids'},
+            {'data': [1], 'query_string': '?batch_size=0', 'expected_response': 'Batch size must be at least 1.'},
+        )
+
+        client = APIClient()
+        for test_case in test_cases:
+            with self.subTest():
+                response = client.delete(reverse('loans-bulk') + test_case['query_string'], test_case['data'], format='json')
+
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(response.data, test_case['expected_response'])
+
+
+    def test_loan_async_views(self):
+        """Test async read endpoints give the same responses as the sync ones: GET request"""
+
+        client = APIClient()
+        loan_data = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}
+        pks = [result['pk'] for result in client.post(reverse('loans-bulk'), [loan_data, {**loan_data, 'loan_term': 3}], format='json').data]
+        filter_query = urlencode({field: 'null' for field in FILTER_DEFAULTS})
+
+        test_cases = (
+            {'sync_url': reverse('loans-list'), 'async_url': reverse('loans-async-list')},
+            {'sync_url': f"{reverse('loans-list')}?page_size=1", 'async_url': f"{reverse('loans-async-list')}?page_size=1"},
+            {'sync_url': reverse('loans-detail', kwargs={'pk': pks[1]}), 'async_url': reverse('loans-async-detail', kwargs={'pk': pks[1]})},
+            {'sync_url': reverse('loans-detail', kwargs={'pk': 999999}), 'async_url': reverse('loans-async-detail', kwargs={'pk': 999999})},
+            {'sync_url': reverse('loans-edit', kwargs={'pk': pks[0]}), 'async_url': reverse('loans-async-edit', kwargs={'pk': pks[0]})},
+            {'sync_url': f"{reverse('loans-filter')}?{filter_query}", 'async_url': f"{reverse('loans-async-filter')}?{filter_query}"},
+            {'sync_url': f"{reverse('loans-filter')}?loan_term_lower=2", 'async_url': f"{reverse('loans-async-filter')}?loan_term_lower=2"},
+        )
+
+        for storage in ('rows', 'computed'):
+            for test_case in test_cases:
+                with self.subTest():
+                    with override_settings(LOAN_SCHEDULE_STORAGE=storage):
+                        sync_response = client.get(test_case['sync_url'])
+                        async_response = client.get(test_case['async_url'])
+
+                        self.assertEqual(async_response.status_code, sync_response.status_code)
+                        self.assertEqual(async_response['Content-Type'], 'application/json')
+                        # Pagination links point at the endpoint they came from
+                        self.assertEqual(async_response.content, sync_response.content.replace(b'/loans/?', b'/loans/async/?'))
+
+
+    async def test_loan_async_client(self):
+        """Test async endpoints served to an async client: GET request"""
+
+        loan = await Loan.objects.acreate(loan_amount=10000, loan_term=1, interest_rate=10, loan_year=2022, loan_month=1)
+
+        response = await self.async_client.get(reverse('loans-async-edit', kwargs={'pk': loan.id}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)['id'], loan.id)
+
+
+    def test_loan_summary(self):
+        """Test loan summary fields match the repayment schedule after create, update and bulk create"""
+
+        client = APIClient()
+        loan_data = {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2022, 'loan_month': '01'}
+        pk = client.post(reverse('loans-list'), loan_data).data['pk']
+        bulk_pk = client.post(reverse('loans-bulk'), [{**loan_data, 'loan_term': 30, 'interest_rate': 36}], format='json').data[0]['pk']
+
+        test_cases = (
+            {'pk': pk, 'request': None},
+            {'pk': bulk_pk, 'request': None},
+            {'pk': pk, 'request': lambda: client.put(reverse('loans-detail', kwargs={'pk': pk}), {**loan_data, 'loan_amount': 5000000, 'loan_term': 12})},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                if test_case['request'] is not None:
+                    test_case['request']()
+
+                loan = Loan.objects.get(id=test_case['pk'])
+                repayments = Repayment.objects.filter(loan=loan).order_by('payment_no')
+
+                self.assertEqual(loan.pmt, repayments.first().payment_amount)
+                self.assertEqual(loan.total_interest, sum(repayment.interest for repayment in repayments).quantize(Decimal('0.01')))
+                self.assertEqual(loan.total_payment, sum(repayment.payment_amount for repayment in repayments).quantize(Decimal('0.01')))
+                self.assertEqual(loan.maturity_date, repayments.last().date)
+                # Check if the response reports the same summary
+                response = client.get(reverse('loans-edit', kwargs={'pk': test_case['pk']}))
+                self.assertEqual(response.data['total_interest'], loan.total_interest)
+
+
+    def test_loan_filter_summary(self):
+        """Test filtering and sorting loans on summary fields: GET request"""
+
+        client = APIClient()
+        loan_list = [
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'},
+            {'loan_amount': 250000, 'loan_term': 4, 'interest_rate': 20, 'loan_year': 2022, 'loan_month': '02'},
+            {'loan_amount': 5000000, 'loan_term': 12, 'interest_rate': 20, 'loan_year': 2023, 'loan_month': '02'},
+            {'loan_amount': 40000000, 'loan_term': 30, 'interest_rate': 30, 'loan_year': 2023, 'loan_month': '02'},
+        ]
+        pks = [result['pk'] for result in client.post(reverse('loans-bulk'), loan_list, format='json').data]
+        null_query = {field: 'null' for field in FILTER_DEFAULTS}
+
+        test_cases = (
+            {'query': {'ordering': '-total_interest'}, 'expected_pks': [pks[3], pks[2], pks[1], pks[0]]},
+            {'query': {'ordering': 'maturity_date', 'total_payment_lower': 300000}, 'expected_pks': [pks[1], pks[2], pks[3]]},
+            {'query': {'pmt_upper': 50000, 'maturity_date_lower': '2022-01-01'}, 'expected_pks': [pks[1]]},
+            {'query': {'ordering': 'pmt', 'maturity_date_upper': 'null', 'loan_term_upper': 12}, 'expected_pks': [pks[0], pks[1], pks[2]]},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(f"{reverse('loans-filter')}?{urlencode({**null_query, **test_case['query']})}")
+
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual([loan['id'] for loan in response.data], test_case['expected_pks'])
+                # Check if no repayments are read to filter or sort
+                self.assertFalse(any('repayments' in query['sql'] for query in queries.captured_queries))
+
+        # Check if sorted results are paged in the same order, including ties on the sort field
+        test_cases = (
+            {'query': {'ordering': '-total_interest'}, 'expected_pks': [pks[3], pks[2], pks[1], pks[0]]},
+            {'query': {'ordering': '-interest_rate'}, 'expected_pks': [pks[3], pks[1], pks[2], pks[0]]},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                url = f"{reverse('loans-filter')}?{urlencode({**null_query, **test_case['query'], 'page_size': 1})}"
+                paged_pks = []
+                while url is not None:
+                    response = client.get(url)
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    paged_pks.extend(loan['id'] for loan in response.data['results'])
+                    url = response.data['next']
+
+                self.assertEqual(paged_pks, test_case['expected_pks'])
+
+        test_cases = (
+            {'query': {'ordering': 'payment_no'}, 'expected_response': 'Invalid ordering field'},
+            {'query': {'maturity_date_lower': '2022-13-01'}, 'expected_response': 'month must be in 1..12'},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                response = client.get(f"{reverse('loans-filter')}?{urlencode({**null_query, **test_case['query']})}")
+
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(response.data, test_case['expected_response'])
+
+
+    def test_loan_portfolio_balance(self):
+        """Test total outstanding balance of all loans as of a date: GET request"""
+
+        client = APIClient()
+        loan_list = [
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'},
+            {'loan_amount': 250000, 'loan_term': 4, 'interest_rate': 20, 'loan_year': 2022, 'loan_month': '02'},
+            {'loan_amount': 5000000, 'loan_term': 12, 'interest_rate': 20, 'loan_year': 2023, 'loan_month': '2'},
+            {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2025, 'loan_month': '12'},
+        ]
+        client.post(reverse('loans-bulk'), loan_list, format='json')
+
+        # Outstanding balance worked out from every stored repayment
+        def expected_balance(as_of):
+            total = Decimal(0)
+            loans = 0
+            for loan in Loan.objects.all():
+                repayments = Repayment.objects.filter(loan=loan, date__lte=as_of).order_by('payment_no')
+                if repayments:
+                    balance = repayments.last().balance
+                elif as_of >= date(loan.loan_year, int(loan.loan_month), 1):
+                    balance = loan.loan_amount
+                else:
+                    balance = 0
+                total += balance
+                loans += balance > 0
+            return total.quantize(Decimal('0.01')), loans
+
+        test_cases = ('2019-06-15', '2020-10-01', '2021-09-30', '2021-10-01', '2023-02-20', '2030-01-01', '2080-01-01')
+
+        for test_case in test_cases:
+            for method in ('rows', 'closed_form'):
+                with self.subTest():
+                    response = client.get(f"{reverse('loans-portfolio-balance')}?{urlencode({'as_of': test_case, 'method': method})}")
+                    balance, loans = expected_balance(date.fromisoformat(test_case))
+
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertEqual(response.data['outstanding_loans'], loans)
+                    if method == 'rows':
+                        self.assertEqual(response.data['outstanding_balance'], balance)
+                    else:
+                        # Check if the closed form is within a cent per loan
+                        self.assertLessEqual(abs(response.data['outstanding_balance'] - balance), Decimal('0.01') * len(loan_list))
+
+        test_cases = (
+            {'query': {}, 'storage': 'rows', 'expected_response': 'Missing field'},
+            {'query': {'as_of': '2023-02-30'}, 'storage': 'rows', 'expected_response': 'day is out of range for month'},
+            {'query': {'as_of': '2023-02-01', 'method': 'sum'}, 'storage': 'rows', 'expected_response': 'Method must be closed_form or rows.'},
+            {'query': {'as_of': '2023-02-01', 'method': 'rows'}, 'storage': 'computed', 'expected_response': 'Repayment rows are not stored.'},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                with override_settings(LOAN_SCHEDULE_STORAGE=test_case['storage']):
+                    response = client.get(f"{reverse('loans-portfolio-balance')}?{urlencode(test_case['query'])}")
+
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(response.data, test_case['expected_response'])
+
+
+    def test_loan_portfolio_cash_flow(self):
+        """Test streamed monthly cash flow projection of all loans: GET request"""
+
+        client = APIClient()
+        loan_list = [
+            {'loan_amount': 10000, 'loan_term': 1, 'interest_rate': 10, 'loan_year': 2020, 'loan_month': '10'},
+            {'loan_amount': 250000, 'loan_term': 4, 'interest_rate': 20, 'loan_year': 2022, 'loan_month': '02'},
+            {'loan_amount': 5000000, 'loan_term': 12, 'interest_rate': 20, 'loan_year': 2023, 'loan_month': '2'},
+            {'loan_amount': 100000000, 'loan_term': 50, 'interest_rate': 36, 'loan_year': 2025, 'loan_month': '12'},
+        ]
+        client.post(reverse('loans-bulk'), loan_list, format='json')
+
+        test_cases = (
+            {'start': '2020-09-15', 'months': 18},
+            {'start': '2023-02-01', 'months': 600},
+        )
+
+        for test_case in test_cases:
+            for method in ('rows', 'closed_form'):
+                with self.subTest():
+                    response = client.get(f"{reverse('loans-portfolio-cash-flow')}?{urlencode({**test_case, 'method': method})}")
+                    content = json.loads(b''.join(response.streaming_content), parse_float=Decimal)
+
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertEqual(response['Content-Type'], 'application/json')
+                    self.assertEqual(content['start'], test_case['start'][:8] + '01')
+                    self.assertEqual(len(content['cash flow']), test_case['months'])
+
+                    # Check if every month matches the stored repayments due in it
+                    for month in content['cash flow']:
+                        repayments = Repayment.objects.filter(date=month['date'])
+                        principal = sum((repayment.principal for repayment in repayments), Decimal(0)).quantize(Decimal('0.01'))
+                        interest = sum((repayment.interest for repayment in repayments), Decimal(0)).quantize(Decimal('0.01'))
+
+                        self.assertEqual(month['installments'], len(repayments))
+                        self.assertEqual(month['payment'], month['principal'] + month['interest'])
+                        if method == 'rows':
+                            self.assertEqual((month['principal'], month['interest']), (principal, interest))
+                        else:
+                            # Check if the closed form is within a cent per loan
+                            self.assertLessEqual(abs(month['principal'] - principal), Decimal('0.01') * len(loan_list))
+                            self.assertLessEqual(abs(month['interest'] - interest), Decimal('0.01') * len(loan_list))
+
+        test_cases = (
+            {'query': {'months': 0}, 'storage': 'rows', 'expected_response': 'Months must be within 1 - 600.'},
+            {'query': {'months': 601}, 'storage': 'rows', 'expected_response': 'Months must be within 1 - 600.'},
+            {'query': {'start': '2023-02'}, 'storage': 'rows', 'expected_response': "time data '2023-02' does not match format '%Y-%m-%d'"},
+            {'query': {'method': 'sum'}, 'storage': 'rows', 'expected_response': 'Method must be closed_form or rows.'},
+            {'query': {'method': 'rows'}, 'storage': 'computed', 'expected_response': 'Repayment rows are not stored.'},
+        )
+
+        for test_case in test_cases:
+            with self.subTest():
+                with override_settings(LOAN_SCHEDULE_STORAGE=test_case['storage']):
+                    response = client.get(f"{reverse('loans-portfolio-cash-flow')}?{urlencode(test_case['query'])}")
+
+                self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(response.data, test_case['expected_response'])
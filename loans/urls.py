@@ -1,10 +1,20 @@
 from django.urls import path, include
 from . import views
+from . import async_views
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
 router.register(r'', views.LoanViewSet, 'loans')
 
+# Async read paths, listed before the router so 'async' is not taken as a loan id
+async_urlpatterns = [
+  path('', async_views.LoanListAsyncView.as_view(), name='loans-async-list'),
+  path('filter/', async_views.LoanFilterAsyncView.as_view(), name='loans-async-filter'),
+  path('<int:pk>/', async_views.LoanDetailAsyncView.as_view(), name='loans-async-detail'),
+  path('<int:pk>/edit/', async_views.LoanEditAsyncView.as_view(), name='loans-async-edit'),
+]
+
 urlpatterns = [
+  path('async/', include(async_urlpatterns)),
   path('', include(router.urls))
-]
\ No newline at end of file
+]
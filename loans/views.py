@@ -1,15 +1,34 @@
 from .models import Repayment, Loan
-from django.db import transaction
-from datetime import datetime
-from dateutil import relativedelta
+from django.db import connection, transaction
+from django.db.models import Max
+from django.http import StreamingHttpResponse
+from datetime import date, datetime
+from django.utils import timezone
 from rest_framework.response import Response
 from rest_framework import viewsets
 from rest_framework import status
 from rest_framework.decorators import action
-from .serializers import LoanSerializer, RepaymentSerializer
+from .serializers import LoanSerializer, serialize_repayments
 from django.conf import settings
-from django.utils.timezone import make_aware
-from .helper_functions import calculate_pmt, calculate_repayment
+from .schedule import (
+    cached_schedule,
+    calculate_installment,
+    calculate_installment_row_by_row,
+    computed_repayments,
+    saved_repayments,
+    installment_for_date,
+    stores_packed_schedules,
+    stores_repayment_rows,
+    update_repayments,
+    SUMMARY_FIELDS,
+)
+from .helper_functions import FILTER_DEFAULTS, SUMMARY_FILTERS, filter_loans, validate_loan_fields
+from .export import EXPORT_FORMATS, export_rows, render_export
+from .packed import packed_repayments, packed_schedule
+from .streaming import stream_cash_flow_response, stream_schedule_response
+from .pagination import LoanCursorPagination
+from .portfolio import portfolio_balance, portfolio_cash_flow
+from .filter_cache import cached_filter_results, invalidate_filter_cache
 from decimal import Decimal
 
 class LoanViewSet(viewsets.ModelViewSet):
@@ -18,6 +37,7 @@ class LoanViewSet(viewsets.ModelViewSet):
     settings.TIME_ZONE
     queryset = Loan.objects.all()
     serializer_class = LoanSerializer
+    pagination_class = LoanCursorPagination
 
         
     def create(self, request, *args, **kwargs):
@@ -26,6 +46,7 @@ class LoanViewSet(viewsets.ModelViewSet):
         try:    
             # Use database transaction to group tasks together
             with transaction.atomic():
+                invalidate_filter_cache()
                 
                 if 'loan_amount' in request.data and 'loan_term' in request.data and 'interest_rate' in request.data and 'loan_month' in request.data and 'loan_year' in request.data: 
                     
@@ -47,44 +68,44 @@ class LoanViewSet(viewsets.ModelViewSet):
                     )
 
                     if serializer.is_valid():
+                        # Calculate repayment
+                        if stores_packed_schedules():
+                            # Whole schedule is kept on the loan row instead of in the repayments table
+                            schedule_blob, summary = packed_schedule(loan_amount_decimal, interest_rate_decimal, loan_term_int, loan_month, loan_year)
+                        else:
+                            schedule = cached_schedule(loan_amount_decimal, interest_rate_decimal, loan_term_int, loan_month, loan_year)
+                            schedule_blob, summary = None, schedule.summary()
+
                         new_loan = Loan(
                             loan_amount = loan_amount_decimal, 
                             loan_term = loan_term_int, 
                             interest_rate = interest_rate_decimal, 
                             loan_year = loan_year, 
                             loan_month = loan_month,
+                            schedule_blob = schedule_blob,
+                            **summary,
                             ) 
                         new_loan.save()
 
-                        # Calculate repayment
-                        interest_rate = interest_rate_decimal / 100
-                        pmt = calculate_pmt(loan_amount_decimal, interest_rate, loan_term_int)
-                        no_of_months = loan_term_int * 12
-                        dict = {
-                            'balance': loan_amount_decimal,
-                        }
-
-                        repayment_list = []
-                        for month in range(1, no_of_months + 1):
-                            monthly_repayment = calculate_repayment(interest_rate, pmt, new_loan, loan_month, loan_year, month, dict, no_of_months)
-                            repayment = Repayment(
-                                loan = monthly_repayment['loan'],
-                                payment_no = monthly_repayment['payment_no'],
-                                date =  monthly_repayment['date'],
-                                payment_amount = monthly_repayment['payment_amount'],
-                                principal = monthly_repayment['principal'],
-                                interest = monthly_repayment['interest'],
-                                balance = monthly_repayment['balance']
-                            )
-                            repayment_list.append(repayment)
-
-                        # Store repayment in db
-                        Repayment.objects.bulk_create(repayment_list)
-                        
                         loan_serializer =  LoanSerializer(new_loan).data
                         pk = loan_serializer['id']
-                        repayment_details = Repayment.objects.filter(loan_id__id = pk)
-                        repayments_serializer = RepaymentSerializer(repayment_details , many=True).data
+
+                        if stores_repayment_rows():
+                            repayment_list = schedule.to_repayments(new_loan)
+
+                            # Store repayment in db
+                            Repayment.objects.bulk_create(repayment_list)
+                            repayment_details = saved_repayments(repayment_list, pk)
+                        elif stores_packed_schedules():
+                            repayment_details = packed_repayments(new_loan)
+                        else:
+                            # Schedule is recalculated on read instead of being stored
+                            repayment_details = computed_repayments(new_loan)
+
+                        if settings.LOAN_STREAMING_RESPONSES:
+                            return stream_schedule_response({'pk': pk, 'loan': loan_serializer}, repayment_details)
+
+                        repayments_serializer = serialize_repayments(repayment_details)
 
                         data = {
                             'pk': pk,
@@ -108,10 +129,24 @@ class LoanViewSet(viewsets.ModelViewSet):
 
         try: 
             pk = kwargs['pk']
-            loan_details = Loan.objects.get(id=pk)
+            if stores_packed_schedules():
+                # Read the packed schedule along with the loan instead of in a second query
+                loan_details = Loan.objects.defer(None).get(id=pk)
+            else:
+                loan_details = Loan.objects.get(id=pk)
             loan_serializer =  LoanSerializer(loan_details).data
-            repayment_details = Repayment.objects.filter(loan_id__id = pk)
-            repayments_serializer = RepaymentSerializer(repayment_details , many=True).data
+
+            if stores_repayment_rows():
+                repayment_details = Repayment.objects.filter(loan_id__id = pk).order_by('payment_no')
+            elif stores_packed_schedules():
+                repayment_details = packed_repayments(loan_details)
+            else:
+                repayment_details = computed_repayments(loan_details)
+
+            if settings.LOAN_STREAMING_RESPONSES:
+                return stream_schedule_response({'loan': loan_serializer}, repayment_details)
+
+            repayments_serializer = serialize_repayments(repayment_details)
 
             obj = {
             'loan': loan_serializer,
@@ -131,12 +166,18 @@ class LoanViewSet(viewsets.ModelViewSet):
         try:
             # Use database transaction to group tasks together
             with transaction.atomic():
+                invalidate_filter_cache()
                 pk = kwargs['pk']
-                repayment_list = Repayment.objects.filter(loan_id__id = pk)
-                repayment_list.delete()
 
-                loan_listing = Loan.objects.get(id=pk)
-                loan_listing.delete()
+                # Repayments are removed along with the loan by the cascading foreign key
+                deleted_count, deleted_per_model = Loan.objects.filter(id=pk).delete()
+                if not deleted_per_model.get(Loan._meta.label):
+                    raise Exception('Loan matching query does not exist.')
+
+                if settings.LOAN_DESTROY_RESPONSE == 'empty':
+                    return Response(status=status.HTTP_204_NO_CONTENT)
+                if settings.LOAN_DESTROY_RESPONSE == 'id':
+                    return Response({'pk': int(pk)})
 
                 # Retrieve updated list
                 loan_list = Loan.objects.all()
@@ -156,6 +197,7 @@ class LoanViewSet(viewsets.ModelViewSet):
             if 'loan_amount' in request.data and 'loan_term' in request.data and 'interest_rate' in request.data and 'loan_month' in request.data and 'loan_year' in request.data: 
                 # Use database transaction to group tasks together
                 with transaction.atomic():
+                    invalidate_filter_cache()
                     pk = kwargs['pk']
 
                     # Retrieve and update loan info
@@ -177,50 +219,46 @@ class LoanViewSet(viewsets.ModelViewSet):
 
                     if serializer.is_valid():
 
-                        # Remove previous repayment entries from db
-                        repayment_list = Repayment.objects.filter(loan_id__id = pk)
-                        repayment_list.delete()
-
-
-                        Loan.objects.filter(id=pk).update(
-                            loan_amount = loan_amount_decimal, 
-                            loan_term = loan_term_int, 
-                            interest_rate = interest_rate_decimal, 
-                            loan_year = loan_year, 
-                            loan_month = loan_month,
-                            updated_at = make_aware(datetime.now())
-                            )
+                        # Calculate repayment, packed schedules are cleared in the other storage modes so they never go stale
+                        if stores_packed_schedules():
+                            schedule_blob, summary = packed_schedule(loan_amount_decimal, interest_rate_decimal, loan_term_int, loan_month, loan_year)
+                        else:
+                            schedule = cached_schedule(loan_amount_decimal, interest_rate_decimal, loan_term_int, loan_month, loan_year)
+                            schedule_blob, summary = None, schedule.summary()
 
+                        # Update loan in place so the response can be built without reading it back
                         loan_details = Loan.objects.get(id=pk)
+                        loan_details.loan_amount = loan_amount_decimal
+                        loan_details.loan_term = loan_term_int
+                        loan_details.interest_rate = interest_rate_decimal
+                        loan_details.loan_year = loan_year
+                        loan_details.loan_month = loan_month
+                        for field, value in summary.items():
+                            setattr(loan_details, field, value)
+                        loan_details.schedule_blob = schedule_blob
+                        loan_details.save(update_fields=['loan_amount', 'loan_term', 'interest_rate', 'loan_year', 'loan_month', *SUMMARY_FIELDS, 'schedule_blob', 'updated_at'])
 
-                      # Calculate repayment
-                        interest_rate = interest_rate_decimal / 100
-                        pmt = calculate_pmt(loan_amount_decimal, interest_rate, loan_term_int)
-                        no_of_months = loan_term_int * 12
-                        dict = {
-                            'balance': loan_amount_decimal,
-                        }
-
-                        repayment_list = []
-                        for month in range(1, no_of_months + 1):
-                            monthly_repayment = calculate_repayment(interest_rate, pmt, loan_details, loan_month, loan_year, month, dict, no_of_months)
-                            repayment = Repayment(
-                                loan = monthly_repayment['loan'],
-                                payment_no = monthly_repayment['payment_no'],
-                                date =  monthly_repayment['date'],
-                                payment_amount = monthly_repayment['payment_amount'],
-                                principal = monthly_repayment['principal'],
-                                interest = monthly_repayment['interest'],
-                                balance = monthly_repayment['balance']
-                            )
-                            repayment_list.append(repayment)
-
-                        # Store repayment in db
-                        Repayment.objects.bulk_create(repayment_list)
                         loan_serializer =  LoanSerializer(loan_details).data
                         pk = loan_serializer['id']
-                        repayment_details = Repayment.objects.filter(loan_id__id = pk)
-                        repayments_serializer = RepaymentSerializer(repayment_details , many=True).data
+
+                        if stores_repayment_rows():
+                            # Write only the repayment entries that changed
+                            repayment_list = update_repayments(loan_details, schedule)
+                            repayment_details = saved_repayments(repayment_list, pk)
+                        else:
+                            # Remove any previous repayment entries from db
+                            Repayment.objects.filter(loan_id__id = pk).delete()
+
+                            if stores_packed_schedules():
+                                repayment_details = packed_repayments(loan_details)
+                            else:
+                                # Schedule is recalculated on read instead of being stored
+                                repayment_details = computed_repayments(loan_details)
+
+                        if settings.LOAN_STREAMING_RESPONSES:
+                            return stream_schedule_response({'pk': pk, 'loan': loan_serializer}, repayment_details)
+
+                        repayments_serializer = serialize_repayments(repayment_details)
 
                         data = {
                             'pk': pk,
@@ -238,6 +276,113 @@ class LoanViewSet(viewsets.ModelViewSet):
             return Response(str(err), status=status.HTTP_404_NOT_FOUND)
 
 
+    @action(detail=False, methods=['POST'])
+    def bulk(self, request, *args, **kwargs):
+        """Add a list of new loans and their repayment details to db in one transaction"""
+
+        try:
+            if not isinstance(request.data, list):
+                raise Exception('Expected a list of loans')
+
+            batch_size = int(request.GET.get('batch_size', settings.LOAN_BULK_BATCH_SIZE))
+            if batch_size < 1:
+                raise Exception('Batch size must be at least 1.')
+
+            # Validate every loan before writing anything
+            results = []
+            new_loans = []
+            schedules = []
+            for index, loan_data in enumerate(request.data):
+                try:
+                    loan_fields = validate_loan_fields(loan_data)
+                    if stores_packed_schedules():
+                        schedule = None
+                        schedule_blob, summary = packed_schedule(**loan_fields)
+                    else:
+                        schedule = cached_schedule(**loan_fields)
+                        schedule_blob, summary = None, schedule.summary()
+                    new_loan = Loan(**loan_fields, **summary, schedule_blob=schedule_blob)
+                    new_loans.append(new_loan)
+                    schedules.append(schedule)
+                    results.append({'index': index})
+                except Exception as err:
+                    results.append({'index': index, 'error': str(err)})
+
+            # Use database transaction to group tasks together
+            with transaction.atomic():
+                invalidate_filter_cache()
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Loan.objects.bulk_create(new_loans, batch_size=batch_size)
+                else:
+                    # Backends such as MySQL do not return ids from a bulk insert. Ids only grow, so the new
+                    # loans are among those above the last id before the insert, in insertion order. Loans
+                    # committed by other requests in between are skipped by their creation time, which
+                    # bulk_create sets to the microsecond for each loan.
+                    last_id = Loan.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+                    Loan.objects.bulk_create(new_loans, batch_size=batch_size)
+                    unmatched_loans = iter(new_loans)
+                    new_loan = next(unmatched_loans, None)
+                    for loan_id, created_at in Loan.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'created_at'):
+                        if new_loan is None:
+                            break
+                        if created_at == new_loan.created_at:
+                            new_loan.id = loan_id
+                            new_loan = next(unmatched_loans, None)
+                    if new_loan is not None:
+                        raise Exception('Could not read back the ids of the new loans.')
+
+                if stores_repayment_rows():
+                    # Store repayments in chunks to bound memory use
+                    repayment_list = []
+                    for new_loan, schedule in zip(new_loans, schedules):
+                        repayment_list.extend(schedule.to_repayments(new_loan))
+                        if len(repayment_list) >= batch_size:
+                            Repayment.objects.bulk_create(repayment_list, batch_size=batch_size)
+                            repayment_list = []
+                    Repayment.objects.bulk_create(repayment_list, batch_size=batch_size)
+
+            saved_loans = iter(new_loans)
+            for result in results:
+                if 'error' not in result:
+                    result['pk'] = next(saved_loans).id
+
+            return Response(results)
+
+        except Exception as err:
+            print(str(err))
+            return Response(str(err), status=status.HTTP_404_NOT_FOUND)
+
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request, *args, **kwargs):
+        """Remove a list of loans and their repayment details from db in one transaction"""
+
+        try:
+            if not isinstance(request.data, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in request.data):
+                raise Exception('Expected a list of loan ids')
+
+            batch_size = int(request.GET.get('batch_size', settings.LOAN_BULK_BATCH_SIZE))
+            if batch_size < 1:
+                raise Exception('Batch size must be at least 1.')
+
+            # Each batch of ids costs one select of loans and one delete each for repayments and loans
+            loan_ids = sorted(set(request.data))
+            deleted_loans = 0
+            deleted_repayments = 0
+            with transaction.atomic():
+                invalidate_filter_cache()
+                for start in range(0, len(loan_ids), batch_size):
+                    deleted_count, deleted_per_model = Loan.objects.filter(id__in=loan_ids[start:start + batch_size]).delete()
+                    deleted_loans += deleted_per_model.get(Loan._meta.label, 0)
+                    deleted_repayments += deleted_per_model.get(Repayment._meta.label, 0)
+
+            return Response({'deleted': deleted_loans, 'deleted repayments': deleted_repayments})
+
+        except Exception as err:
+            print(str(err))
+            return Response(str(err), status=status.HTTP_404_NOT_FOUND)
+
+
     @action(detail=True, methods=['GET'])
     def edit(self, request, *args, **kwargs):
         """Retrieve loan data to fill form for loan editing"""
@@ -253,58 +398,137 @@ class LoanViewSet(viewsets.ModelViewSet):
             return Response(str(err), status=status.HTTP_404_NOT_FOUND)
 
 
+    @action(detail=True, methods=['GET'])
+    def installment(self, request, *args, **kwargs):
+        """Retrieve a single installment of a loan by installment number (n) or by date"""
+
+        try:
+            pk = kwargs['pk']
+            loan_details = Loan.objects.get(id=pk)
+
+            if 'n' in request.GET:
+                payment_no = int(request.GET['n'])
+            elif 'date' in request.GET:
+                on_date = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+                payment_no = installment_for_date(loan_details.loan_month, loan_details.loan_year, loan_details.loan_term, on_date)
+            else:
+                raise Exception('Missing field')
+
+            loan_params = (
+                loan_details.loan_amount,
+                loan_details.interest_rate,
+                loan_details.loan_term,
+                loan_details.loan_month,
+                loan_details.loan_year,
+            )
+            installment = {'loan': loan_details.id}
+            installment.update(calculate_installment(*loan_params, payment_no))
+
+            # Compare against the month by month calculation when requested
+            if request.GET.get('verify') == 'true':
+                row_by_row = calculate_installment_row_by_row(*loan_params, payment_no)
+                installment['verification'] = {
+                    'matches': all(installment[key] == row_by_row[key] for key in row_by_row),
+                    'balance_difference': installment['balance'] - row_by_row['balance'],
+                    'row_by_row': row_by_row,
+                }
+
+            return Response(installment)
+
+        except Exception as err:
+            print(str(err))
+            return Response(str(err), status=status.HTTP_404_NOT_FOUND)
+
+
+    @action(detail=False, methods=['GET'], url_path='portfolio/balance')
+    def portfolio_balance(self, request, *args, **kwargs):
+        """Retrieve the total outstanding balance of all loans as of a date"""
+
+        try:
+            if 'as_of' not in request.GET:
+                raise Exception('Missing field')
+            as_of = datetime.strptime(request.GET['as_of'], '%Y-%m-%d').date()
+
+            # Stored repayments give the exact figure, otherwise use the closed form over loan fields
+            method = request.GET.get('method', 'rows' if stores_repayment_rows() else 'closed_form')
+            if method == 'rows' and not stores_repayment_rows():
+                raise Exception('Repayment rows are not stored.')
+
+            outstanding_balance, outstanding_loans = portfolio_balance(as_of, method)
+
+            return Response({
+                'as_of': as_of,
+                'method': method,
+                'outstanding_balance': outstanding_balance,
+                'outstanding_loans': outstanding_loans,
+            })
+
+        except Exception as err:
+            print(str(err))
+            return Response(str(err), status=status.HTTP_404_NOT_FOUND)
+
+
+    @action(detail=False, methods=['GET'], url_path='portfolio/cash-flow')
+    def portfolio_cash_flow(self, request, *args, **kwargs):
+        """Stream the expected monthly principal and interest payments of all loans for a number of months"""
+
+        try:
+            # Projection starts from the month of the given date, or next month by default
+            if 'start' in request.GET:
+                first_date = datetime.strptime(request.GET['start'], '%Y-%m-%d').date()
+            else:
+                today = timezone.now().date()
+                first_date = date(today.year + today.month // 12, today.month % 12 + 1, 1)
+            no_of_months = int(request.GET.get('months', 12))
+
+            # Stored repayments give exact totals, otherwise use the closed form over loan fields
+            method = request.GET.get('method', 'rows' if stores_repayment_rows() else 'closed_form')
+            if method == 'rows' and not stores_repayment_rows():
+                raise Exception('Repayment rows are not stored.')
+
+            months = portfolio_cash_flow(first_date, no_of_months, method)
+            return stream_cash_flow_response({'start': first_date.replace(day=1), 'months': no_of_months, 'method': method}, months)
+
+        except Exception as err:
+            print(str(err))
+            return Response(str(err), status=status.HTTP_404_NOT_FOUND)
+
+
     @action(detail=False, methods=['GET'])
     def filter(self, request, *args, **kwargs):
         """Filter loans"""
 
         try:
 
-            if 'loan_amount_lower' in request.GET and 'loan_amount_upper' in request.GET and 'loan_term_lower' in request.GET and 'loan_term_upper' in request.GET and 'interest_rate_lower' in request.GET and 'interest_rate_upper' in request.GET: 
+            filtered_list = filter_loans(request.GET)
 
-                if request.GET['loan_amount_lower'] == 'null':
-                    loan_amount_lower = 1000 
-                else:
-                    loan_amount_lower = int(request.GET['loan_amount_lower'])
+            page = self.paginate_queryset(filtered_list)
+            if page is not None:
+                return self.get_paginated_response(LoanSerializer(page, many=True).data)
 
-                if request.GET['loan_amount_upper'] == 'null':
-                    loan_amount_upper = 100000000 
-                else:
-                    loan_amount_upper = int(request.GET['loan_amount_upper'])
+            return Response(cached_filter_results(request.GET))
 
-                if request.GET['loan_term_lower'] == 'null':
-                    loan_term_lower = 1 
-                else:
-                    loan_term_lower = int(request.GET['loan_term_lower'])
+        except Exception as err:
+            print(str(err))
+            return Response(str(err), status=status.HTTP_404_NOT_FOUND)
 
-                if request.GET['loan_term_upper'] == 'null':
-                    loan_term_upper = 50 
-                else:
-                    loan_term_upper = int(request.GET['loan_term_upper'])
 
-                if request.GET['interest_rate_lower'] == 'null':
-                    interest_rate_lower = 1.0
-                else:
-                    interest_rate_lower = Decimal(request.GET['interest_rate_lower'])
+    @action(detail=False, methods=['GET'])
+    def export(self, request, *args, **kwargs):
+        """Stream every repayment of the filtered loans as CSV or NDJSON"""
 
-                if request.GET['interest_rate_upper'] == 'null':
-                    interest_rate_upper = 36.0
-                else:
-                    interest_rate_upper = Decimal(request.GET['interest_rate_upper'])
-
-                filtered_list = Loan.objects.filter(
-                    loan_amount__gte=loan_amount_lower, 
-                    loan_amount__lte=loan_amount_upper, 
-                    loan_term__gte=loan_term_lower, 
-                    loan_term__lte=loan_term_upper, 
-                    interest_rate__gte=interest_rate_lower, 
-                    interest_rate__lte=interest_rate_upper, 
-                    )
+        try:
+            export_format = request.GET.get('export_format', 'csv')
+            if export_format not in EXPORT_FORMATS:
+                raise Exception('Export format must be csv or ndjson.')
 
-                filtered_loans_serializer =  LoanSerializer(filtered_list, many=True).data
-                return Response(filtered_loans_serializer)
+            # Filter fields are optional here, missing fields are treated as 'null'
+            params = {field: request.GET.get(field, 'null') for field in (*FILTER_DEFAULTS, *SUMMARY_FILTERS)}
+            loans = filter_loans(params)
 
-            else:
-                raise Exception('Missing field')
+            response = StreamingHttpResponse(render_export(export_rows(loans), export_format), content_type=EXPORT_FORMATS[export_format])
+            response['Content-Disposition'] = f'attachment; filename="loans.{export_format}"'
+            return response
 
         except Exception as err:
             print(str(err))